@@ -1,9 +1,12 @@
-import psutil
-import time
+import os
 import argparse
-import csv
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from perf_common.alerts import add_alert_arguments, alert_options, threshold_alerts
+from perf_common.bandwidth_sampler import BandwidthSampler
+from perf_common.log_sink import LogSink, add_log_arguments, log_options
+
 
 def parse_arguments():
     """
@@ -21,7 +24,7 @@ def parse_arguments():
         "-i", "--interval",
         type=float,
         default=1.0,
-        help="Time interval in seconds between usage checks (default: 1.0)"
+        help="Time interval in seconds between usage checks, down to 0.01 (default: 1.0)"
     )
     parser.add_argument(
         "-n", "--interface",
@@ -34,7 +37,7 @@ def parse_arguments():
         "-t", "--threshold",
         type=float,
         default=None,
-        help="Threshold in MB above which usage during an interval triggers a warning."
+        help="Upload or download speed in MB/s above which a warning is printed."
     )
     parser.add_argument(
         "-o", "--csv-output",
@@ -42,86 +45,50 @@ def parse_arguments():
         default=None,
         help="Path to a CSV file where usage data will be logged."
     )
+    add_alert_arguments(parser, "MB/s")
+    add_log_arguments(parser)
     return parser.parse_args()
 
 
-def get_bandwidth_usage(interval, interface=None):
-    """
-    Measure network bandwidth usage over a given interval.
-
-    Parameters
-    ----------
-    interval : float
-        Time interval in seconds between checks.
-    interface : str, optional
-        Specific network interface to monitor.
-
-    Returns
-    -------
-    tuple
-        Upload speed (KB/s), download speed (KB/s)
-    """
-    if interface:
-        net_io_before = psutil.net_io_counters(pernic=True).get(interface)
-    else:
-        net_io_before = psutil.net_io_counters()
-    
-    time.sleep(interval)
-
-    if interface:
-        net_io_after = psutil.net_io_counters(pernic=True).get(interface)
-    else:
-        net_io_after = psutil.net_io_counters()
-    
-    if not net_io_before or not net_io_after:
-        print(f"Error: Interface '{interface}' not found.")
-        sys.exit(1)
-    
-    sent_bytes = net_io_after.bytes_sent - net_io_before.bytes_sent
-    received_bytes = net_io_after.bytes_recv - net_io_before.bytes_recv
-    
-    sent_speed = sent_bytes / interval / 1024  # Convert to KB/s
-    received_speed = received_bytes / interval / 1024  # Convert to KB/s
-
-    return sent_speed, received_speed
-
-
-def log_to_csv(csv_path, upload_speed, download_speed):
-    """
-    Log bandwidth usage data to a CSV file.
-
-    Parameters
-    ----------
-    csv_path : str
-        Path to the CSV file.
-    upload_speed : float
-        Upload speed in KB/s.
-    download_speed : float
-        Download speed in KB/s.
-    """
-    with open(csv_path, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([time.strftime('%Y-%m-%d %H:%M:%S'), upload_speed, download_speed])
-
-
 def main():
     args = parse_arguments()
+    try:
+        sampler = BandwidthSampler(args.interval, args.interface)
+        alerts = threshold_alerts(args.threshold or None,
+                                  [("Upload speed", lambda s: s.upload_rate / (1024 * 1024)),
+                                   ("Download speed", lambda s: s.download_rate / (1024 * 1024))],
+                                  "MB/s", **alert_options(args))
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    samples = sampler.subscribe_queue()
+    sampler.subscribe(alerts.process)
+    log = None
+    if args.csv_output:
+        # Rows are timestamp, upload KB/s, download KB/s; the CSV has no header row
+        log = LogSink(args.csv_output, ["UploadKBps", "DownloadKBps"], csv_header=False, **log_options(args))
     print("Starting network bandwidth monitoring. Press Ctrl+C to stop.")
-    
+
     try:
-        while True:
-            upload_speed, download_speed = get_bandwidth_usage(args.interval, args.interface)
-            print(f"Upload Speed: {upload_speed:.2f} KB/s, Download Speed: {download_speed:.2f} KB/s")
-            
-            if args.threshold and (upload_speed / 1024 > args.threshold or download_speed / 1024 > args.threshold):
-                print("Warning: Bandwidth usage exceeded threshold!")
-            
-            if args.csv_output:
-                log_to_csv(args.csv_output, upload_speed, download_speed)
+        with alerts, sampler:
+            while True:
+                sample = samples.get()
+                if sample is None:
+                    print(f"Error: {sampler.error}")
+                    sys.exit(1)
+                upload_speed = sample.upload_rate / 1024  # KB/s
+                download_speed = sample.download_rate / 1024
+                print(f"Upload Speed: {upload_speed:.2f} KB/s, Download Speed: {download_speed:.2f} KB/s")
+
+                if log:
+                    log.write(sample.timestamp, (upload_speed, download_speed))
 
     except KeyboardInterrupt:
         print("\nMonitoring stopped.")
         sys.exit(0)
+    finally:
+        if log:
+            log.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,304 @@
+import argparse
+import os
+import sys
+import time
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from perf_common.log_sink import LogSink, add_log_arguments, log_options
+from perf_common.net_counters import list_interfaces, open_counter_reader, open_interfaces_reader, select_interfaces
+from perf_common.scheduler import MIN_INTERVAL, Scheduler, format_stats
+from perf_common.timing import clock
+
+MB = 1024 * 1024
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments and return them.
+
+    Returns
+    -------
+    argparse.Namespace
+        Parsed arguments including interval, output, include, exclude, gpu, no_gpu and the log options.
+    """
+    parser = argparse.ArgumentParser(
+        description="Record network bandwidth, NVIDIA encoder/decoder utilization and CPU/memory usage "
+                    "into one time series."
+    )
+    parser.add_argument(
+        "-i", "--interval",
+        type=float,
+        default=0.1,
+        help=f"Seconds between samples, down to {MIN_INTERVAL} (100 Hz) (default: 0.1)"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        required=True,
+        help="Output file; one row per sample with a column per metric."
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="GLOB",
+        help="Record the interfaces matching this glob separately (repeatable). "
+             "By default the total over all interfaces is recorded."
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        metavar="GLOB",
+        help="Leave out interfaces matching this glob (repeatable); implies --include '*'."
+    )
+    parser.add_argument(
+        "--gpu",
+        type=int,
+        default=0,
+        help="Index of the NVIDIA GPU to record (default: 0)"
+    )
+    parser.add_argument(
+        "--no-gpu",
+        action="store_true",
+        help="Do not record GPU metrics."
+    )
+    parser.add_argument(
+        "--status-interval",
+        type=float,
+        default=1.0,
+        help="Seconds between status lines on the console (default: 1.0)"
+    )
+    add_log_arguments(parser)
+    return parser.parse_args()
+
+
+class NetworkProbe:
+    """Upload/download rates in MB/s, in total or per interface."""
+
+    def __init__(self, interfaces=None):
+        self.interfaces = interfaces
+        if interfaces:
+            self.columns = []
+            for name in interfaces:
+                self.columns += [f"{name} UpMBps", f"{name} DownMBps"]
+            self._reader = open_interfaces_reader(interfaces)
+        else:
+            self.columns = ["UpMBps", "DownMBps"]
+            self._reader = open_counter_reader()
+        self._counters = None
+
+    def _read(self):
+        if self.interfaces:
+            self._reader.read_all()
+            return self._reader.sent.tolist() + self._reader.recv.tolist()
+        return list(self._reader.read())
+
+    def start(self):
+        self._counters = self._read()
+
+    def read(self, elapsed):
+        counters = self._read()
+        # Counters can go backwards when an interface is reset; count that interval as idle
+        rates = [max(0, new - old) / elapsed / MB for old, new in zip(self._counters, counters)]
+        self._counters = counters
+        half = len(rates) // 2
+        values = []
+        for sent, received in zip(rates[:half], rates[half:]):
+            values += [sent, received]
+        return values
+
+    def close(self):
+        self._reader.close()
+
+
+class CpuMemoryProbe:
+    """System-wide CPU and memory utilization in percent."""
+
+    columns = ["CPUPercent", "MemoryPercent"]
+
+    def start(self):
+        psutil.cpu_percent(interval=None)  # the first call only sets the reference point
+
+    def read(self, elapsed):
+        return [psutil.cpu_percent(interval=None), psutil.virtual_memory().percent]
+
+    def close(self):
+        pass
+
+
+class GpuProbe:
+    """
+    NVENC/NVDEC and overall utilization of one NVIDIA GPU in percent, through NVML.
+
+    NVML averages utilization over its own sampling period (about 0.17-1 s
+    depending on the driver), so at high sample rates consecutive rows repeat
+    the same value until the driver updates it. A failed read records NaN.
+    """
+
+    columns = ["EncoderPercent", "DecoderPercent", "GPUPercent"]
+
+    def __init__(self, index=0):
+        try:
+            import pynvml
+        except ImportError:
+            raise ValueError("pynvml is not installed (pip install nvidia-ml-py).") from None
+        self._nvml = pynvml
+        try:
+            pynvml.nvmlInit()
+        except pynvml.NVMLError as e:
+            raise ValueError(f"NVML is not available: {e}") from None
+        try:
+            self._handle = pynvml.nvmlDeviceGetHandleByIndex(index)
+        except pynvml.NVMLError as e:
+            pynvml.nvmlShutdown()
+            raise ValueError(f"GPU {index} is not available: {e}") from None
+
+    def start(self):
+        pass
+
+    def read(self, elapsed):
+        nvml = self._nvml
+        try:
+            encoder, _ = nvml.nvmlDeviceGetEncoderUtilization(self._handle)
+            decoder, _ = nvml.nvmlDeviceGetDecoderUtilization(self._handle)
+            gpu = nvml.nvmlDeviceGetUtilizationRates(self._handle).gpu
+        except nvml.NVMLError:
+            return [float("nan")] * len(self.columns)
+        return [encoder, decoder, gpu]
+
+    def close(self):
+        self._nvml.nvmlShutdown()
+
+
+class Recorder:
+    """
+    Reads every probe in one scheduler tick and writes one row per tick.
+
+    All values of a row are read back to back and share one timestamp. The
+    timestamps come from the monotonic clock, anchored to the wall clock
+    once at start, so they stay evenly spaced even if the system clock is
+    adjusted during the recording.
+    """
+
+    def __init__(self, probes, sink):
+        self.probes = probes
+        self.sink = sink
+        self.columns = [column for probe in probes for column in probe.columns]
+        self.latest = None
+        self._last = None
+        self._wall_origin = None
+        self._clock_origin = None
+
+    def start(self):
+        for probe in self.probes:
+            probe.start()
+        self._last = self._clock_origin = clock()
+        self._wall_origin = time.time()
+
+    def tick(self):
+        now = clock()
+        elapsed = now - self._last
+        self._last = now
+        if elapsed <= 0:
+            return
+        values = []
+        for probe in self.probes:
+            values += probe.read(elapsed)
+        timestamp = self._wall_origin + (now - self._clock_origin)
+        self.sink.write(timestamp, values)
+        self.latest = (timestamp, values)
+
+    def status(self):
+        """Print the latest row."""
+        if self.latest is None:
+            return
+        timestamp, values = self.latest
+        fields = " | ".join(f"{column}: {value:.2f}" for column, value in zip(self.columns, values))
+        print(f"[{time.strftime('%H:%M:%S', time.localtime(timestamp))}] {fields}")
+
+    def close(self):
+        for probe in self.probes:
+            probe.close()
+
+
+def record(output, interval=0.1, interfaces=None, gpu=0, status_interval=1.0, log_settings=None):
+    """
+    Record all metrics into output until interrupted.
+
+    Parameters
+    ----------
+    output : str
+        Output file path.
+    interval : float
+        Seconds between samples.
+    interfaces : list of str, optional
+        Interfaces to record separately; None records the total.
+    gpu : int, optional
+        NVIDIA GPU index; None leaves out the GPU metrics.
+    status_interval : float
+        Seconds between status lines.
+    log_settings : dict, optional
+        Extra LogSink options (format, flushing, rotation).
+    """
+    probes = [NetworkProbe(interfaces), CpuMemoryProbe()]
+    if gpu is not None:
+        try:
+            probes.append(GpuProbe(gpu))
+        except ValueError as e:
+            print(f"GPU metrics disabled: {e}")
+    columns = [column for probe in probes for column in probe.columns]
+    sink = LogSink(output, columns, precision=3, timestamp_digits=3, **(log_settings or {}))
+    recorder = Recorder(probes, sink)
+    scheduler = Scheduler(name="recorder")
+
+    print(f"\nRecording {', '.join(columns)} every {interval} second(s) to {output}. Press Ctrl+C to stop.\n")
+
+    recorder.start()
+    job = scheduler.add(recorder.tick, interval, name="record")
+    scheduler.add(recorder.status, status_interval, name="status")
+    scheduler.start()
+    try:
+        while job.error is None:
+            time.sleep(0.5)
+        print(f"Error: {job.error}")
+    except KeyboardInterrupt:
+        print("\nRecording stopped by user.")
+    finally:
+        scheduler.stop()
+        sink.close()
+        recorder.close()
+
+    print(f"\nWrote {sink.rows} rows to {output}")
+    print(f"Sampling: {format_stats(job.stats())}")
+
+
+def main():
+    """
+    Main entry point for running the recorder with CLI arguments.
+    """
+    args = parse_arguments()
+
+    try:
+        interfaces = None
+        if args.include or args.exclude:
+            interfaces = select_interfaces(args.include, args.exclude)
+            if not interfaces:
+                raise ValueError(f"No interface matches. Available: {', '.join(list_interfaces())}")
+        if args.interval < MIN_INTERVAL:
+            raise ValueError(f"Interval must be at least {MIN_INTERVAL} s.")
+        record(
+            args.output,
+            interval=args.interval,
+            interfaces=interfaces,
+            gpu=None if args.no_gpu else args.gpu,
+            status_interval=args.status_interval,
+            log_settings=log_options(args)
+        )
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
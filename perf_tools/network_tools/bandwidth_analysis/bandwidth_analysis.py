@@ -0,0 +1,533 @@
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from perf_common.log_sink import BINARY_MAGIC, read_log
+
+# CSVs are parsed in blocks of this many bytes, so memory use does not grow with the file
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# Rows of memory-mapped bin logs per block
+CHUNK_ROWS = 4 * 1024 * 1024
+
+# With whole-second timestamps the span of a log is only known to +-1 s; below this many seconds
+# that is more than 1% off, too much to derive the sampling interval from it
+MIN_DERIVED_SPAN = 100
+
+# Rate histogram: 64 buckets per power of two (<1.1% error) from 2^-30 to 2^30 MB/s
+SUB_BUCKETS = 64
+MIN_EXPONENT = -30
+MAX_EXPONENT = 30
+
+UNITS = {"B/s": 1.0 / (1024 * 1024), "KB/s": 1.0 / 1024, "MB/s": 1.0}
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_arguments():
+    """
+    Parse command-line arguments and return them.
+
+    Returns
+    -------
+    argparse.Namespace
+        Parsed arguments including files, unit, interval, idle, burst, resample and output.
+    """
+    parser = argparse.ArgumentParser(
+        description="Summarize recorded bandwidth logs: throughput percentiles, idle time, bursts and resampling."
+    )
+    parser.add_argument(
+        "files",
+        nargs="+",
+        help="CSV or bin logs written by bandwidth_tool.py, bandwidth_usage.py, the bandwidth GUIs or "
+             "metrics_recorder.py. "
+             "Glob patterns such as 'logs/*.csv' are expanded."
+    )
+    parser.add_argument(
+        "--unit",
+        choices=list(UNITS),
+        default="KB/s",
+        help="Unit of CSVs without a header row: KB/s for bandwidth_tool.py and the tk GUI, "
+             "MB/s for the PyQt5 GUI (default: KB/s)"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=None,
+        help="Sampling interval in seconds of logs with MB-per-interval columns (bandwidth_usage.py). "
+             "By default it is derived from the timestamps."
+    )
+    parser.add_argument(
+        "--idle",
+        type=float,
+        default=0.0,
+        help="Rate in MB/s at or below which a sample counts as idle (default: 0)"
+    )
+    parser.add_argument(
+        "--burst",
+        type=float,
+        default=1.0,
+        help="Rate in MB/s above which consecutive samples form a burst (default: 1.0)"
+    )
+    parser.add_argument(
+        "--burst-min",
+        type=int,
+        default=1,
+        help="Minimum number of consecutive samples for a burst (default: 1)"
+    )
+    parser.add_argument(
+        "--resample",
+        type=str,
+        default=None,
+        help="Write average and peak rates per period (e.g. 10s, 1m, 1h) of all files to --output."
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=str,
+        default=None,
+        help="CSV file for the --resample output."
+    )
+    return parser.parse_args()
+
+
+def parse_period(text):
+    """'10s', '5m', '1h' or a number of seconds -> seconds."""
+    try:
+        if text[-1] in PERIODS:
+            return float(text[:-1]) * PERIODS[text[-1]]
+        return float(text)
+    except (ValueError, IndexError):
+        raise ValueError(f"Invalid period '{text}', expected e.g. 10s, 1m or 1h.") from None
+
+
+class Series:
+    """
+    How to turn one log column into a rate in MB/s.
+
+    scale multiplies the column; columns holding MB per interval (per_interval)
+    are additionally divided by the sampling interval.
+    """
+
+    def __init__(self, name, column, scale=1.0, per_interval=False):
+        self.name = name
+        self.column = column
+        self.scale = scale
+        self.per_interval = per_interval
+
+
+def _series_from_header(names):
+    """Rate series for the named columns of a CSV or bin log (timestamp column excluded)."""
+    series = []
+    for column, name in enumerate(names):
+        if name.startswith("Total"):
+            continue  # running totals are derived data
+        for suffix, scale, per_interval in (("KBps", 1.0 / 1024, False), ("MBps", 1.0, False), ("MB", 1.0, True)):
+            if name.endswith(suffix):
+                label = name[:-len(suffix)].strip()
+                if label.startswith("Interval"):
+                    label = label[len("Interval"):]
+                series.append(Series(label or name, column, scale, per_interval))
+                break
+    return series
+
+
+class LogFile:
+    """
+    A recorded log, read in blocks of (timestamps, values) NumPy arrays.
+
+    Timestamps are seconds; for CSVs they are the wall-clock times as written
+    (local time), for bin logs Unix time shifted to local time, so both kinds
+    line up when merged.
+    """
+
+    def __init__(self, path, unit="KB/s"):
+        self.path = path
+        with open(path, "rb") as file:
+            first = file.readline()
+        self.binary = first.startswith(BINARY_MAGIC)
+        if self.binary:
+            columns, _ = read_log(path, mmap=True)
+            self.series = _series_from_header(columns[1:])
+            self.header = True
+            return
+        fields = first.decode("utf-8", "replace").strip().split(",")
+        self.header = not first[:1].isdigit()
+        if self.header:
+            self.series = _series_from_header(fields[1:])
+        else:
+            # Headerless speed-test CSV: time, upload, download in one rate unit
+            names = ["Upload", "Download"] + [f"Column {index}" for index in range(3, len(fields))]
+            self.series = [Series(name, index, UNITS[unit]) for index, name in enumerate(names[:len(fields) - 1])]
+        if not self.series:
+            raise ValueError(f"'{path}': no rate or MB columns found.")
+        self._dtype = [("t", "M8[ms]")] + [(f"c{index}", "f8") for index in range(len(fields) - 1)]
+
+    def blocks(self):
+        """Yield (timestamps, values) with one values column per log column."""
+        if self.binary:
+            _, records = read_log(self.path, mmap=True)
+            offset = time.localtime().tm_gmtoff
+            for start in range(0, len(records), CHUNK_ROWS):
+                block = np.asarray(records[start:start + CHUNK_ROWS])
+                yield block[:, 0] + offset, block[:, 1:]
+            return
+        with open(self.path, "rb") as file:
+            if self.header:
+                file.readline()
+            rest = b""
+            while True:
+                data = file.read(CHUNK_BYTES)
+                if not data:
+                    break
+                data = rest + data
+                end = data.rfind(b"\n") + 1
+                rest = data[end:]
+                if end:
+                    yield self._parse(data[:end])
+            if rest.strip():
+                yield self._parse(rest)
+
+    def span(self):
+        """
+        (rows, first timestamp, last timestamp, sub-second timestamps) of the whole file.
+
+        Reads only the first and last row and counts newlines, which is fast
+        compared to parsing.
+        """
+        if self.binary:
+            _, records = read_log(self.path, mmap=True)
+            if not len(records):
+                return 0, None, None, True
+            return len(records), float(records[0, 0]), float(records[-1, 0]), True
+        rows = 0
+        with open(self.path, "rb") as file:
+            if self.header:
+                file.readline()
+            start = file.tell()
+            first_line = file.readline()
+            file.seek(start)
+            ending = b"\n"
+            while True:
+                data = file.read(CHUNK_BYTES)
+                if not data:
+                    break
+                rows += data.count(b"\n")
+                ending = data[-1:]
+            if ending != b"\n":
+                rows += 1  # last line without a newline
+            file.seek(max(start, file.tell() - 4096))
+            lines = [line for line in file.read().splitlines() if line.strip()]
+            last_line = lines[-1] if lines else b""
+        if not first_line.strip():
+            rows = 0
+        if not rows:
+            return 0, None, None, True
+        first = self._parse(first_line)[0][0]
+        last = self._parse(last_line)[0][0]
+        fine = b"." in first_line.split(b",")[0] and b"." in last_line.split(b",")[0]
+        return rows, first, last, fine
+
+    def _parse(self, data):
+        rows = np.loadtxt(io.BytesIO(data), delimiter=",", dtype=self._dtype, ndmin=1)
+        values = np.empty((len(rows), len(self._dtype) - 1))
+        for index in range(len(self._dtype) - 1):
+            values[:, index] = rows[f"c{index}"]
+        return rows["t"].astype(np.int64) / 1000.0, values
+
+
+class RateStats:
+    """
+    Streaming statistics of one rate series: count, mean, max, idle samples,
+    bursts and a log-bucketed histogram for percentiles.
+    """
+
+    def __init__(self, idle, burst, burst_min):
+        self.idle = idle
+        self.burst = burst
+        self.burst_min = burst_min
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.idle_samples = 0
+        self.zero = 0  # samples below the histogram's range
+        self.histogram = np.zeros((MAX_EXPONENT - MIN_EXPONENT) * SUB_BUCKETS, dtype=np.int64)
+        self.bursts = 0
+        self.longest_burst = 0
+        self._run = 0  # burst still open at the end of the previous block
+
+    def add(self, rates):
+        if not len(rates):
+            return
+        self.count += len(rates)
+        self.total += float(rates.sum())
+        self.max = max(self.max, float(rates.max()))
+        self.idle_samples += int(np.count_nonzero(rates <= self.idle))
+
+        positive = rates[rates >= 2.0 ** MIN_EXPONENT]
+        self.zero += len(rates) - len(positive)
+        index = np.floor((np.log2(positive) - MIN_EXPONENT) * SUB_BUCKETS).astype(np.int64)
+        np.clip(index, 0, len(self.histogram) - 1, out=index)
+        self.histogram += np.bincount(index, minlength=len(self.histogram))
+
+        above = np.concatenate(([False], rates > self.burst, [False]))
+        edges = np.diff(above.astype(np.int8))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        lengths = ends - starts
+        if not len(lengths):
+            self._close_run()
+            return
+        if starts[0] == 0:
+            lengths[0] += self._run  # continues the burst of the previous block
+        elif self._run:
+            self._close_run()
+        self._run = 0
+        if ends[-1] == len(rates):
+            self._run = int(lengths[-1])  # may continue in the next block
+            lengths = lengths[:-1]
+        self._count_runs(lengths)
+
+    def _count_runs(self, lengths):
+        lengths = lengths[lengths >= self.burst_min]
+        self.bursts += len(lengths)
+        if len(lengths):
+            self.longest_burst = max(self.longest_burst, int(lengths.max()))
+
+    def _close_run(self):
+        if self._run:
+            self._count_runs(np.array([self._run]))
+            self._run = 0
+
+    def finish(self):
+        self._close_run()
+
+    def merge(self, other):
+        other.finish()
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.idle_samples += other.idle_samples
+        self.zero += other.zero
+        self.histogram += other.histogram
+        self.bursts += other.bursts
+        self.longest_burst = max(self.longest_burst, other.longest_burst)
+
+    def percentile(self, point):
+        """Approximate rate at the given percentile (bucket midpoint, within ~1%)."""
+        if not self.count:
+            return 0.0
+        rank = point / 100.0 * self.count
+        if rank <= self.zero:
+            return 0.0
+        cumulative = np.cumsum(self.histogram) + self.zero
+        index = int(np.searchsorted(cumulative, rank))
+        return min(2.0 ** ((index + 0.5) / SUB_BUCKETS + MIN_EXPONENT), self.max)
+
+
+class Resampler:
+    """Average and peak rate per fixed period, combined over blocks and files."""
+
+    def __init__(self, period, names):
+        self.period = period
+        self.names = names
+        self._parts = []  # (keys, counts, sums, maxima) per block
+
+    def add(self, timestamps, rates):
+        keys = np.floor(timestamps / self.period).astype(np.int64)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        rates = rates[order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        counts = np.diff(np.append(starts, len(keys)))
+        self._parts.append((keys[starts], counts, np.add.reduceat(rates, starts), np.maximum.reduceat(rates, starts)))
+
+    def result(self):
+        """(bucket start times, sample counts, average rates, peak rates), sorted by time."""
+        if not self._parts:
+            return np.zeros(0), np.zeros(0), np.zeros((0, len(self.names))), np.zeros((0, len(self.names)))
+        keys, counts, sums, maxima = (np.concatenate(part) for part in zip(*self._parts))
+        order = np.argsort(keys, kind="stable")
+        keys, counts, sums, maxima = keys[order], counts[order], sums[order], maxima[order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        counts = np.add.reduceat(counts, starts)
+        return (keys[starts] * self.period, counts,
+                np.add.reduceat(sums, starts) / counts[:, None], np.maximum.reduceat(maxima, starts))
+
+    def write(self, path):
+        start, counts, average, peak = self.result()
+        header = ["Timestamp", "Samples"]
+        for name in self.names:
+            header += [f"{name} AvgMBps", f"{name} MaxMBps"]
+        table = np.empty((len(start), 2 * len(self.names)))
+        table[:, 0::2] = average
+        table[:, 1::2] = peak
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            file.write(",".join(header) + "\n")
+            stamps = np.datetime_as_string(start.astype("M8[s]"), unit="s")
+            for stamp, count, row in zip(stamps, counts, table):
+                file.write(f"{stamp.replace('T', ' ')},{count}," + ",".join(f"{value:.4f}" for value in row) + "\n")
+        return len(start)
+
+
+class RunSummary:
+    """Statistics of one log file (or of several merged)."""
+
+    def __init__(self, name, series_names, idle, burst, burst_min):
+        self.name = name
+        self.series_names = series_names
+        self.stats = [RateStats(idle, burst, burst_min) for _ in series_names]
+        self.samples = 0
+        self.all_idle = 0
+        self.first = None
+        self.last = None
+        self.idle = idle
+
+    def add(self, timestamps, rates):
+        if not len(timestamps):
+            return
+        self.samples += len(timestamps)
+        self.all_idle += int(np.count_nonzero((rates <= self.idle).all(axis=1)))
+        self.first = timestamps[0] if self.first is None else min(self.first, timestamps[0])
+        self.last = timestamps[-1] if self.last is None else max(self.last, timestamps[-1])
+        for index, stats in enumerate(self.stats):
+            stats.add(rates[:, index])
+
+    def merge(self, other):
+        self.samples += other.samples
+        self.all_idle += other.all_idle
+        if other.first is not None:
+            self.first = other.first if self.first is None else min(self.first, other.first)
+            self.last = other.last if self.last is None else max(self.last, other.last)
+        lookup = {name: stats for name, stats in zip(self.series_names, self.stats)}
+        for name, stats in zip(other.series_names, other.stats):
+            if name not in lookup:
+                self.series_names.append(name)
+                lookup[name] = RateStats(stats.idle, stats.burst, stats.burst_min)
+                self.stats.append(lookup[name])
+            lookup[name].merge(stats)
+
+    def report(self, burst, burst_min):
+        span = (self.last - self.first) if self.samples else 0.0
+        hours, rest = divmod(int(span), 3600)
+        idle = 100.0 * self.all_idle / self.samples if self.samples else 0.0
+        lines = [f"{self.name}: {self.samples:,} samples over {hours}:{rest // 60:02d}:{rest % 60:02d}, "
+                 f"idle (all series) {idle:.1f}%"]
+        width = max([len("Series")] + [len(name) for name in self.series_names])
+        lines.append(f"  {'Series':<{width}} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'idle%':>6} "
+                     f"{'bursts':>7} {'longest':>7}   (MB/s; bursts above {burst:g} MB/s, "
+                     f">= {burst_min} samples)")
+        for name, stats in zip(self.series_names, self.stats):
+            stats.finish()
+            mean = stats.total / stats.count if stats.count else 0.0
+            idle = 100.0 * stats.idle_samples / stats.count if stats.count else 0.0
+            lines.append(f"  {name:<{width}} {mean:9.3f} {stats.percentile(50):9.3f} {stats.percentile(95):9.3f} "
+                         f"{stats.percentile(99):9.3f} {stats.max:9.3f} {idle:6.1f} {stats.bursts:7d} "
+                         f"{stats.longest_burst:7d}")
+        return "\n".join(lines)
+
+
+def derive_interval(log):
+    """
+    Sampling interval of a log with MB-per-interval columns, from its full time span.
+
+    Raises ValueError when the timestamps are too coarse for the span to be
+    accurate (whole seconds on a short log) rather than guessing.
+    """
+    rows, first, last, fine = log.span()
+    if rows < 2 or last <= first:
+        raise ValueError(f"'{log.path}': cannot derive the sampling interval, pass --interval.")
+    if not fine and last - first < MIN_DERIVED_SPAN:
+        raise ValueError(f"'{log.path}': whole-second timestamps over {last - first:.0f} s are too coarse to derive "
+                         "the sampling interval, pass --interval.")
+    return (last - first) / (rows - 1)
+
+
+def analyze_file(log, args, resampler=None):
+    """Stream one LogFile into a RunSummary (and the resampler)."""
+    summary = RunSummary(os.path.basename(log.path), [series.name for series in log.series],
+                         args.idle, args.burst, args.burst_min)
+    interval = args.interval
+    if interval is None and any(series.per_interval for series in log.series):
+        interval = derive_interval(log)
+    for timestamps, values in log.blocks():
+        if not len(timestamps):
+            continue
+        rates = np.empty((len(timestamps), len(log.series)))
+        for index, series in enumerate(log.series):
+            rates[:, index] = values[:, series.column] * series.scale
+            if series.per_interval:
+                rates[:, index] /= interval
+        summary.add(timestamps, rates)
+        if resampler is not None:
+            resampler.add(timestamps, _align(rates, summary.series_names, resampler.names))
+    return summary
+
+
+def _align(rates, names, all_names):
+    """Rates reordered into the resampler's columns; series missing from this file are zero."""
+    if names == all_names:
+        return rates
+    aligned = np.zeros((len(rates), len(all_names)))
+    for index, name in enumerate(names):
+        aligned[:, all_names.index(name)] = rates[:, index]
+    return aligned
+
+
+def expand_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches and not os.path.exists(pattern):
+            raise ValueError(f"No file matches '{pattern}'.")
+        paths.extend(matches or [pattern])
+    return paths
+
+
+def main():
+    """
+    Main entry point for analyzing bandwidth logs with CLI arguments.
+    """
+    args = parse_arguments()
+    try:
+        paths = expand_paths(args.files)
+        logs = [LogFile(path, args.unit) for path in paths]
+        resampler = None
+        if args.resample:
+            if not args.output:
+                raise ValueError("--resample needs --output.")
+            names = []
+            for log in logs:
+                names += [series.name for series in log.series if series.name not in names]
+            resampler = Resampler(parse_period(args.resample), names)
+
+        started = time.perf_counter()
+        total_bytes = 0
+        combined = None
+        for log in logs:
+            summary = analyze_file(log, args, resampler)
+            total_bytes += os.path.getsize(log.path)
+            print(summary.report(args.burst, args.burst_min) + "\n")
+            if len(logs) > 1:
+                if combined is None:
+                    combined = RunSummary(f"All {len(logs)} files", [], args.idle, args.burst, args.burst_min)
+                combined.merge(summary)
+        if combined is not None:
+            print(combined.report(args.burst, args.burst_min) + "\n")
+        if resampler is not None:
+            rows = resampler.write(args.output)
+            print(f"Wrote {rows} rows of {args.resample} averages and peaks to {args.output}")
+        elapsed = time.perf_counter() - started
+        print(f"Analyzed {total_bytes / (1024 * 1024):.1f} MB in {elapsed:.2f} s")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
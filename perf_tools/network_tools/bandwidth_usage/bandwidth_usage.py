@@ -1,8 +1,16 @@
-import psutil
-import time
+import os
 import argparse
-import csv
 import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from perf_common.alerts import add_alert_arguments, alert_options, threshold_alerts
+from perf_common.bandwidth_sampler import BandwidthSampler, MultiInterfaceSampler
+from perf_common.history import SampleHistory
+from perf_common.log_sink import LogSink, add_log_arguments, log_options
+from perf_common.net_counters import list_interfaces, select_interfaces
+from perf_common.process_traffic import ProcessTrafficSampler
+from perf_common.scheduler import format_stats
 
 
 def parse_arguments():
@@ -12,7 +20,7 @@ def parse_arguments():
     Returns
     -------
     argparse.Namespace
-        Parsed arguments including interval, interface, threshold, and csv_output.
+        Parsed arguments including interval, interface, include, exclude, top, threshold, and csv_output.
     """
     parser = argparse.ArgumentParser(
         description="Monitor network bandwidth usage."
@@ -21,7 +29,7 @@ def parse_arguments():
         "-i", "--interval",
         type=float,
         default=1.0,
-        help="Time interval in seconds between usage checks (default: 1.0)"
+        help="Time interval in seconds between usage checks, down to 0.01 (default: 1.0)"
     )
     parser.add_argument(
         "-n", "--interface",
@@ -30,6 +38,28 @@ def parse_arguments():
         help="Name of the network interface to monitor (e.g., eth0). "
              "If not provided, monitors total usage across all interfaces."
     )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="GLOB",
+        help="Monitor every interface matching this glob (e.g. 'eth*', 'vEthernet*'), each with its own "
+             "series and CSV columns. Repeatable; use '*' for all interfaces."
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        metavar="GLOB",
+        help="Leave out interfaces matching this glob (e.g. 'lo', 'veth*'). Repeatable; "
+             "implies --include '*' if no --include is given."
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Show the N processes with the most traffic in each interval instead of interface usage "
+             "(all interfaces; cannot be combined with the interface, threshold and CSV options)."
+    )
     parser.add_argument(
         "-t", "--threshold",
         type=float,
@@ -42,56 +72,12 @@ def parse_arguments():
         default=None,
         help="Path to a CSV file where usage data will be logged."
     )
+    add_alert_arguments(parser, "MB")
+    add_log_arguments(parser)
     return parser.parse_args()
 
 
-def get_bandwidth_usage(interval=1.0, interface=None):
-    """
-    Measure network bandwidth usage over a given interval, optionally for a specific interface.
-
-    Parameters
-    ----------
-    interval : float
-        Time interval in seconds over which to measure usage.
-    interface : str
-        Name of the network interface to monitor. If None, captures total usage.
-
-    Returns
-    -------
-    tuple
-        A tuple of two floats: (sent_usage_in_mb, received_usage_in_mb).
-        Represents the amount of data sent and received in MB during the interval.
-    """
-    if interface:
-        # Get the counters for the specified interface only
-        net_io_before = psutil.net_io_counters(pernic=True).get(interface)
-        if not net_io_before:
-            raise ValueError(f"Interface '{interface}' not found. Please check the name.")
-    else:
-        net_io_before = psutil.net_io_counters()
-
-    if net_io_before is None:
-        raise ValueError("Unable to retrieve network counters.")
-
-    time.sleep(interval)
-
-    if interface:
-        net_io_after = psutil.net_io_counters(pernic=True).get(interface)
-        if not net_io_after:
-            raise ValueError(f"Interface '{interface}' not found after sleep. Please check the name.")
-    else:
-        net_io_after = psutil.net_io_counters()
-
-    sent_bytes = net_io_after.bytes_sent - net_io_before.bytes_sent
-    received_bytes = net_io_after.bytes_recv - net_io_before.bytes_recv
-
-    sent_usage_mb = sent_bytes / (1024 * 1024)
-    received_usage_mb = received_bytes / (1024 * 1024)
-
-    return sent_usage_mb, received_usage_mb
-
-
-def monitor_bandwidth(interval=1.0, interface=None, threshold=None, csv_output=None):
+def monitor_bandwidth(interval=1.0, interface=None, threshold=None, csv_output=None, log_settings=None, alert_settings=None):
     """
     Continuously monitor and display cumulative network bandwidth usage.
 
@@ -105,28 +91,43 @@ def monitor_bandwidth(interval=1.0, interface=None, threshold=None, csv_output=N
         Usage threshold in MB that triggers a warning if exceeded during an interval.
     csv_output : str
         Optional file path to log usage data in CSV format.
+    log_settings : dict, optional
+        Extra LogSink options for csv_output (format, flushing, rotation).
+    alert_settings : dict, optional
+        Extra threshold_alerts() options (clear level, N of M samples, rate limit).
     """
     total_sent_mb = 0.0
     total_received_mb = 0.0
+    sampler = BandwidthSampler(interval, interface)
+    samples = sampler.subscribe_queue()
+    # Bounded rate history (MB/s) with 1s/10s/1m/1h rollups, for the final summary
+    history = SampleHistory(["SentMBps", "ReceivedMBps"])
+    sampler.subscribe(lambda sample: sample and history.add(
+        sample.timestamp, (sample.upload_rate / (1024 * 1024), sample.download_rate / (1024 * 1024))))
+    alerts = threshold_alerts(threshold, [("Interval sent", lambda sample: sample.bytes_sent / (1024 * 1024)),
+                                          ("Interval received", lambda sample: sample.bytes_recv / (1024 * 1024))],
+                              "MB", **(alert_settings or {}))
+    sampler.subscribe(alerts.process)
 
     # Prepare CSV logging if requested
-    csv_file = None
-    csv_writer = None
+    log = None
     if csv_output:
-        csv_file = open(csv_output, mode="a", newline="", encoding="utf-8")
-        csv_writer = csv.writer(csv_file)
-        # Write headers if the file is empty
-        if csv_file.tell() == 0:
-            csv_writer.writerow(["Timestamp", "IntervalSentMB", "IntervalReceivedMB", 
-                                 "TotalSentMB", "TotalReceivedMB"])
+        log = LogSink(csv_output, ["IntervalSentMB", "IntervalReceivedMB", "TotalSentMB", "TotalReceivedMB"],
+                      precision=2, timestamp_digits=3, **(log_settings or {}))
 
     print(f"\nMonitoring bandwidth usage every {interval} second(s). "
           f"{f'Interface: {interface}. ' if interface else 'All interfaces. '}"
           "Press Ctrl+C to stop.\n")
 
+    alerts.start()
+    sampler.start()
     try:
         while True:
-            sent_mb, received_mb = get_bandwidth_usage(interval=interval, interface=interface)
+            sample = samples.get()
+            if sample is None:
+                raise sampler.error
+            sent_mb = sample.bytes_sent / (1024 * 1024)
+            received_mb = sample.bytes_recv / (1024 * 1024)
             total_sent_mb += sent_mb
             total_received_mb += received_mb
 
@@ -136,31 +137,160 @@ def monitor_bandwidth(interval=1.0, interface=None, threshold=None, csv_output=N
                 f"[Total] Sent: {total_sent_mb:.2f} MB, Received: {total_received_mb:.2f} MB"
             )
 
-            # Check threshold
-            if threshold is not None:
-                if sent_mb > threshold:
-                    print(f"WARNING: Interval sent ({sent_mb:.2f} MB) exceeded threshold ({threshold} MB).")
-                if received_mb > threshold:
-                    print(f"WARNING: Interval received ({received_mb:.2f} MB) exceeded threshold ({threshold} MB).")
-
             # Write to CSV if requested
-            if csv_writer:
-                timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-                csv_writer.writerow([timestamp, f"{sent_mb:.2f}", f"{received_mb:.2f}",
-                                     f"{total_sent_mb:.2f}", f"{total_received_mb:.2f}"])
-                csv_file.flush()
+            if log:
+                log.write(sample.timestamp, (sent_mb, received_mb, total_sent_mb, total_received_mb))
 
     except KeyboardInterrupt:
         print("\nMonitoring stopped by user.")
     finally:
-        if csv_file:
-            csv_file.close()
+        sampler.stop()
+        alerts.stop()
+        if log:
+            log.close()
 
     # Final summary
     print(
         f"\nFinal Bandwidth Usage - Sent: {total_sent_mb:.2f} MB, "
         f"Received: {total_received_mb:.2f} MB"
     )
+    rates = history.summary()
+    if rates is not None:
+        for index, direction in enumerate(("Sent", "Received")):
+            print(f"{direction} rate (MB/s) - min: {rates['min'][index]:.2f}, avg: {rates['avg'][index]:.2f}, "
+                  f"p95: {rates['p95'][index]:.2f}, max: {rates['max'][index]:.2f}")
+    print(f"Sampling: {format_stats(sampler.stats())}")
+
+
+def monitor_interfaces(interfaces, interval=1.0, threshold=None, csv_output=None, log_settings=None, alert_settings=None):
+    """
+    Monitor several interfaces in one sampling loop, with a series per interface.
+
+    Parameters
+    ----------
+    interfaces : list of str
+        Names of the interfaces to monitor.
+    interval : float
+        Time interval in seconds between usage checks.
+    threshold : float
+        Usage threshold in MB per interface that triggers a warning if exceeded during an interval.
+    csv_output : str
+        Optional file path to log usage data in CSV format, with sent/received columns per interface.
+    log_settings : dict, optional
+        Extra LogSink options for csv_output (format, flushing, rotation).
+    alert_settings : dict, optional
+        Extra threshold_alerts() options (clear level, N of M samples, rate limit).
+    """
+    mb = 1024 * 1024
+    total_sent = [0] * len(interfaces)
+    total_received = [0] * len(interfaces)
+    sampler = MultiInterfaceSampler(interfaces, interval)
+    samples = sampler.subscribe_queue()
+    series = []
+    for index, name in enumerate(interfaces):
+        series.append((f"{name} interval sent", lambda sample, index=index: sample.bytes_sent[index] / mb))
+        series.append((f"{name} interval received", lambda sample, index=index: sample.bytes_recv[index] / mb))
+    alerts = threshold_alerts(threshold, series, "MB", **(alert_settings or {}))
+    sampler.subscribe(alerts.process)
+
+    log = None
+    if csv_output:
+        columns = []
+        for name in interfaces:
+            columns += [f"{name} SentMB", f"{name} ReceivedMB"]
+        log = LogSink(csv_output, columns, precision=2, timestamp_digits=3, **(log_settings or {}))
+
+    print(f"\nMonitoring bandwidth usage every {interval} second(s). "
+          f"Interfaces: {', '.join(interfaces)}. Press Ctrl+C to stop.\n")
+
+    alerts.start()
+    sampler.start()
+    try:
+        while True:
+            sample = samples.get()
+            if sample is None:
+                raise sampler.error
+            for index, name in enumerate(interfaces):
+                total_sent[index] += sample.bytes_sent[index]
+                total_received[index] += sample.bytes_recv[index]
+
+            print(" | ".join(f"{name} Sent: {sent / mb:.2f} MB, Received: {received / mb:.2f} MB"
+                             for name, sent, received in zip(interfaces, sample.bytes_sent, sample.bytes_recv)))
+
+            if log:
+                row = []
+                for sent, received in zip(sample.bytes_sent, sample.bytes_recv):
+                    row += [sent / mb, received / mb]
+                log.write(sample.timestamp, row)
+
+    except KeyboardInterrupt:
+        print("\nMonitoring stopped by user.")
+    finally:
+        sampler.stop()
+        alerts.stop()
+        if log:
+            log.close()
+
+    print("\nFinal Bandwidth Usage")
+    for name, sent, received in zip(interfaces, total_sent, total_received):
+        print(f"  {name}: Sent: {sent / mb:.2f} MB, Received: {received / mb:.2f} MB")
+    print(f"Sampling: {format_stats(sampler.stats())}")
+
+
+def monitor_processes(top=10, interval=1.0):
+    """
+    Continuously display the processes with the most network traffic.
+
+    Parameters
+    ----------
+    top : int
+        Number of processes listed per interval and in the final summary.
+    interval : float
+        Time interval in seconds between usage checks.
+    """
+    mb = 1024 * 1024
+    totals = {}
+    unattributed = [0, 0]
+    sampler = ProcessTrafficSampler(interval)
+    samples = sampler.subscribe_queue()
+
+    print(f"\nMonitoring per-process bandwidth every {interval} second(s). Press Ctrl+C to stop.")
+
+    sampler.start()
+    try:
+        while True:
+            sample = samples.get()
+            if sample is None:
+                raise sampler.error
+            for pid, (sent, received) in sample.processes.items():
+                usage = totals.setdefault((pid, sample.names[pid]), [0, 0])
+                usage[0] += sent
+                usage[1] += received
+            other_sent, other_received = sample.unattributed
+            unattributed[0] += other_sent
+            unattributed[1] += other_received
+
+            print(f"\n[{time.strftime('%H:%M:%S', time.localtime(sample.timestamp))}] "
+                  f"Top {top} processes{' (estimated from open connections)' if sample.estimated else ''}")
+            print(f"  {'PID':>7}  {'Process':<24} {'Up MB/s':>10} {'Down MB/s':>10}")
+            for pid, name, upload, download in sample.top(top):
+                print(f"  {pid if pid is not None else '-':>7}  {name[:24]:<24} {upload / mb:10.2f} {download / mb:10.2f}")
+            elapsed = sample.elapsed if sample.elapsed > 0 else interval
+            print(f"  {'':>7}  {'(unattributed)':<24} {other_sent / elapsed / mb:10.2f} "
+                  f"{other_received / elapsed / mb:10.2f}")
+
+    except KeyboardInterrupt:
+        print("\nMonitoring stopped by user.")
+    finally:
+        sampler.stop()
+
+    print(f"\nTop {top} processes over the run")
+    busiest = sorted(totals.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)[:top]
+    for (pid, name), (sent, received) in busiest:
+        print(f"  {pid if pid is not None else '-':>7}  {name[:24]:<24} Sent: {sent / mb:.2f} MB, "
+              f"Received: {received / mb:.2f} MB")
+    print(f"  {'':>7}  {'(unattributed)':<24} Sent: {unattributed[0] / mb:.2f} MB, "
+          f"Received: {unattributed[1] / mb:.2f} MB")
 
 
 def main():
@@ -170,12 +300,34 @@ def main():
     args = parse_arguments()
 
     try:
-        monitor_bandwidth(
-            interval=args.interval,
-            interface=args.interface,
-            threshold=args.threshold,
-            csv_output=args.csv_output
-        )
+        if args.top is not None:
+            if args.top < 1:
+                raise ValueError("--top needs at least 1 process.")
+            if args.interface or args.include or args.exclude or args.threshold is not None or args.csv_output:
+                raise ValueError("--top covers all interfaces and cannot be combined with --interface, "
+                                 "--include, --exclude, --threshold or --csv-output.")
+            monitor_processes(args.top, args.interval)
+        elif args.include or args.exclude:
+            interfaces = select_interfaces(args.include, args.exclude)
+            if not interfaces:
+                raise ValueError(f"No interface matches. Available: {', '.join(list_interfaces())}")
+            monitor_interfaces(
+                interfaces,
+                interval=args.interval,
+                threshold=args.threshold,
+                csv_output=args.csv_output,
+                log_settings=log_options(args),
+                alert_settings=alert_options(args)
+            )
+        else:
+            monitor_bandwidth(
+                interval=args.interval,
+                interface=args.interface,
+                threshold=args.threshold,
+                csv_output=args.csv_output,
+                log_settings=log_options(args),
+                alert_settings=alert_options(args)
+            )
     except ValueError as e:
         print(f"Error: {e}")
         sys.exit(1)
@@ -1,6 +1,10 @@
 import pynvml
 import time
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from perf_common.scheduler import Scheduler, format_stats
 
 # Initialize NVML
 def initialize_nvml():
@@ -27,27 +31,41 @@ last_logged_utilization = None  # To track the last logged value
 
 print("Monitoring GPU Decoder Utilization... Press Ctrl+C to stop.")
 
+# Read and log the decoder utilization (one scheduler tick)
+def sample_decoder():
+    global last_logged_utilization
+    try:
+        # Get decoder utilization
+        decoder_util, _ = pynvml.nvmlDeviceGetDecoderUtilization(handle)
+
+        # Get the current timestamp
+        timestamp = time.strftime("%H:%M:%S")
+
+        # Log only if the utilization changes
+        if decoder_util != last_logged_utilization:
+            log.write(f"{timestamp} - {decoder_util}%\n")
+            log.flush()  # Ensure immediate writing to file
+            last_logged_utilization = decoder_util
+
+        print(f"Decoder Utilization: {decoder_util}%")
+
+    except pynvml.NVMLError as e:
+        print(f"Error retrieving decoder utilization: {str(e)}")
+
+# Sample every second on whole seconds; the scheduler keeps the period fixed however long a read takes
+scheduler = Scheduler(name="decoder-sampler")
+job = scheduler.add(sample_decoder, 1)
+
+log = open(log_file, "a")
 try:
-    with open(log_file, "a") as log:
-        while True:
-            try:
-                # Get decoder utilization
-                decoder_util, _ = pynvml.nvmlDeviceGetDecoderUtilization(handle)
-                
-                # Get the current timestamp
-                timestamp = time.strftime("%H:%M:%S")
-
-                # Log only if the utilization changes
-                if decoder_util != last_logged_utilization:
-                    log.write(f"{timestamp} - {decoder_util}%\n")
-                    log.flush()  # Ensure immediate writing to file
-                    last_logged_utilization = decoder_util
-
-                print(f"Decoder Utilization: {decoder_util}%")
-                time.sleep(1)
-
-            except pynvml.NVMLError as e:
-                print(f"Error retrieving decoder utilization: {str(e)}")
+    scheduler.start()
+    while job.error is None:
+        time.sleep(0.5)
+    print(f"Error: {job.error}")
 except KeyboardInterrupt:
     print("\nMonitoring stopped.")
+finally:
+    scheduler.stop()
+    log.close()
+    print(f"Sampling: {format_stats(job.stats())}")
     pynvml.nvmlShutdown()
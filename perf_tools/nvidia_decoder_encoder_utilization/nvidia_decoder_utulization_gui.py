@@ -5,10 +5,13 @@ import tkinter as tk
 from pystray import Icon, MenuItem, Menu
 from PIL import Image
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from perf_common.scheduler import Scheduler
 
 # Global variable to track decoder utilization
 decoder_utilization = 0
-running = True
 counter_window = None
 last_logged_utilization = None  # To track the last logged value
 
@@ -34,27 +37,24 @@ def initialize_nvml():
 # Initialize NVML and get the GPU handle
 handle = initialize_nvml()
 
-# Function to monitor GPU decoder utilization and log changes
-def monitor_decoder():
-    global decoder_utilization, running, last_logged_utilization
-    with open(log_file, "a") as log:
-        while running:
-            try:
-                util, _ = pynvml.nvmlDeviceGetDecoderUtilization(handle)
-                decoder_utilization = util
+# Function to read GPU decoder utilization and log changes (one scheduler tick)
+def sample_decoder():
+    global decoder_utilization, last_logged_utilization
+    try:
+        util, _ = pynvml.nvmlDeviceGetDecoderUtilization(handle)
+        decoder_utilization = util
 
-                # Get the current timestamp
-                timestamp = time.strftime("%H:%M:%S")
+        # Get the current timestamp
+        timestamp = time.strftime("%H:%M:%S")
 
-                # Log only if the utilization changes
-                if decoder_utilization != last_logged_utilization:
-                    log.write(f"{timestamp} - {decoder_utilization}%\n")
-                    log.flush()  # Ensure the log is written to file immediately
-                    last_logged_utilization = decoder_utilization
+        # Log only if the utilization changes
+        if decoder_utilization != last_logged_utilization:
+            log.write(f"{timestamp} - {decoder_utilization}%\n")
+            log.flush()  # Ensure the log is written to file immediately
+            last_logged_utilization = decoder_utilization
 
-            except pynvml.NVMLError as e:
-                print(f"Error retrieving decoder utilization: {str(e)}")
-            time.sleep(1)
+    except pynvml.NVMLError as e:
+        print(f"Error retrieving decoder utilization: {str(e)}")
 
 # Function to display the decoder utilization on screen
 def show_counter():
@@ -101,8 +101,8 @@ def hide_counter():
 
 # Function to handle exiting the app
 def exit_app(icon=None, item=None):
-    global running
-    running = False
+    scheduler.stop()
+    log.close()
     try:
         pynvml.nvmlShutdown()
     except pynvml.NVMLError:
@@ -127,9 +127,11 @@ def create_icon():
     icon = Icon("GPU Decoder Monitor", icon_image, menu=menu)
     icon.run()
 
-# Start the background monitoring thread
-monitor_thread = threading.Thread(target=monitor_decoder, daemon=True)
-monitor_thread.start()
+# Sample every second on absolute deadlines (whole seconds) on a background thread
+log = open(log_file, "a")
+scheduler = Scheduler(name="decoder-sampler")
+scheduler.add(sample_decoder, 1)
+scheduler.start()
 
 # Run the system tray icon
 create_icon()
@@ -1,6 +1,12 @@
-import pynvml
+import os
+import sys
 import time
 
+import pynvml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from perf_common.scheduler import Scheduler, format_stats
+
 # Initialize NVML
 pynvml.nvmlInit()
 
@@ -15,24 +21,38 @@ print("Monitoring GPU Encoder Utilization... Press Ctrl+C to stop.")
 
 last_logged_encoder_utilization = None  # To track the last logged value
 
+
+# Print the encoder utilization and log it when it changed (one scheduler tick)
+def sample_encoder():
+    global last_logged_encoder_utilization
+    # Get encoder utilization
+    encoder_util, sampling_period = pynvml.nvmlDeviceGetEncoderUtilization(handle)
+    print(f"Encoder Utilization: {encoder_util}%")
+
+    # Get the current timestamp
+    timestamp = time.strftime("%H:%M:%S")
+
+    # Log only if the utilization changes
+    if encoder_util != last_logged_encoder_utilization:
+        log.write(f"{timestamp} - {encoder_util}%\n")
+        log.flush()  # Ensure the log is written to file immediately
+        last_logged_encoder_utilization = encoder_util
+
+
+# Sample every second on whole seconds; the scheduler keeps the period fixed however long a read takes
+scheduler = Scheduler(name="encoder-sampler")
+job = scheduler.add(sample_encoder, 1)
+
+log = open(log_file, "a")
 try:
-    with open(log_file, "a") as log:
-        while True:
-            # Get encoder utilization
-            encoder_util, sampling_period = pynvml.nvmlDeviceGetEncoderUtilization(handle)
-            print(f"Encoder Utilization: {encoder_util}%")
-
-            # Get the current timestamp
-            timestamp = time.strftime("%H:%M:%S")
-
-            # Log only if the utilization changes
-            if encoder_util != last_logged_encoder_utilization:
-                log.write(f"{timestamp} - {encoder_util}%\n")
-                log.flush()  # Ensure the log is written to file immediately
-                last_logged_encoder_utilization = encoder_util
-
-            # Sleep for 1 second
-            time.sleep(1)
+    scheduler.start()
+    while job.error is None:
+        time.sleep(0.5)
+    print(f"Error retrieving encoder utilization: {job.error}")
 except KeyboardInterrupt:
     print("\nMonitoring stopped.")
+finally:
+    scheduler.stop()
+    log.close()
+    print(f"Sampling: {format_stats(job.stats())}")
     pynvml.nvmlShutdown()
@@ -0,0 +1,8 @@
+"""Shared building blocks for the monitoring tools in perf_tools.
+
+The tools are standalone scripts, so they put the perf_tools directory on
+sys.path before importing from here, e.g. from perf_tools/bandwidth_tool::
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from perf_common.bandwidth_sampler import BandwidthSampler
+"""
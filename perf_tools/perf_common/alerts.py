@@ -0,0 +1,278 @@
+"""Threshold alerts evaluated on the sampler's stream of samples.
+
+An AlertRule watches one value per sample (e.g. the download rate) and
+fires when it is above the trigger level in at least ``count`` of the last
+``window`` samples ("above 50 MB/s for 3 of 5 samples"). Once active it
+only clears when that no longer holds for the lower ``clear`` level, so a
+rate hovering around the threshold does not flap. Each rule keeps running
+counts over a ring of the last ``window`` results, so a sample costs O(1)
+whatever the window.
+
+AlertEngine feeds every sample to its rules on the sampler thread, and only
+state changes become notifications: an alert fires once when it triggers and
+once when it clears, not on every sample. Notifications are delivered by a
+separate thread, so a slow notifier (a sound, a webhook, a GUI queue) never
+delays sampling, and each rule notifies at most once per ``min_interval``
+seconds. A trigger inside that window is held back, not lost: it is
+delivered once the window has passed if the alert is still active, and
+episodes that cleared while held back are counted in the next message.
+
+Example
+-------
+    rule = AlertRule("Download", lambda s: s.download_rate / 2**20, trigger=50, clear=40,
+                     count=3, window=5, unit="MB/s")
+    with AlertEngine([rule], [print_notifier]) as engine:
+        sampler.subscribe(engine.process)
+"""
+
+import queue
+import threading
+import time
+
+from perf_common.timing import clock
+
+TRIGGERED = "triggered"
+CLEARED = "cleared"
+
+
+class AlertEvent:
+    """A rule changing state; ``message`` is ready for display."""
+
+    __slots__ = ("rule", "state", "value", "timestamp", "suppressed")
+
+    def __init__(self, rule, state, value, timestamp, suppressed=0):
+        self.rule = rule
+        self.state = state
+        self.value = value
+        self.timestamp = timestamp
+        self.suppressed = suppressed
+
+    @property
+    def message(self):
+        rule = self.rule
+        when = time.strftime("%H:%M:%S", time.localtime(self.timestamp))
+        unit = f" {rule.unit}" if rule.unit else ""
+        if self.state == TRIGGERED:
+            text = f"[{when}] WARNING: {rule.name} above {rule.trigger:g}{unit} ({self.value:.2f}{unit}"
+            text += f", {rule.count} of last {rule.window} samples)" if rule.window > 1 else ")"
+            if self.suppressed:
+                text += f" - {self.suppressed} earlier alert(s) suppressed"
+            return text
+        return f"[{when}] OK: {rule.name} back below {rule.clear:g}{unit} ({self.value:.2f}{unit})"
+
+
+class AlertRule:
+    """
+    "value above trigger in count of the last window samples", with hysteresis.
+
+    Parameters
+    ----------
+    name : str
+        Shown in messages, e.g. "eth0 download".
+    value : callable
+        sample -> float.
+    trigger : float
+        Level the value has to exceed.
+    clear : float, optional
+        Level the value has to drop to (at or below) for the alert to clear;
+        defaults to trigger.
+    count, window : int
+        The rule triggers when at least count of the last window samples are
+        above trigger, and clears when fewer than count are above clear.
+    unit : str
+        Unit of the value for messages.
+    """
+
+    def __init__(self, name, value, trigger, clear=None, count=1, window=1, unit=""):
+        if not 1 <= count <= window:
+            raise ValueError(f"Alert rule '{name}': need 1 <= count <= window, got {count} of {window}.")
+        clear = trigger if clear is None else clear
+        if clear > trigger:
+            raise ValueError(f"Alert rule '{name}': clear level {clear} is above the trigger level {trigger}.")
+        self.name = name
+        self.value = value
+        self.trigger = trigger
+        self.clear = clear
+        self.count = count
+        self.window = window
+        self.unit = unit
+        self.active = False
+        self._over_trigger = bytearray(window)
+        self._over_clear = bytearray(window)
+        self._position = 0
+        self._trigger_hits = 0
+        self._clear_hits = 0
+
+    def update(self, value):
+        """Add one value; return TRIGGERED or CLEARED on a state change, else None."""
+        position = self._position
+        over_trigger = value > self.trigger
+        over_clear = value > self.clear
+        self._trigger_hits += over_trigger - self._over_trigger[position]
+        self._clear_hits += over_clear - self._over_clear[position]
+        self._over_trigger[position] = over_trigger
+        self._over_clear[position] = over_clear
+        self._position = (position + 1) % self.window
+        if not self.active:
+            if self._trigger_hits >= self.count:
+                self.active = True
+                return TRIGGERED
+        elif self._clear_hits < self.count:
+            self.active = False
+            return CLEARED
+        return None
+
+
+def print_notifier(event):
+    """Notifier that prints the event's message."""
+    print(event.message)
+
+
+class AlertEngine:
+    """
+    Evaluates rules per sample and delivers deduplicated, rate-limited notifications.
+
+    Parameters
+    ----------
+    rules : list of AlertRule
+    notifiers : list of callable
+        Called with each AlertEvent on the notification thread.
+    min_interval : float
+        Seconds between two notifications of the same rule. An alert that
+        triggers sooner is delivered when the interval has passed, if it is
+        still active then; otherwise it is suppressed (with its clear event)
+        and counted in the rule's next notification.
+
+    process() is meant to be a sampler subscriber; samples that are None
+    (sampler errors) are ignored.
+    """
+
+    def __init__(self, rules, notifiers=(), min_interval=60.0):
+        self.rules = list(rules)
+        self.notifiers = list(notifiers)
+        self.min_interval = min_interval
+        self.suppressed = 0
+        self._last_notified = {}
+        self._suppressed = {}
+        self._pending = {}  # rule -> trigger event held back by min_interval
+        self._delivered = set()  # rules whose trigger was delivered and whose clear is still due
+        self._events = queue.Queue()
+        self._thread = None
+
+    @property
+    def active(self):
+        """Rules currently in the triggered state."""
+        return [rule for rule in self.rules if rule.active]
+
+    def process(self, sample):
+        if sample is None:
+            return
+        timestamp = getattr(sample, "timestamp", None) or time.time()
+        for rule in self.rules:
+            value = rule.value(sample)
+            state = rule.update(value)
+            if state is not None:
+                self._notify(AlertEvent(rule, state, value, timestamp))
+        if self._pending:
+            now = clock()
+            for rule in [rule for rule in self._pending if now - self._last_notified[rule] >= self.min_interval]:
+                self._deliver(self._pending.pop(rule), now)
+
+    def _notify(self, event):
+        rule = event.rule
+        if event.state == CLEARED:
+            if rule in self._pending:
+                # Cleared before its trigger could be delivered: the episode is suppressed
+                del self._pending[rule]
+                self._suppressed[rule] = self._suppressed.get(rule, 0) + 1
+                self.suppressed += 1
+            elif rule in self._delivered:
+                self._delivered.discard(rule)
+                self._events.put(event)
+            return
+        now = clock()
+        last = self._last_notified.get(rule)
+        if last is not None and now - last < self.min_interval:
+            self._pending[rule] = event
+            return
+        self._deliver(event, now)
+
+    def _deliver(self, event, now):
+        rule = event.rule
+        self._last_notified[rule] = now
+        event.suppressed = self._suppressed.pop(rule, 0)
+        self._delivered.add(rule)
+        self._events.put(event)
+
+    def _run(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            for notifier in self.notifiers:
+                try:
+                    notifier(event)
+                except Exception as e:
+                    # One broken notifier must not silence the others or end the thread
+                    print(f"Error: alert notifier {getattr(notifier, '__qualname__', notifier)} failed: {e!r}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="alert-notifier", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Deliver pending notifications and stop the notification thread."""
+        if self._thread is not None:
+            self._events.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def add_alert_arguments(parser, unit):
+    """
+    Add --clear/--sustain/--alert-interval to a parser that already has -t/--threshold.
+
+    unit names the threshold's unit in the help texts.
+    """
+    parser.add_argument("--clear", type=float, default=None,
+                        help=f"Level in {unit} the usage must drop to before a threshold alert clears "
+                             "(default: the threshold itself)")
+    parser.add_argument("--sustain", type=str, default="1/1", metavar="N/M",
+                        help="Alert only when the threshold is exceeded in N of the last M samples (default: 1/1)")
+    parser.add_argument("--alert-interval", type=float, default=60.0,
+                        help="Minimum seconds between two alerts of the same kind (default: 60)")
+
+
+def parse_sustain(text):
+    """'N/M' -> (N, M)."""
+    try:
+        count, window = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid --sustain '{text}', expected N/M such as 3/5.") from None
+    return count, window
+
+
+def alert_options(args):
+    """Keyword arguments for threshold_alerts() from the add_alert_arguments() options."""
+    count, window = parse_sustain(args.sustain)
+    return {"clear": args.clear, "count": count, "window": window, "min_interval": args.alert_interval}
+
+
+def threshold_alerts(threshold, series, unit, clear=None, count=1, window=1, min_interval=60.0,
+                     notifiers=(print_notifier,)):
+    """
+    AlertEngine with one rule per (name, value) in series, all sharing one threshold.
+
+    With threshold None the engine has no rules and never notifies.
+    """
+    rules = []
+    if threshold is not None:
+        rules = [AlertRule(name, value, threshold, clear, count, window, unit) for name, value in series]
+    return AlertEngine(rules, notifiers, min_interval)
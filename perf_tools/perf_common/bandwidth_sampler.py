@@ -0,0 +1,289 @@
+"""Background network bandwidth sampler shared by the bandwidth tools.
+
+The tools used to measure bandwidth by reading the interface counters,
+sleeping for the interval and reading them again, which blocks whoever
+calls it (in the GUIs, the UI thread). BandwidthSampler reads the counters
+on a background thread at a fixed cadence, on absolute deadlines of a
+monotonic clock so the interval does not drift (see scheduler.py), and hands
+every delta to its subscribers. A CLI can block on a subscription queue, a
+GUI can drain one from its timer without ever waiting. Several samplers can
+share one Scheduler thread, which also lines up their timestamps.
+
+Example
+-------
+    with BandwidthSampler(interval=0.1, interface="eth0") as sampler:
+        samples = sampler.subscribe_queue()
+        while True:
+            sample = samples.get()
+            print(f"{sample.upload_rate / 1024:.1f} KB/s up")
+"""
+
+import queue
+import threading
+import time
+
+from perf_common.net_counters import open_counter_reader, open_interfaces_reader
+from perf_common.scheduler import MIN_INTERVAL, Scheduler
+from perf_common.timing import clock
+
+
+class BandwidthSample:
+    """
+    Traffic over one sampling interval.
+
+    Attributes
+    ----------
+    timestamp : float
+        Wall-clock time (time.time()) at the end of the interval.
+    elapsed : float
+        Measured length of the interval in seconds.
+    bytes_sent, bytes_recv : int
+        Bytes sent and received during the interval.
+    """
+
+    __slots__ = ("timestamp", "elapsed", "bytes_sent", "bytes_recv")
+
+    def __init__(self, timestamp, elapsed, bytes_sent, bytes_recv):
+        self.timestamp = timestamp
+        self.elapsed = elapsed
+        self.bytes_sent = bytes_sent
+        self.bytes_recv = bytes_recv
+
+    @property
+    def upload_rate(self):
+        """Bytes per second sent."""
+        return self.bytes_sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def download_rate(self):
+        """Bytes per second received."""
+        return self.bytes_recv / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class BandwidthSampler:
+    """
+    Samples interface counters on a background thread and publishes deltas.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between samples (at least MIN_INTERVAL).
+    interface : str, optional
+        Interface to monitor; None for the total of all interfaces.
+    reader : object, optional
+        Counter source with a read() -> (bytes_sent, bytes_recv) method.
+        Defaults to net_counters.open_counter_reader(interface), opened
+        for each run and closed when sampling stops.
+    scheduler : Scheduler, optional
+        Shared scheduler to run on (started and stopped by its owner). By
+        default the sampler runs its own scheduler thread.
+
+    Ticks are aligned to wall-clock multiples of the interval (see
+    Scheduler.add()); the first one only reads the counters, so the first
+    sample arrives after the second. Subscribers are called on the sampler
+    thread and must return quickly; anything slow (GUI updates, file writes)
+    should go through subscribe_queue() instead. A subscriber that raises is
+    reported and unsubscribed; the others keep receiving samples. If
+    sampling itself fails (e.g. the interface disappears), it stops,
+    ``error`` holds the exception and subscribers receive None.
+    """
+
+    def __init__(self, interval=1.0, interface=None, reader=None, scheduler=None):
+        if interval < MIN_INTERVAL:
+            raise ValueError(f"Interval must be at least {MIN_INTERVAL} s.")
+        self.interval = interval
+        self.interface = interface
+        self.reader = reader
+        self.scheduler = scheduler
+        self.latest = None
+        self.error = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._job = None
+        self._own_scheduler = None
+        self._active_reader = None
+        self._counters = None
+        self._last = None
+
+    def subscribe(self, callback):
+        """Call callback(sample) for every new sample, or callback(None) once on error."""
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def subscribe_queue(self, maxsize=0):
+        """
+        Return a queue.Queue that receives every sample.
+
+        With maxsize, the oldest sample is discarded when the consumer falls
+        behind, so a stalled reader never blocks sampling.
+        """
+        samples = queue.Queue(maxsize)
+
+        def put(sample):
+            while True:
+                try:
+                    samples.put_nowait(sample)
+                    return
+                except queue.Full:
+                    try:
+                        samples.get_nowait()
+                    except queue.Empty:
+                        pass
+
+        self.subscribe(put)
+        return samples
+
+    def _publish(self, sample):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(sample)
+            except Exception as e:
+                # A failing subscriber must not stop sampling or starve the others: report and drop it
+                print(f"Error: sampler subscriber {getattr(callback, '__qualname__', callback)} failed "
+                      f"and was unsubscribed: {e!r}")
+                with self._lock:
+                    if callback in self._subscribers:
+                        self._subscribers.remove(callback)
+
+    def _open_reader(self):
+        return open_counter_reader(self.interface)
+
+    def _read(self, reader):
+        """Current cumulative counters, compared by _make_sample()."""
+        return reader.read()
+
+    def _make_sample(self, timestamp, elapsed, before, after):
+        # Counters can go backwards when an interface is reset; count that interval as idle
+        return BandwidthSample(timestamp, elapsed, max(0, after[0] - before[0]), max(0, after[1] - before[1]))
+
+    def _close_reader(self):
+        reader, self._active_reader = self._active_reader, None
+        if reader is not None and reader is not self.reader:
+            reader.close()
+
+    def _tick(self):
+        """Read the counters; from the second tick on, publish the delta to the previous one."""
+        try:
+            counters = self._read(self._active_reader)
+            now = clock()
+            if self._counters is not None:
+                sample = self._make_sample(time.time(), now - self._last, self._counters, counters)
+                self.latest = sample
+                self._publish(sample)
+            self._counters, self._last = counters, now
+        except Exception as e:
+            # Any failure ends sampling, and consumers blocked on a queue must hear about it
+            self.error = e
+            self._job.cancel()
+            self._close_reader()
+            self._publish(None)
+
+    @property
+    def missed(self):
+        """Ticks skipped because sampling fell behind (e.g. after a suspend)."""
+        return self._job.missed if self._job is not None else 0
+
+    def stats(self):
+        """Tick and jitter statistics of the sampling job (see scheduler.Job.stats()), or None."""
+        return self._job.stats() if self._job is not None else None
+
+    def start(self):
+        self.error = None
+        self._counters = None
+        self._active_reader = self.reader or self._open_reader()
+        scheduler = self.scheduler
+        if scheduler is None:
+            scheduler = self._own_scheduler = Scheduler(name="bandwidth-sampler")
+        self._job = scheduler.add(self._tick, self.interval, name=type(self).__name__)
+        if self._own_scheduler is not None:
+            self._own_scheduler.start()
+        return self
+
+    def stop(self):
+        if self._job is not None:
+            self._job.cancel()
+        if self._own_scheduler is not None:
+            self._own_scheduler.stop()
+            self._own_scheduler = None
+        self._close_reader()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class MultiInterfaceSample:
+    """
+    Traffic of several interfaces over one sampling interval.
+
+    Attributes
+    ----------
+    timestamp, elapsed : float
+        As in BandwidthSample.
+    interfaces : list of str
+        Interface names, in column order.
+    bytes_sent, bytes_recv : list of int
+        Bytes per interface during the interval.
+    """
+
+    __slots__ = ("timestamp", "elapsed", "interfaces", "bytes_sent", "bytes_recv")
+
+    def __init__(self, timestamp, elapsed, interfaces, bytes_sent, bytes_recv):
+        self.timestamp = timestamp
+        self.elapsed = elapsed
+        self.interfaces = interfaces
+        self.bytes_sent = bytes_sent
+        self.bytes_recv = bytes_recv
+
+    def interface(self, index):
+        """BandwidthSample of the index-th interface."""
+        return BandwidthSample(self.timestamp, self.elapsed, self.bytes_sent[index], self.bytes_recv[index])
+
+    def total(self):
+        """BandwidthSample summed over all interfaces."""
+        return BandwidthSample(self.timestamp, self.elapsed, sum(self.bytes_sent), sum(self.bytes_recv))
+
+
+class MultiInterfaceSampler(BandwidthSampler):
+    """
+    Samples several interfaces in one loop and publishes MultiInterfaceSamples.
+
+    Parameters
+    ----------
+    interfaces : list of str
+        Interfaces to monitor, e.g. from net_counters.select_interfaces().
+    interval, reader, scheduler
+        As for BandwidthSampler; a reader needs read_all() and ``sent``/``recv``
+        arrays (see net_counters.open_interfaces_reader()).
+
+    All interfaces are read in one pass per tick, so their series share
+    timestamps. An interface that disappears stops sampling like in
+    BandwidthSampler.
+    """
+
+    def __init__(self, interfaces, interval=1.0, reader=None, scheduler=None):
+        super().__init__(interval, reader=reader, scheduler=scheduler)
+        self.interfaces = list(interfaces)
+        if not self.interfaces:
+            raise ValueError("No interfaces to monitor.")
+
+    def _open_reader(self):
+        return open_interfaces_reader(self.interfaces)
+
+    def _read(self, reader):
+        reader.read_all()
+        return reader.sent.tolist(), reader.recv.tolist()
+
+    def _make_sample(self, timestamp, elapsed, before, after):
+        sent = [max(0, new - old) for old, new in zip(before[0], after[0])]
+        recv = [max(0, new - old) for old, new in zip(before[1], after[1])]
+        return MultiInterfaceSample(timestamp, elapsed, self.interfaces, sent, recv)
@@ -0,0 +1,226 @@
+"""Fixed-memory sample history with multi-resolution rollups.
+
+SampleHistory keeps the newest raw samples in a NumPy ring buffer and folds
+them into 1 s, 10 s, 1 min and 1 h buckets with min/avg/max/p95 per column,
+each level in its own ring. Memory is allocated once, so a week-long run
+uses the same amount as a minute-long one, and questions like "p95 over the
+last 5 minutes" are answered from arrays without touching the log files.
+
+1 s buckets are computed exactly from their raw samples. Coarser buckets are
+combined from the finer ones: min, max and the (count-weighted) average are
+exact, p95 is the count-weighted 95th percentile of the finer buckets' p95
+values, an approximation. summary() therefore prefers the raw samples
+whenever they reach back far enough.
+
+Example
+-------
+    history = SampleHistory(["upload", "download"])
+    sampler.subscribe(lambda s: s and history.add(s.timestamp, (s.upload_rate, s.download_rate)))
+    ...
+    stats = history.summary(300)   # {"min": array, "avg": ..., "max": ..., "p95": ..., "count": n}
+"""
+
+import threading
+
+import numpy as np
+
+# (bucket length in seconds, buckets kept): 1 h of 1 s, 1 day of 10 s, 1 week of 1 min, 1 year of 1 h
+DEFAULT_LEVELS = ((1, 3600), (10, 8640), (60, 10080), (3600, 8760))
+
+DEFAULT_RAW_CAPACITY = 36000
+
+STATISTICS = ("min", "avg", "max", "p95")
+
+
+def _weighted_percentile(values, weights, q):
+    """Per-column q-th percentile of rows of values, each row weighted (values: rows x columns)."""
+    order = np.argsort(values, axis=0)
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    cumulative = np.cumsum(weights[order], axis=0)
+    rank = cumulative[-1] * q / 100.0
+    index = (cumulative < rank).sum(axis=0)
+    return sorted_values[np.minimum(index, len(values) - 1), np.arange(values.shape[1])]
+
+
+class _Ring:
+    """Rows of float64 columns in preallocated arrays, oldest overwritten first."""
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, width))
+        self.next = 0  # total rows ever added
+        self.size = 0
+
+    def append(self, row):
+        self.data[self.next % self.capacity] = row
+        self.next += 1
+        self.size = min(self.size + 1, self.capacity)
+
+    def last(self, count):
+        """The count newest rows, oldest first (a copy)."""
+        count = min(count, self.size)
+        end = self.next % self.capacity
+        if count <= end:
+            return self.data[end - count:end].copy()
+        return np.concatenate((self.data[self.capacity - (count - end):], self.data[:end]))
+
+
+class _Level:
+    """One rollup resolution: a ring of [start, count, min..., avg..., max..., p95...] rows."""
+
+    def __init__(self, resolution, capacity, columns):
+        self.resolution = resolution
+        self.columns = columns
+        self.ring = _Ring(capacity, 2 + 4 * columns)
+        self.key = None  # bucket number being filled
+        self.pending = []  # finer rows (or raw samples) of the open bucket
+
+    def close(self):
+        """Aggregate the open bucket, append it and return its row (None if empty)."""
+        if not self.pending:
+            return None
+        rows = np.asarray(self.pending)
+        self.pending = []
+        n = self.columns
+        if rows.shape[1] == n:
+            # Finest level: raw sample values
+            count = len(rows)
+            low, mean, high = rows.min(axis=0), rows.mean(axis=0), rows.max(axis=0)
+            p95 = np.percentile(rows, 95, axis=0)
+        else:
+            counts = rows[:, 1]
+            count = counts.sum()
+            low = rows[:, 2:2 + n].min(axis=0)
+            mean = (rows[:, 2 + n:2 + 2 * n] * counts[:, None]).sum(axis=0) / count
+            high = rows[:, 2 + 2 * n:2 + 3 * n].max(axis=0)
+            p95 = _weighted_percentile(rows[:, 2 + 3 * n:], counts, 95)
+        row = np.concatenate(([self.key * self.resolution, count], low, mean, high, p95))
+        self.ring.append(row)
+        return row
+
+
+class SampleHistory:
+    """
+    Ring buffer of raw samples plus min/avg/max/p95 rollups.
+
+    Parameters
+    ----------
+    columns : list of str
+        Names of the values of each sample.
+    raw_capacity : int
+        Raw samples kept (e.g. 36000 = 1 h at 100 ms).
+    levels : sequence of (int, int)
+        (bucket seconds, buckets kept) per rollup level, finest first; every
+        resolution must be a multiple of the previous one.
+
+    add() is meant to be called from one thread (e.g. a sampler subscriber);
+    queries may come from any thread and return copies.
+    """
+
+    def __init__(self, columns, raw_capacity=DEFAULT_RAW_CAPACITY, levels=DEFAULT_LEVELS):
+        self.columns = list(columns)
+        width = len(self.columns)
+        for (finer, _), (coarser, _) in zip(levels, levels[1:]):
+            if coarser % finer:
+                raise ValueError(f"Rollup resolution {coarser} s is not a multiple of {finer} s.")
+        self._raw = _Ring(raw_capacity, 1 + width)
+        self._levels = [_Level(resolution, capacity, width) for resolution, capacity in levels]
+        self._lock = threading.Lock()
+
+    @property
+    def resolutions(self):
+        return [level.resolution for level in self._levels]
+
+    def add(self, timestamp, values):
+        """Record one sample (Unix timestamp, one value per column)."""
+        with self._lock:
+            self._raw.append((timestamp, *values))
+            # Close every bucket the timestamp has moved past, finest first, feeding the next level
+            promoted = None
+            for level in self._levels:
+                key = int(timestamp // level.resolution)
+                if promoted is not None:
+                    level.pending.append(promoted)
+                    promoted = None
+                if level.key is not None and key != level.key:
+                    promoted = level.close()
+                level.key = key
+            self._levels[0].pending.append(values)
+
+    def raw(self, seconds=None, now=None):
+        """
+        Raw samples of the last ``seconds`` (all kept samples if None).
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray)
+            Timestamps and a samples x columns array of values, oldest first.
+        """
+        with self._lock:
+            rows = self._raw.last(self._raw.size)
+        if seconds is not None and len(rows):
+            end = rows[-1, 0] if now is None else now
+            rows = rows[rows[:, 0] > end - seconds]
+        return rows[:, 0], rows[:, 1:]
+
+    def rollup(self, resolution, seconds=None):
+        """
+        Closed buckets of one resolution, optionally only of the last ``seconds``.
+
+        Returns
+        -------
+        dict
+            "start" (bucket start times), "count" (samples per bucket) and
+            "min", "avg", "max", "p95" as buckets x columns arrays.
+        """
+        level = next((level for level in self._levels if level.resolution == resolution), None)
+        if level is None:
+            raise ValueError(f"No {resolution} s rollup; available: {self.resolutions}.")
+        with self._lock:
+            rows = level.ring.last(level.ring.size)
+        if seconds is not None and len(rows):
+            rows = rows[rows[:, 0] >= rows[-1, 0] + resolution - seconds]
+        n = len(self.columns)
+        result = {"start": rows[:, 0], "count": rows[:, 1]}
+        for index, name in enumerate(STATISTICS):
+            result[name] = rows[:, 2 + index * n:2 + (index + 1) * n]
+        return result
+
+    def summary(self, seconds=None):
+        """
+        min/avg/max/p95 per column over the last ``seconds`` (the whole run if None).
+
+        Uses the raw samples when they reach back far enough, otherwise the
+        finest rollup that does (without the newest, still open bucket).
+        Returns None before the first sample.
+        """
+        with self._lock:
+            raw = self._raw.last(self._raw.size)
+            wrapped = self._raw.next > self._raw.capacity
+        if not len(raw):
+            return None
+        end = raw[-1, 0]
+        if not wrapped or (seconds is not None and raw[0, 0] <= end - seconds):
+            if seconds is not None:
+                raw = raw[raw[:, 0] > end - seconds]
+            values = raw[:, 1:]
+            return {"min": values.min(axis=0), "avg": values.mean(axis=0), "max": values.max(axis=0),
+                    "p95": np.percentile(values, 95, axis=0), "count": len(values)}
+        for level in self._levels:
+            with self._lock:
+                level_wrapped = level.ring.next > level.ring.capacity
+                oldest = level.ring.last(level.ring.size)[:1, 0]
+            if not level_wrapped or (seconds is not None and len(oldest) and oldest[0] <= end - seconds):
+                return self._combine(self.rollup(level.resolution, seconds))
+        return self._combine(self.rollup(self._levels[-1].resolution, seconds))
+
+    def _combine(self, buckets):
+        counts = buckets["count"]
+        if not len(counts):
+            return None
+        total = counts.sum()
+        return {"min": buckets["min"].min(axis=0),
+                "avg": (buckets["avg"] * counts[:, None]).sum(axis=0) / total,
+                "max": buckets["max"].max(axis=0),
+                "p95": _weighted_percentile(buckets["p95"], counts, 95),
+                "count": int(total)}
@@ -0,0 +1,281 @@
+"""Buffered, rotating sample log shared by the monitoring tools.
+
+Opening, appending to and closing the CSV for every sample costs three
+syscalls per row and fragments the file on multi-day runs at 100 ms
+intervals. LogSink keeps the file open, collects rows in memory and writes
+them in one go every flush_interval seconds or flush_rows rows, whichever
+comes first. Files can be rotated every hour and/or at a size limit; the
+finished file is renamed with the time it was started, e.g.
+bandwidth.20250205-225307.csv, and the live file keeps its name.
+
+Besides CSV, the "bin" format writes fixed-width records of little-endian
+float64 (the Unix timestamp, then one value per column) after a one-line
+text header naming the columns. That is 8 bytes per value instead of ~10
+characters per formatted number plus a date string, needs no parsing, and
+read_log() loads it straight into a NumPy array.
+"""
+
+import csv
+import io
+import json
+import os
+import struct
+import time
+
+from perf_common.timing import clock
+
+BINARY_MAGIC = b"PTLOG1 "
+
+FORMATS = ("csv", "bin")
+ROTATIONS = (None, "hourly")
+
+
+class LogSink:
+    """
+    Append-only sample log with buffered writes and rotation.
+
+    Parameters
+    ----------
+    path : str
+        Live log file; appended to if it exists.
+    columns : list of str, optional
+        Value column names. Required for the bin format.
+    csv_header : bool
+        Write a ("Timestamp", *columns) header row to new CSV files.
+    fmt : str
+        "csv" or "bin".
+    precision : int, optional
+        CSV only: digits after the decimal point for float values. None writes
+        values as they are.
+    timestamp_digits : int
+        CSV only: fractional digits of the timestamps (3 for milliseconds);
+        0 writes whole seconds.
+    flush_interval : float
+        Seconds after which buffered rows are written.
+    flush_rows : int
+        Rows after which buffered rows are written.
+    rotate : str, optional
+        "hourly" to start a new file at every full hour (UTC).
+    rotate_bytes : int, optional
+        Start a new file once the live one reaches this size.
+    backups : int, optional
+        Rotated files to keep (oldest are deleted); None keeps all.
+
+    Rows are only written from write() and flush()/close(), so rows of an
+    idle log wait until the next write. Not thread-safe; use one sink per
+    writer thread.
+    """
+
+    def __init__(self, path, columns=None, fmt="csv", csv_header=True, precision=None, timestamp_digits=0,
+                 flush_interval=1.0, flush_rows=1000, rotate=None, rotate_bytes=None, backups=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown log format '{fmt}', expected one of {', '.join(FORMATS)}.")
+        if rotate not in ROTATIONS:
+            raise ValueError(f"Unknown rotation '{rotate}', expected 'hourly'.")
+        if fmt == "bin" and not columns:
+            raise ValueError("The bin log format needs column names.")
+        self.path = path
+        self.columns = list(columns) if columns else None
+        self.fmt = fmt
+        self.csv_header = csv_header and bool(columns)
+        self.precision = precision
+        self.timestamp_digits = timestamp_digits
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.rotate = rotate
+        self.rotate_bytes = rotate_bytes
+        self.backups = backups
+        self.rows = 0
+        self._pending = []
+        self._last_flush = clock()
+        self._file = None
+        self._started = None  # Unix time of the first row in the live file
+        self._hour = None
+        self._second = None
+        self._second_text = None
+        if fmt == "bin":
+            self._record = struct.Struct(f"<{1 + len(self.columns)}d")
+
+    def _open(self, timestamp):
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            if self.fmt == "bin":
+                self._file.write(BINARY_MAGIC + json.dumps(["timestamp"] + self.columns).encode() + b"\n")
+            elif self.csv_header:
+                self._file.write(self._encode_csv([["Timestamp"] + self.columns]))
+            self._started = timestamp
+        else:
+            # Appending to an earlier run's file: its start time is unknown, name it by its last write
+            self._started = os.path.getmtime(self.path)
+        self._hour = int(timestamp // 3600)
+
+    def _rotated_name(self):
+        root, ext = os.path.splitext(self.path)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started))
+        name = f"{root}.{stamp}{ext}"
+        counter = 1
+        while os.path.exists(name):
+            counter += 1
+            name = f"{root}.{stamp}-{counter}{ext}"
+        return name
+
+    def _roll(self):
+        self._file.close()
+        self._file = None
+        os.replace(self.path, self._rotated_name())
+        if self.backups is not None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            root, ext = os.path.splitext(os.path.basename(self.path))
+            rotated = sorted(name for name in os.listdir(directory)
+                             if name.startswith(root + ".") and name.endswith(ext) and name != os.path.basename(self.path))
+            for name in rotated[:max(0, len(rotated) - self.backups)]:
+                os.remove(os.path.join(directory, name))
+
+    def _timestamp_text(self, timestamp):
+        digits = self.timestamp_digits
+        if digits:
+            # Round once in integer units so .9996 becomes the next second, not "07.1000"
+            second, fraction = divmod(round(timestamp * 10 ** digits), 10 ** digits)
+        else:
+            second = int(timestamp)
+        if second != self._second:
+            self._second = second
+            self._second_text = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+        if digits:
+            return f"{self._second_text}.{fraction:0{digits}d}"
+        return self._second_text
+
+    def _encode_csv(self, rows):
+        text = io.StringIO()
+        csv.writer(text).writerows(rows)
+        return text.getvalue().encode("utf-8")
+
+    def write(self, timestamp, values):
+        """
+        Queue one row.
+
+        Parameters
+        ----------
+        timestamp : float
+            Unix time of the sample (time.time()).
+        values : sequence of float
+            One value per column.
+        """
+        if self.fmt == "bin":
+            self._pending.append(self._record.pack(timestamp, *values))
+        else:
+            if self.precision is not None:
+                values = [f"{value:.{self.precision}f}" if isinstance(value, float) else value for value in values]
+            self._pending.append((timestamp, [self._timestamp_text(timestamp), *values]))
+        if len(self._pending) >= self.flush_rows or clock() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _timestamp(self, item):
+        return struct.unpack_from("<d", item)[0] if self.fmt == "bin" else item[0]
+
+    def _write_pending(self, items):
+        if not items:
+            return
+        if self.fmt == "bin":
+            self._file.write(b"".join(items))
+        else:
+            self._file.write(self._encode_csv([row for _, row in items]))
+
+    def flush(self):
+        """Write all buffered rows to disk."""
+        pending = self._pending
+        self._pending = []
+        self._last_flush = clock()
+        if not pending:
+            return
+        first = 0
+        if self._file is None:
+            self._open(self._timestamp(pending[0]))
+        if self.rotate == "hourly":
+            for index, item in enumerate(pending):
+                timestamp = self._timestamp(item)
+                if int(timestamp // 3600) != self._hour:
+                    self._write_pending(pending[first:index])
+                    first = index
+                    self._roll()
+                    self._open(timestamp)
+        self._write_pending(pending[first:])
+        self.rows += len(pending)
+        self._file.flush()
+        if self.rotate_bytes is not None and self._file.tell() >= self.rotate_bytes:
+            self._roll()
+
+    def close(self):
+        """Flush and close the live file."""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def add_log_arguments(parser):
+    """Add the --log-format/--flush-interval/--rotate/--rotate-mb/--backups options to an ArgumentParser."""
+    parser.add_argument("--log-format", choices=FORMATS, default="csv",
+                        help="Output file format: csv, or bin for compact fixed-width float64 records "
+                             "(load with perf_common.log_sink.read_log) (default: csv)")
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        help="Seconds between writes of buffered rows to the output file (default: 1.0)")
+    parser.add_argument("--rotate", choices=["hourly"], default=None,
+                        help="Start a new output file every hour; finished files get their start time in the name")
+    parser.add_argument("--rotate-mb", type=float, default=None,
+                        help="Start a new output file once it reaches this size in MB")
+    parser.add_argument("--backups", type=int, default=None,
+                        help="Number of rotated files to keep (default: all)")
+
+
+def log_options(args):
+    """LogSink keyword arguments from the add_log_arguments() options."""
+    return {
+        "fmt": args.log_format,
+        "flush_interval": args.flush_interval,
+        "rotate": args.rotate,
+        "rotate_bytes": int(args.rotate_mb * 1024 * 1024) if args.rotate_mb else None,
+        "backups": args.backups,
+    }
+
+
+def read_log(path, mmap=False):
+    """
+    Load a bin-format log.
+
+    Parameters
+    ----------
+    path : str
+        File written by LogSink(fmt="bin").
+    mmap : bool
+        Memory-map the records instead of reading them, for logs larger than
+        memory; rows are then only read from disk when accessed.
+
+    Returns
+    -------
+    (list of str, numpy.ndarray)
+        Column names (starting with "timestamp") and a rows x columns float64
+        array. A record cut short by a crash is ignored.
+    """
+    import numpy as np
+
+    with open(path, "rb") as file:
+        header = file.readline()
+        if not header.startswith(BINARY_MAGIC):
+            raise ValueError(f"'{path}' is not a bin-format log.")
+        columns = json.loads(header[len(BINARY_MAGIC):])
+        if mmap:
+            rows = (os.path.getsize(path) - len(header)) // (8 * len(columns))
+            if not rows:
+                return columns, np.zeros((0, len(columns)))
+            return columns, np.memmap(path, dtype="<f8", mode="r", offset=len(header), shape=(rows, len(columns)))
+        data = file.read()
+    width = 8 * len(columns)
+    records = np.frombuffer(data, dtype="<f8", count=len(data) // width * len(columns))
+    return columns, records.reshape(-1, len(columns))
@@ -0,0 +1,385 @@
+"""Per-process attribution of network traffic.
+
+Interface counters say how much traffic there was, not who caused it. On
+Linux, SockDiagReader asks the kernel for every TCP socket over a netlink
+sock_diag dump (what ``ss -ti`` uses), which carries each socket's
+cumulative bytes acknowledged (sent) and received from tcp_info along with
+its inode. SocketOwners maps inodes to PIDs through the socket:[inode] links
+in /proc/<pid>/fd and keeps that map between samples: only sockets it has
+not seen before trigger a lookup, which checks new processes and processes
+that already own sockets before falling back to a (rate-limited) scan of
+every process. Bytes of sockets that closed during an interval, UDP traffic
+(QUIC, RDP's UDP transport) and protocol overhead are not per socket; they
+show up as the difference to the interface total, reported as unattributed.
+
+Elsewhere, PsutilConnectionsReader splits the interface total between the
+processes in proportion to their open connections from
+psutil.net_connections(). That only says who is talking, not how much, and
+samples produced from it are flagged as estimated.
+
+ProcessTrafficSampler runs either reader on the BandwidthSampler thread and
+publishes ProcessTrafficSamples, whose top(n) lists the busiest processes.
+"""
+
+import os
+import socket
+import struct
+import sys
+
+import psutil
+
+from perf_common.bandwidth_sampler import BandwidthSampler
+from perf_common.net_counters import open_counter_reader
+from perf_common.timing import clock
+
+# netlink / sock_diag constants (linux/netlink.h, linux/sock_diag.h, linux/inet_diag.h)
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+INET_DIAG_INFO = 2
+TCP_LISTEN = 10
+TCP_TIME_WAIT = 6
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_REQUEST = struct.Struct("=BBBBI48x")  # inet_diag_req_v2 with an empty inet_diag_sockid
+_RTATTR = struct.Struct("=HH")
+_MSG_SIZE = 72  # sizeof(struct inet_diag_msg)
+_MSG_COOKIE = 44  # sockid.idiag_cookie
+_MSG_INODE = 68
+_TCPI_BYTES = 120  # tcpi_bytes_acked, then tcpi_bytes_received (Linux 4.2+)
+
+# Every TCP state except LISTEN (never carries data) and TIME_WAIT (no socket left)
+_STATES = ((1 << 12) - 1) & ~(1 << TCP_LISTEN) & ~(1 << TCP_TIME_WAIT)
+
+
+class SocketOwners:
+    """
+    Cached socket inode -> PID map built from /proc/<pid>/fd.
+
+    Parameters
+    ----------
+    rescan_interval : float
+        Minimum seconds between scans of every process for inodes that the
+        cheaper lookups did not find (sockets of other users' processes,
+        which are not readable without root, would otherwise cause a full
+        scan on every sample).
+    proc : str
+        procfs mount point.
+    """
+
+    def __init__(self, rescan_interval=5.0, proc="/proc"):
+        self.rescan_interval = rescan_interval
+        self.proc = proc
+        self.owners = {}
+        self._pids = set()  # processes seen by the last lookup
+        self._socket_pids = set()  # processes that owned a socket when last scanned
+        self._last_full_scan = None
+
+    def _scan(self, pid, missing):
+        """Record the sockets of one process; return True if it owns any."""
+        directory = f"{self.proc}/{pid}/fd"
+        try:
+            fds = os.listdir(directory)
+        except OSError:
+            return False  # exited, or belongs to another user
+        found = False
+        for fd in fds:
+            try:
+                target = os.readlink(f"{directory}/{fd}")
+            except OSError:
+                continue
+            if target.startswith("socket:["):
+                inode = int(target[8:-1])
+                self.owners[inode] = pid
+                missing.discard(inode)
+                found = True
+        return found
+
+    def lookup(self, inodes):
+        """
+        Owners of the given socket inodes.
+
+        Returns
+        -------
+        dict
+            inode -> PID for every inode that could be resolved. Inodes that
+            are no longer passed in are dropped from the cache.
+        """
+        owners = self.owners
+        self.owners = {inode: owners[inode] for inode in inodes if inode in owners}
+        missing = {inode for inode in inodes if inode not in self.owners}
+        if missing:
+            self._refresh(missing)
+        return self.owners
+
+    def _refresh(self, missing):
+        pids = {int(name) for name in os.listdir(self.proc) if name.isdigit()}
+        new = pids - self._pids
+        self._pids = pids
+        self._socket_pids &= pids
+        # New sockets mostly come from new processes or from processes that already use the network
+        for candidates in (new, set(self._socket_pids)):
+            for pid in candidates:
+                if self._scan(pid, missing):
+                    self._socket_pids.add(pid)
+                if not missing:
+                    return
+        now = clock()
+        if self._last_full_scan is not None and now - self._last_full_scan < self.rescan_interval:
+            return
+        self._last_full_scan = now
+        for pid in pids - new - self._socket_pids:
+            if self._scan(pid, missing):
+                self._socket_pids.add(pid)
+            if not missing:
+                return
+
+
+class SockDiagReader:
+    """
+    Linux per-socket TCP byte counters from a netlink sock_diag dump.
+
+    read() returns a snapshot for attribute(): the interface totals and, per
+    socket, (PID or None, bytes sent, bytes received) since it was opened.
+    Sockets whose owner cannot be found (e.g. other users' processes when
+    not running as root) have PID None.
+    """
+
+    estimated = False
+
+    def __init__(self, owners=None):
+        self.owners = owners or SocketOwners()
+        self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_SOCK_DIAG)
+        self._buffer = bytearray(256 * 1024)
+        self._sequence = 0
+        self._totals = open_counter_reader()
+
+    def _dump(self, family, sockets):
+        """Add (inode, sent, received) of every TCP socket of one address family, keyed by cookie."""
+        self._sequence += 1
+        request = _NLMSGHDR.pack(_NLMSGHDR.size + _REQUEST.size, SOCK_DIAG_BY_FAMILY, NLM_F_REQUEST | NLM_F_DUMP,
+                                 self._sequence, 0)
+        request += _REQUEST.pack(family, socket.IPPROTO_TCP, 1 << (INET_DIAG_INFO - 1), 0, _STATES)
+        self._socket.send(request)
+        buffer = self._buffer
+        unpack_header = _NLMSGHDR.unpack_from
+        unpack_attribute = _RTATTR.unpack_from
+        while True:
+            length = self._socket.recv_into(buffer)
+            offset = 0
+            while offset + _NLMSGHDR.size <= length:
+                message_length, message_type, _, _, _ = unpack_header(buffer, offset)
+                if message_type == NLMSG_DONE:
+                    return
+                if message_type == NLMSG_ERROR:
+                    error = -struct.unpack_from("=i", buffer, offset + _NLMSGHDR.size)[0]
+                    raise OSError(error, f"sock_diag: {os.strerror(error)}")
+                body = offset + _NLMSGHDR.size
+                cookie = struct.unpack_from("=Q", buffer, body + _MSG_COOKIE)[0]
+                inode = struct.unpack_from("=I", buffer, body + _MSG_INODE)[0]
+                attribute = body + _MSG_SIZE
+                end = offset + message_length
+                while attribute + _RTATTR.size <= end:
+                    attribute_length, attribute_type = unpack_attribute(buffer, attribute)
+                    if attribute_length < _RTATTR.size:
+                        break
+                    if attribute_type == INET_DIAG_INFO and attribute_length >= _RTATTR.size + _TCPI_BYTES + 16:
+                        sent, received = struct.unpack_from("=QQ", buffer, attribute + _RTATTR.size + _TCPI_BYTES)
+                        sockets[(family, cookie)] = (inode, sent, received)
+                        break
+                    attribute += (attribute_length + 3) & ~3
+                offset += (message_length + 3) & ~3
+
+    def read(self):
+        sockets = {}
+        self._dump(socket.AF_INET, sockets)
+        self._dump(socket.AF_INET6, sockets)
+        owners = self.owners.lookup([inode for inode, _, _ in sockets.values() if inode])
+        counters = {key: (owners.get(inode), sent, received) for key, (inode, sent, received) in sockets.items()}
+        return self._totals.read(), counters
+
+    def attribute(self, before, after):
+        """
+        Traffic per PID between two read() snapshots.
+
+        Returns
+        -------
+        (dict, int, int)
+            PID -> [bytes sent, bytes received], and the interface bytes sent
+            and received during the interval.
+        """
+        (sent_before, recv_before), old = before
+        (sent_after, recv_after), new = after
+        processes = {}
+        for key, (pid, sent, received) in new.items():
+            previous = old.get(key)
+            if previous is not None:
+                # A socket that lost its owner (closed by the process, still flushing) stays with it
+                if pid is None:
+                    pid = previous[0]
+                sent -= previous[1]
+                received -= previous[2]
+            # else: opened during the interval, all of its bytes are new
+            if sent > 0 or received > 0:
+                usage = processes.setdefault(pid, [0, 0])
+                usage[0] += max(0, sent)
+                usage[1] += max(0, received)
+        return processes, max(0, sent_after - sent_before), max(0, recv_after - recv_before)
+
+    def close(self):
+        self._socket.close()
+        self._totals.close()
+
+
+class PsutilConnectionsReader:
+    """
+    Fallback: splits the interface total by each process's share of open connections.
+
+    psutil.net_connections() needs administrator rights on macOS and may
+    miss other users' processes on Windows without them.
+    """
+
+    estimated = True
+
+    def __init__(self):
+        self._totals = open_counter_reader()
+
+    def read(self):
+        connections = {}
+        try:
+            for connection in psutil.net_connections(kind="inet"):
+                if connection.pid and (connection.raddr or connection.type == socket.SOCK_DGRAM):
+                    connections[connection.pid] = connections.get(connection.pid, 0) + 1
+        except psutil.AccessDenied as e:
+            raise OSError(f"Listing connections needs administrator rights: {e}") from None
+        return self._totals.read(), connections
+
+    def attribute(self, before, after):
+        """As SockDiagReader.attribute(); the shares are estimates."""
+        (sent_before, recv_before), _ = before
+        (sent_after, recv_after), connections = after
+        sent = max(0, sent_after - sent_before)
+        received = max(0, recv_after - recv_before)
+        total = sum(connections.values())
+        processes = {}
+        if total and (sent or received):
+            for pid, count in connections.items():
+                processes[pid] = [sent * count // total, received * count // total]
+        return processes, sent, received
+
+    def close(self):
+        self._totals.close()
+
+
+def open_process_reader():
+    """SockDiagReader on Linux, PsutilConnectionsReader elsewhere or when netlink is unavailable."""
+    if sys.platform.startswith("linux"):
+        try:
+            return SockDiagReader()
+        except OSError:
+            pass
+    return PsutilConnectionsReader()
+
+
+class ProcessTrafficSample:
+    """
+    Traffic per process over one sampling interval.
+
+    Attributes
+    ----------
+    timestamp, elapsed : float
+        As in BandwidthSample.
+    processes : dict
+        PID (None for sockets without a known owner) -> (bytes sent, bytes received).
+    names : dict
+        PID -> process name.
+    bytes_sent, bytes_recv : int
+        Interface totals over the interval.
+    estimated : bool
+        True when the split between processes is approximate (see PsutilConnectionsReader).
+    """
+
+    __slots__ = ("timestamp", "elapsed", "processes", "names", "bytes_sent", "bytes_recv", "estimated")
+
+    def __init__(self, timestamp, elapsed, processes, names, bytes_sent, bytes_recv, estimated=False):
+        self.timestamp = timestamp
+        self.elapsed = elapsed
+        self.processes = processes
+        self.names = names
+        self.bytes_sent = bytes_sent
+        self.bytes_recv = bytes_recv
+        self.estimated = estimated
+
+    @property
+    def unattributed(self):
+        """(bytes sent, bytes received) of the interface total not assigned to any socket."""
+        sent = sum(usage[0] for usage in self.processes.values())
+        received = sum(usage[1] for usage in self.processes.values())
+        return max(0, self.bytes_sent - sent), max(0, self.bytes_recv - received)
+
+    def top(self, count=10):
+        """
+        The count busiest processes.
+
+        Returns
+        -------
+        list of (pid, name, upload rate, download rate)
+            Rates in bytes per second, busiest (sent + received) first.
+        """
+        elapsed = self.elapsed if self.elapsed > 0 else 1.0
+        busiest = sorted(self.processes.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)[:count]
+        return [(pid, self.names.get(pid, "?"), sent / elapsed, received / elapsed)
+                for pid, (sent, received) in busiest]
+
+
+class ProcessTrafficSampler(BandwidthSampler):
+    """
+    Samples per-process traffic on a background thread and publishes ProcessTrafficSamples.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between samples. A sock_diag dump costs about a millisecond
+        per thousand sockets, so intervals below 0.5 s rarely make sense.
+    reader : object, optional
+        SockDiagReader or PsutilConnectionsReader; defaults to open_process_reader().
+    scheduler : Scheduler, optional
+        As for BandwidthSampler.
+
+    Counters cover all interfaces: sockets are not bound to one.
+    """
+
+    def __init__(self, interval=1.0, reader=None, scheduler=None):
+        super().__init__(interval, reader=reader, scheduler=scheduler)
+        self._names = {}
+        self._reader = None
+
+    def _open_reader(self):
+        return open_process_reader()
+
+    def _read(self, reader):
+        self._reader = reader
+        return reader.read()
+
+    def _name(self, pid):
+        name = self._names.get(pid)
+        if name is None:
+            try:
+                name = psutil.Process(pid).name()
+            except psutil.Error:
+                name = "?"
+            self._names[pid] = name
+        return name
+
+    def _make_sample(self, timestamp, elapsed, before, after):
+        processes, sent, received = self._reader.attribute(before, after)
+        names = {pid: self._name(pid) for pid in processes if pid is not None}
+        names[None] = "(unknown owner)"
+        # PIDs get reused; forget names of processes without traffic this interval
+        self._names = {pid: self._names[pid] for pid in names if pid in self._names}
+        processes = {pid: tuple(usage) for pid, usage in processes.items()}
+        return ProcessTrafficSample(timestamp, elapsed, processes, names, sent, received,
+                                    self._reader.estimated)
@@ -0,0 +1,242 @@
+"""Drift-free periodic scheduler shared by the samplers.
+
+"Do the work, then sleep(interval)" makes every period interval plus the
+time the work took, so after a day at 1 s the samples of one tool are
+minutes away from those of another. Scheduler runs any number of periodic
+jobs on one thread against absolute deadlines of the monotonic clock: tick k
+of a job is due at start + k * interval whatever the previous ticks cost.
+
+By default the first tick is aligned to a multiple of the interval in wall-
+clock time (a 1 s job ticks on whole seconds), so jobs with the same interval
+tick together, in this process and in other tools started at a different
+time. Ticks that cannot be kept (the machine was suspended, a callback ran
+longer than the interval) are skipped, not run in a burst, and counted as
+missed; only the latest one runs, late, so a slow job cannot starve the
+others. Each job records how late its ticks started (jitter) for stats().
+
+Callbacks run on the scheduler thread one after the other, so they must be
+short (read a counter, queue the result); a slow one delays the others.
+
+Example
+-------
+    with Scheduler() as scheduler:
+        encoder = scheduler.add(sample_encoder, 1.0)
+        decoder = scheduler.add(sample_decoder, 1.0)
+        ...
+    print(encoder.stats())   # {"ticks": 86400, "missed": 0, "mean": 0.0001, "p99": 0.0004, "max": 0.002}
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+from perf_common.timing import clock, enable_high_resolution_timer
+
+# Shortest supported interval in seconds
+MIN_INTERVAL = 0.01
+
+# Tick latenesses kept per job for the p99 in stats()
+JITTER_HISTORY = 1000
+
+
+class Job:
+    """
+    A periodic callback registered with Scheduler.add().
+
+    Attributes
+    ----------
+    ticks : int
+        Times the callback ran.
+    missed : int
+        Ticks skipped because the scheduler fell behind by a whole interval.
+    error : Exception or None
+        Exception raised by the callback; the job is cancelled when it is set.
+    """
+
+    def __init__(self, scheduler, callback, interval, name):
+        self.scheduler = scheduler
+        self.callback = callback
+        self.interval = interval
+        self.name = name
+        self.ticks = 0
+        self.missed = 0
+        self.error = None
+        self.cancelled = False
+        self.origin = None  # monotonic time of tick 0
+        self.index = 0
+        self._lateness = deque(maxlen=JITTER_HISTORY)
+        self._total_lateness = 0.0
+        self._max_lateness = 0.0
+
+    @property
+    def deadline(self):
+        """Monotonic time the next tick is due (computed from tick 0, so rounding never accumulates)."""
+        return self.origin + self.index * self.interval
+
+    def _record(self, lateness):
+        self.ticks += 1
+        self._lateness.append(lateness)
+        self._total_lateness += lateness
+        if lateness > self._max_lateness:
+            self._max_lateness = lateness
+
+    def stats(self):
+        """
+        Tick counts and jitter.
+
+        Returns
+        -------
+        dict
+            "ticks", "missed", and "mean", "p99" (over the last JITTER_HISTORY
+            ticks) and "max" lateness of the ticks in seconds.
+        """
+        recent = sorted(self._lateness)
+        return {
+            "ticks": self.ticks,
+            "missed": self.missed,
+            "mean": self._total_lateness / self.ticks if self.ticks else 0.0,
+            "p99": recent[min(len(recent) - 1, int(0.99 * len(recent)))] if recent else 0.0,
+            "max": self._max_lateness,
+        }
+
+    def cancel(self):
+        """Stop running the job; waits for a tick in progress unless called from the job itself."""
+        self.scheduler.remove(self)
+
+
+class Scheduler:
+    """
+    Runs periodic jobs on one thread at absolute monotonic deadlines.
+
+    Parameters
+    ----------
+    name : str
+        Name of the scheduler thread.
+
+    Jobs can be added and removed before start() and while running.
+    """
+
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self._jobs = []  # heap of (deadline, sequence, job)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running_job = None
+        self._stopping = False
+        self._thread = None
+
+    def add(self, callback, interval, align=True, name=None):
+        """
+        Call callback() every interval seconds.
+
+        Parameters
+        ----------
+        callback : callable
+            Called without arguments on the scheduler thread. An exception
+            cancels the job and is kept in job.error.
+        interval : float
+            Seconds between ticks (at least MIN_INTERVAL).
+        align : bool
+            Start on a wall-clock multiple of the interval, so jobs with the
+            same interval tick together; otherwise one interval from now.
+        name : str, optional
+            For messages; defaults to the callback's name.
+
+        Returns
+        -------
+        Job
+        """
+        if interval < MIN_INTERVAL:
+            raise ValueError(f"Interval must be at least {MIN_INTERVAL} s.")
+        job = Job(self, callback, interval, name or getattr(callback, "__name__", "job"))
+        job.origin = clock() + (interval - time.time() % interval if align else interval)
+        if interval < 0.05:
+            enable_high_resolution_timer()
+        with self._condition:
+            heapq.heappush(self._jobs, (job.deadline, next(self._sequence), job))
+            self._condition.notify_all()
+        return job
+
+    def remove(self, job):
+        """Cancel a job (see Job.cancel())."""
+        with self._condition:
+            job.cancelled = True
+            if threading.current_thread() is not self._thread:
+                while self._running_job is job:
+                    self._condition.wait()
+
+    @property
+    def jobs(self):
+        """Jobs that are not cancelled, in deadline order."""
+        with self._condition:
+            return [job for _, _, job in sorted(self._jobs) if not job.cancelled]
+
+    def _run(self):
+        jobs = self._jobs
+        with self._condition:
+            while not self._stopping:
+                if not jobs:
+                    self._condition.wait()
+                    continue
+                deadline, _, job = jobs[0]
+                if job.cancelled:
+                    heapq.heappop(jobs)
+                    continue
+                now = clock()
+                if now < deadline:
+                    # Woken early by add()/stop() or a spurious wakeup: the loop re-checks
+                    self._condition.wait(deadline - now)
+                    continue
+                heapq.heappop(jobs)
+                lateness = now - deadline
+                if lateness >= job.interval:
+                    # Fell behind (suspend, slow callback): skip the lost ticks, run the latest one now
+                    skipped = int(lateness / job.interval)
+                    job.missed += skipped
+                    job.index += skipped
+                    lateness = now - job.deadline
+                self._running_job = job
+                self._condition.release()
+                try:
+                    job.callback()
+                except Exception as e:
+                    job.error = e
+                    job.cancelled = True
+                finally:
+                    self._condition.acquire()
+                    self._running_job = None
+                    self._condition.notify_all()
+                job._record(lateness)
+                if not job.cancelled:
+                    job.index += 1
+                    heapq.heappush(jobs, (job.deadline, next(self._sequence), job))
+
+    def start(self):
+        with self._condition:
+            self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the thread after the tick in progress; jobs stay registered for a later start()."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def format_stats(stats):
+    """One-line summary of Job.stats() with the jitter in milliseconds."""
+    return (f"{stats['ticks']} ticks, {stats['missed']} missed, jitter mean {stats['mean'] * 1000:.2f} ms, "
+            f"p99 {stats['p99'] * 1000:.2f} ms, max {stats['max'] * 1000:.2f} ms")
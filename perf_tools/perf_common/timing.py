@@ -0,0 +1,22 @@
+"""Clock and timer helpers shared by the samplers and the throttle tool."""
+
+import sys
+import time
+
+# Monotonic, high resolution clock used for all sampling deadlines
+clock = time.perf_counter
+
+
+def enable_high_resolution_timer():
+    """
+    Ask Windows for 1 ms timer resolution (the default is ~15.6 ms).
+
+    This makes sleeps and timed waits wake close to their deadline, which
+    sampling intervals below a few tens of milliseconds and packet pacing
+    both need. It is a no-op on other platforms.
+    """
+    if sys.platform != "win32":
+        return
+    import ctypes
+
+    ctypes.WinDLL("winmm").timeBeginPeriod(1)
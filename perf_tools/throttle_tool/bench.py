@@ -0,0 +1,212 @@
+"""Packets-per-second benchmark for the shaping pipeline.
+
+Drives the shaping engine with synthetic packets from the in-memory backend
+and reports, per scenario:
+
+- throughput (packets and bytes per second actually re-injected)
+- CPU cost per packet (process CPU time / packets received)
+- added latency percentiles (send time minus generation time)
+- peak resident memory, queue depth and garbage collector runs
+
+Results can be saved as JSON so runs on the build agents can be compared.
+
+Example
+-------
+    python bench.py --packets 200000 --sizes 64:0.3,576:0.2,1400:0.5 --output bench.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+from array import array
+
+from impairment import ImpairmentStage
+from packet_backend import MemoryBackend, clock
+from shaper import DEFAULT_BATCH, LatencyStage, LossStage, RateLimitStage, ShapingEngine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Rate limit used when the rate stage should not be the bottleneck (10 Gbit/s)
+UNLIMITED_RATE = 10 * 1000 * 1000 * 1000 // 8
+
+SCENARIOS = {
+    "passthrough": lambda args: [],
+    "drop": lambda args: [LossStage(2, seed=args.seed)],
+    "rate": lambda args: [RateLimitStage(args.rate or UNLIMITED_RATE)],
+    "latency": lambda args: [LatencyStage(args.latency)],
+    "impair": lambda args: [ImpairmentStage(delay_ms=args.latency, jitter_ms=args.latency / 4,
+                                            distribution="normal", loss=1, seed=args.seed)],
+    "rdp": lambda args: [LossStage(2, seed=args.seed), RateLimitStage(args.rate or UNLIMITED_RATE),
+                         LatencyStage(args.latency)],
+}
+
+
+class BenchBackend(MemoryBackend):
+    """MemoryBackend that keeps only each packet's added delay instead of the packet."""
+
+    def __init__(self, **kwargs):
+        super().__init__(record=False, **kwargs)
+        self.delays = array("d")
+
+    def send(self, packet):
+        self.delays.append(clock() - packet.created)
+        self.sent_packets += 1
+        self.sent_bytes += len(packet.raw)
+
+    def send_batch(self, packets):
+        now = clock()
+        self.delays.extend([now - packet.created for packet in packets])
+        self.sent_packets += len(packets)
+        self.sent_bytes += sum(len(packet.raw) for packet in packets)
+
+    def send_raw(self, raw, outbound, interface):
+        # Buffer-pool sends carry no creation time, so no latency sample here
+        self.sent_packets += 1
+        self.sent_bytes += len(raw)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentiles(values, points):
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{point}": None for point in points}
+    last = len(ordered) - 1
+    return {f"p{point}": ordered[min(last, int(round(point / 100.0 * last)))] for point in points}
+
+
+def run_scenario(name, args):
+    """Run one scenario and return its result dictionary."""
+    backend = BenchBackend(packets_per_second=args.pps, count=args.packets,
+                           sizes=args.sizes, seed=args.seed)
+    stages = SCENARIOS[name](args)
+
+    gc_start = sum(stats["collections"] for stats in gc.get_stats())
+    cpu_start = time.process_time()
+    wall_start = clock()
+    with backend:
+        engine = ShapingEngine(backend, stages, fair=args.fair, batch_size=args.batch,
+                               pool_bytes=args.pool)
+        engine.run()
+    wall = clock() - wall_start
+    cpu = time.process_time() - cpu_start
+    gc_runs = sum(stats["collections"] for stats in gc.get_stats()) - gc_start
+
+    queue = engine.queue.stats()
+    delays_ms = percentiles(backend.delays, (50, 90, 99, 99.9))
+    return {
+        "scenario": name,
+        "stages": [stage.describe() for stage in stages],
+        "packets_generated": backend.generated,
+        "packets_sent": backend.sent_packets,
+        "packets_dropped": engine.dropped,
+        "packets_tail_dropped": queue["tail_drops"],
+        "wall_seconds": wall,
+        "throughput_pps": backend.sent_packets / wall if wall else None,
+        "throughput_bytes_per_second": backend.sent_bytes / wall if wall else None,
+        "offered_pps": backend.generated / wall if wall else None,
+        "cpu_us_per_packet": cpu / backend.generated * 1e6 if backend.generated else None,
+        "added_latency_ms": {key: value * 1000 if value is not None else None
+                             for key, value in delays_ms.items()},
+        "release_error": engine.delay_line.lateness.summary_ms(),
+        "max_queue_packets": queue["max_depth_packets"],
+        "peak_rss_bytes": peak_rss_bytes(),
+        "gc_collections": gc_runs,
+    }
+
+
+def parse_sizes(text):
+    """Parse "1200" or a weighted mix "64:0.3,576:0.2,1500:0.5"."""
+    sizes = []
+    for part in text.split(","):
+        size, _, weight = part.partition(":")
+        sizes.append((int(size), float(weight or 1)))
+    return sizes
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the shaping pipeline with synthetic packets.")
+    parser.add_argument("-s", "--scenarios", type=lambda text: text.split(","),
+                        default=list(SCENARIOS),
+                        help=f"Comma-separated scenarios (default: all of {','.join(SCENARIOS)})")
+    parser.add_argument("-n", "--packets", type=int, default=100000,
+                        help="Packets per scenario (default: 100000)")
+    parser.add_argument("--sizes", type=parse_sizes, default=parse_sizes("64:0.3,576:0.2,1400:0.5"),
+                        help="Packet size mix SIZE[:WEIGHT],... (default: 64:0.3,576:0.2,1400:0.5)")
+    parser.add_argument("--pps", type=float, default=None,
+                        help="Offered load in packets per second (default: as fast as possible)")
+    parser.add_argument("--rate", type=int, default=None,
+                        help="Rate limit in bytes per second for rate scenarios (default: 10 Gbit/s)")
+    parser.add_argument("--latency", type=float, default=20,
+                        help="Latency in milliseconds for latency scenarios (default: 20)")
+    parser.add_argument("--fair", action="store_true",
+                        help="Use the fair queue instead of the FIFO queue")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH,
+                        help=f"Packets per recv/send batch (default: {DEFAULT_BATCH})")
+    parser.add_argument("--pool", type=int, default=None, metavar="BYTES",
+                        help="Hold delayed packets in a preallocated buffer of this size (added latency "
+                             "is then not measured; see release_error)")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Random seed (default: 1)")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Write results as JSON to this path")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    args = parse_arguments()
+    results = []
+    for name in args.scenarios:
+        result = run_scenario(name, args)
+        results.append(result)
+        latency = result["added_latency_ms"]
+        if latency["p50"] is None:
+            latency_text = "latency n/a"
+        else:
+            latency_text = f"latency p50 {latency['p50']:.3f} ms p99 {latency['p99']:.3f} ms"
+        print(f"{name:12s} {result['throughput_pps']:>10.0f} pps  "
+              f"{result['cpu_us_per_packet']:>7.2f} us/pkt  {latency_text}  "
+              f"tail drops {result['packets_tail_dropped']}  gc runs {result['gc_collections']}")
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {
+                "packets": args.packets,
+                "sizes": args.sizes,
+                "pps": args.pps,
+                "rate": args.rate,
+                "latency_ms": args.latency,
+                "fair": args.fair,
+                "batch": args.batch,
+                "pool": args.pool,
+                "seed": args.seed,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
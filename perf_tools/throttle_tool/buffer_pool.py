@@ -0,0 +1,231 @@
+"""Preallocated packet storage for the delay line.
+
+With a constant delay, every packet lives for the full latency: 200 ms at
+50k packets/s means 10k packet objects alive at once, all churning through
+the garbage collector. PacketRing instead copies each packet's bytes into
+one preallocated bytearray slab and keeps its metadata (release time, slab
+offset, length, direction, interface) in fixed-size typed arrays. Queued
+packets then cost a fixed footprint and no allocations; a packet is handed
+to the backend as a memoryview of the slab when it is due.
+
+Packets are stored and released in FIFO order, so this only replaces the
+FifoDelayLine (order-preserving pipelines). Pipelines that reorder keep the
+heap-based DelayLine.
+"""
+
+import threading
+from array import array
+
+from packet_backend import clock
+from pacing import SPIN_SECONDS, wait_until
+from telemetry import Histogram
+
+DEFAULT_POOL_BYTES = 16 * 1024 * 1024
+DEFAULT_POOL_PACKETS = 65536
+
+
+class PacketRing:
+    """
+    FIFO of packets stored in a preallocated slab.
+
+    Not thread-safe by itself; RingDelayLine serializes access.
+
+    Parameters
+    ----------
+    capacity_bytes : int
+        Slab size. Each packet occupies its length, contiguously.
+    max_packets : int
+        Number of metadata slots.
+    """
+
+    def __init__(self, capacity_bytes=DEFAULT_POOL_BYTES, max_packets=DEFAULT_POOL_PACKETS):
+        self.capacity_bytes = capacity_bytes
+        self.max_packets = max_packets
+        self.slab = bytearray(capacity_bytes)
+        self.view = memoryview(self.slab)
+        self.release = array("d", bytes(8 * max_packets))
+        self.offset = array("L", [0]) * max_packets
+        self.length = array("L", [0]) * max_packets
+        self.outbound = array("B", bytes(max_packets))
+        self.if_idx = array("L", [0]) * max_packets
+        self.sub_if_idx = array("L", [0]) * max_packets
+        self.head = 0  # oldest slot
+        self.count = 0
+        self.bytes = 0
+        self._write = 0  # next free slab offset
+
+    def __len__(self):
+        return self.count
+
+    def _allocate(self, size):
+        """Slab offset for a packet of size bytes, or None if it does not fit."""
+        if not self.count:
+            self._write = 0
+            return 0 if size <= self.capacity_bytes else None
+        start = self.offset[self.head]
+        write = self._write
+        if write > start:
+            if write + size <= self.capacity_bytes:
+                return write
+            # Skip the slab's tail and wrap around, if the oldest packet leaves room
+            return 0 if size < start else None
+        return write if write + size < start else None
+
+    def push(self, release, raw, outbound, interface):
+        """Copy a packet in. Returns False when the slab or the slots are full."""
+        size = len(raw)
+        if self.count >= self.max_packets:
+            return False
+        offset = self._allocate(size)
+        if offset is None:
+            return False
+        self.view[offset:offset + size] = raw
+        slot = (self.head + self.count) % self.max_packets
+        self.release[slot] = release
+        self.offset[slot] = offset
+        self.length[slot] = size
+        self.outbound[slot] = outbound
+        self.if_idx[slot], self.sub_if_idx[slot] = interface
+        self.count += 1
+        self.bytes += size
+        self._write = offset + size
+        return True
+
+    def slot(self, index):
+        """Slot number of the index-th oldest packet."""
+        return (self.head + index) % self.max_packets
+
+    def packet(self, slot):
+        """The packet bytes of a slot, as a memoryview of the slab (valid until discarded)."""
+        offset = self.offset[slot]
+        return self.view[offset:offset + self.length[slot]]
+
+    def truncate(self, keep):
+        """Drop all but the keep oldest packets."""
+        while self.count > keep:
+            self.count -= 1
+            self.bytes -= self.length[self.slot(self.count)]
+        if self.count:
+            last = self.slot(self.count - 1)
+            self._write = self.offset[last] + self.length[last]
+
+    def discard(self, count):
+        """Free the count oldest packets."""
+        length = self.length
+        for _ in range(count):
+            self.bytes -= length[self.head]
+            self.head = (self.head + 1) % self.max_packets
+        self.count -= count
+
+
+class RingDelayLine:
+    """
+    FifoDelayLine replacement that holds packets in a PacketRing.
+
+    put()/put_batch() copy the packet bytes and routing into the ring and
+    drop the packet object. The injector calls get_batch() for the slots that
+    are due, sends them with send(), which also frees them. Packets that do
+    not fit into the ring are rejected (put_batch() returns how many fit).
+
+    Parameters
+    ----------
+    capacity_bytes : int
+        Slab size of the ring.
+    max_packets : int
+        Most packets held at once.
+    route : callable
+        packet -> (outbound, (if_idx, sub_if_idx)); usually the backend's
+        packet_route().
+    """
+
+    def __init__(self, capacity_bytes=DEFAULT_POOL_BYTES, max_packets=DEFAULT_POOL_PACKETS, route=None):
+        self.ring = PacketRing(capacity_bytes, max_packets)
+        self._route = route
+        self._cond = threading.Condition()
+        self._closed = False
+        # Slots handed to the injector but not sent yet; their bytes must stay put
+        self._pending = 0
+        self.rejected = 0
+        self.lateness = Histogram()
+
+    def __len__(self):
+        return len(self.ring) - self._pending
+
+    def put(self, release, packet):
+        return self.put_batch([(release, packet)])
+
+    def put_batch(self, items):
+        """Copy (release, packet) pairs into the ring. Returns the number accepted."""
+        route = self._route
+        with self._cond:
+            ring = self.ring
+            was_empty = len(ring) == self._pending
+            accepted = 0
+            for release, packet in items:
+                outbound, interface = route(packet)
+                if ring.push(release, packet.raw, outbound, interface):
+                    accepted += 1
+            self.rejected += len(items) - accepted
+            if was_empty and accepted:
+                self._cond.notify()
+            return accepted
+
+    def get_batch(self, max_packets=64):
+        """
+        Block until the oldest packet is due; return the due slots (at most
+        max_packets), or None once closed and empty. Pass them to send().
+        """
+        ring = self.ring
+        with self._cond:
+            while True:
+                if len(ring) == self._pending:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                first = ring.slot(self._pending)
+                release = ring.release[first]
+                delay = release - clock()
+                if delay <= SPIN_SECONDS:
+                    break
+                self._cond.wait(delay - SPIN_SECONDS)
+        wait_until(release)
+        now = clock()
+        slots = []
+        lateness = []
+        with self._cond:
+            available = len(ring) - self._pending
+            index = self._pending
+            while len(slots) < max_packets and index - self._pending < available:
+                slot = ring.slot(index)
+                if ring.release[slot] > now:
+                    break
+                slots.append(slot)
+                lateness.append(now - ring.release[slot])
+                index += 1
+            self._pending += len(slots)
+        self.lateness.add_many(lateness)
+        return slots
+
+    def send(self, backend, slots):
+        """Send the slots from get_batch() with backend.send_raw() and free them. Returns bytes sent."""
+        ring = self.ring
+        sent = 0
+        try:
+            for slot in slots:
+                raw = ring.packet(slot)
+                backend.send_raw(raw, ring.outbound[slot], (ring.if_idx[slot], ring.sub_if_idx[slot]))
+                sent += len(raw)
+        finally:
+            with self._cond:
+                ring.discard(len(slots))
+                self._pending -= len(slots)
+        return sent
+
+    def close(self, drain=True):
+        """Let get_batch() return None once empty. drain=False discards held packets."""
+        with self._cond:
+            self._closed = True
+            if not drain:
+                self.ring.truncate(self._pending)
+            self._cond.notify_all()
@@ -0,0 +1,233 @@
+"""Per-class shaping policies behind a single capture handle.
+
+The WinDivert filter decides which packets the shaper sees; the classifier
+decides what happens to each of them. It reads the protocol and ports
+straight from the raw IPv4/IPv6 header (struct.unpack_from on a memoryview,
+so nothing is copied) and looks the class up in a table compiled once from
+the class definitions, keyed on protocol and port. Each class has its own
+rate, latency and loss, so RDP, HTTP and everything else can be shaped
+differently by one process.
+
+Class definitions use the form ``NAME:MATCHES:POLICY``::
+
+    rdp:tcp/3389,udp/3389:rate=2M,latency=30
+    web:tcp/80,tcp/443,tcp/8000-8100:rate=500K,loss=1
+    default::rate=100K,queue=200
+
+MATCHES is a comma-separated list of ``PORT``, ``PROTO/PORT`` or
+``PROTO/LOW-HIGH`` (PROTO is tcp or udp; a bare port matches both). A packet
+matches when its source or destination port does; the first listed class
+wins. The class named "default" (no matches) takes all other packets;
+without one they pass unchanged.
+
+POLICY keys: ``rate`` (bytes per second, K/M/G suffixes), ``latency`` (ms),
+``loss`` (percent) and ``queue`` (ms of backlog allowed at the class rate
+before packets are dropped, default 100).
+"""
+
+import random
+import struct
+
+from pacing import TokenBucket, parse_rate
+from stages import Stage
+
+PROTOCOLS = {"tcp": 6, "udp": 17}
+
+DEFAULT_CLASS = "default"
+
+# Backlog a rate-limited class may build up before it drops, in ms
+DEFAULT_CLASS_QUEUE_MS = 100
+
+_PORTS = struct.Struct("!HH")
+
+
+def parse_header(raw):
+    """
+    Return (protocol, src_port, dst_port) read from a raw IP packet.
+
+    Ports are 0 for protocols other than TCP/UDP, for non-first fragments and
+    for truncated packets. IPv6 extension headers are not followed.
+    """
+    data = memoryview(raw)
+    if len(data) < 20:
+        return 0, 0, 0
+    version = data[0] >> 4
+    if version == 4:
+        protocol = data[9]
+        offset = (data[0] & 0x0F) * 4
+        if (data[6] & 0x1F) or data[7]:  # fragment offset: no transport header here
+            return protocol, 0, 0
+    elif version == 6:
+        protocol = data[6]
+        offset = 40
+    else:
+        return 0, 0, 0
+    if (protocol == 6 or protocol == 17) and len(data) >= offset + 4:
+        src_port, dst_port = _PORTS.unpack_from(data, offset)
+        return protocol, src_port, dst_port
+    return protocol, 0, 0
+
+
+class TrafficClass:
+    """
+    One traffic class and its shaping policy.
+
+    Parameters
+    ----------
+    name : str
+        Label used in statistics.
+    matches : list of (protocol, low, high)
+        Port ranges; protocol is 6, 17 or None for both.
+    rate : int, optional
+        Rate limit in bytes per second.
+    latency_ms : float
+        Added delay.
+    loss : float
+        Drop percentage.
+    queue_ms : float
+        Backlog allowed at the class rate before packets are dropped.
+
+    The policy is also kept in the units the stage works in: ``delay`` and
+    ``max_backlog`` in seconds, ``drop_probability`` as a fraction.
+    """
+
+    def __init__(self, name, matches=(), rate=None, latency_ms=0.0, loss=0.0,
+                 queue_ms=DEFAULT_CLASS_QUEUE_MS):
+        self.name = name
+        self.matches = list(matches)
+        self.rate = rate
+        self.latency_ms = latency_ms
+        self.loss = loss
+        self.queue_ms = queue_ms
+        self.bucket = TokenBucket(rate) if rate is not None else None
+        self.delay = latency_ms / 1000.0
+        self.drop_probability = loss / 100.0
+        self.max_backlog = queue_ms / 1000.0
+
+        self.packets = 0
+        self.bytes = 0
+        self.lost = 0
+        self.overflow = 0
+
+    def describe(self):
+        policy = []
+        if self.rate is not None:
+            policy.append(f"rate {self.rate} B/s")
+        if self.latency_ms:
+            policy.append(f"latency {self.latency_ms} ms")
+        if self.loss:
+            policy.append(f"loss {self.loss}%")
+        return f"{self.name} ({', '.join(policy) or 'pass'})"
+
+
+def parse_class(text):
+    """Parse a ``NAME:MATCHES:POLICY`` definition into a TrafficClass."""
+    parts = text.split(":")
+    if len(parts) not in (2, 3) or not parts[0]:
+        raise ValueError(f"Expected NAME:MATCHES[:POLICY], got '{text}'.")
+    name, matches_text = parts[0], parts[1]
+    policy_text = parts[2] if len(parts) == 3 else ""
+
+    matches = []
+    for item in filter(None, matches_text.split(",")):
+        protocol_name, _, ports = item.rpartition("/")
+        if protocol_name and protocol_name not in PROTOCOLS:
+            raise ValueError(f"Unknown protocol '{protocol_name}' in '{item}'.")
+        low, _, high = ports.partition("-")
+        low, high = int(low), int(high or low)
+        if not 0 <= low <= high <= 65535:
+            raise ValueError(f"Invalid port range '{ports}'.")
+        matches.append((PROTOCOLS.get(protocol_name), low, high))
+    if not matches and name != DEFAULT_CLASS:
+        raise ValueError(f"Class '{name}' matches nothing; only '{DEFAULT_CLASS}' may omit MATCHES.")
+
+    options = {}
+    converters = {"rate": ("rate", parse_rate), "latency": ("latency_ms", float),
+                  "loss": ("loss", float), "queue": ("queue_ms", float)}
+    for item in filter(None, policy_text.split(",")):
+        key, _, value = item.partition("=")
+        if key not in converters:
+            raise ValueError(f"Unknown policy key '{key}' (expected {', '.join(converters)}).")
+        field, convert = converters[key]
+        options[field] = convert(value)
+    return TrafficClass(name, matches, **options)
+
+
+class ClassifierStage(Stage):
+    """
+    Applies a per-class rate, latency and loss policy.
+
+    Rate limiting is done per class with its own token bucket: a packet is
+    released at its class departure time, and dropped when that is more than
+    the class's queue budget in the future (a tail drop of the class queue).
+    Put this stage after the engine's RateLimitStage, if any.
+
+    Parameters
+    ----------
+    classes : list of TrafficClass
+        Classes in priority order; one may be named "default".
+    seed : int, optional
+        Seed for the loss decisions.
+    """
+
+    # Classes have different delays, so packets can overtake each other
+    preserves_order = False
+
+    def __init__(self, classes, seed=None):
+        self.classes = [cls for cls in classes if cls.name != DEFAULT_CLASS]
+        self.default = next((cls for cls in classes if cls.name == DEFAULT_CLASS),
+                            TrafficClass(DEFAULT_CLASS))
+        self._random = random.Random(seed).random
+        self._table = self._compile(self.classes)
+
+    @staticmethod
+    def _compile(classes):
+        """Map protocol << 16 | port to (class index, class); earlier classes take precedence."""
+        table = {}
+        for index, cls in enumerate(classes):
+            for protocol, low, high in cls.matches:
+                for number in ((protocol,) if protocol is not None else PROTOCOLS.values()):
+                    for port in range(low, high + 1):
+                        table.setdefault(number << 16 | port, (index, cls))
+        return table
+
+    def classify(self, raw):
+        protocol, src_port, dst_port = parse_header(raw)
+        table = self._table
+        key = protocol << 16
+        by_destination = table.get(key | dst_port)
+        by_source = table.get(key | src_port)
+        # Both ports may match different classes: the one listed first wins, whichever port matched it
+        if by_destination is None:
+            match = by_source
+        elif by_source is None or by_destination[0] <= by_source[0]:
+            match = by_destination
+        else:
+            match = by_source
+        return match[1] if match is not None else self.default
+
+    def process(self, packet, release):
+        cls = self.classify(packet.raw)
+        size = len(packet.raw)
+        cls.packets += 1
+        cls.bytes += size
+        if cls.drop_probability and self._random() < cls.drop_probability:
+            cls.lost += 1
+            return None
+        bucket = cls.bucket
+        if bucket is not None:
+            departure = bucket.reserve(size, release)
+            if departure - release > cls.max_backlog:
+                bucket.cancel()
+                cls.overflow += 1
+                return None
+            release = departure
+        return release + cls.delay
+
+    def describe(self):
+        return "classify " + " | ".join(cls.describe() for cls in self.classes + [self.default])
+
+    def stats_line(self):
+        return "classes: " + "; ".join(
+            f"{cls.name} {cls.packets} pkts / {cls.bytes} B, lost {cls.lost}, overflow {cls.overflow}"
+            for cls in self.classes + [self.default])
@@ -1,9 +1,11 @@
 import random
-import pydivert
 import argparse
 import signal
 import sys
 
+from packet_backend import BackendClosed, open_backend
+from telemetry import LiveStats
+
 # Constants
 DEFAULT_DROP_PERCENTAGE = 2
 DEFAULT_PORT = 3389
@@ -16,6 +18,27 @@ def create_filter(port):
         f")"
     )
 
+class DropCounters:
+    """Packet counters, written by the main loop and read by the statistics sampler."""
+
+    def __init__(self):
+        self.received = 0
+        self.received_bytes = 0
+        self.dropped = 0
+        self.dropped_bytes = 0
+
+    def snapshot(self):
+        return {
+            "counters": {
+                "packets_received": self.received,
+                "bytes_received": self.received_bytes,
+                "packets_sent": self.received - self.dropped,
+                "bytes_sent": self.received_bytes - self.dropped_bytes,
+                "packets_dropped": self.dropped,
+                "bytes_dropped": self.dropped_bytes,
+            },
+        }
+
 def signal_handler(sig, frame):
     print("\nStopping packet interception. Exiting...")
     sys.exit(0)
@@ -28,6 +51,15 @@ def parse_arguments():
                         help=f"Drop percentage (0-100, default: {DEFAULT_DROP_PERCENTAGE})")
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="Enable verbose output")
+    parser.add_argument("-b", "--backend", choices=("windivert", "memory"), default="windivert",
+                        help="Packet backend: WinDivert, or an in-process generator for testing "
+                             "(default: windivert)")
+    parser.add_argument("--stats-port", type=int, default=None,
+                        help="Serve live statistics on http://127.0.0.1:PORT/stats (JSON) and /metrics")
+    parser.add_argument("--stats-csv", type=str, default=None,
+                        help="Append live statistics to this CSV file")
+    parser.add_argument("--stats-sample", type=float, default=1.0,
+                        help="Seconds between statistics samples (default: 1)")
     return parser.parse_args()
 
 def main():
@@ -39,18 +71,27 @@ def main():
     print("Press Ctrl+C to stop.\n")
 
     signal.signal(signal.SIGINT, signal_handler)
+    counters = DropCounters()
 
     try:
-        with pydivert.WinDivert(filter_string, priority=10) as w:
+        with open_backend(args.backend, filter_string, priority=10) as w, \
+                LiveStats(counters.snapshot, args.stats_sample, args.stats_port, args.stats_csv):
             while True:
                 packet = w.recv()
+                size = len(packet.raw)
+                counters.received += 1
+                counters.received_bytes += size
                 if random.random() < (args.drop / 100.0):
+                    counters.dropped += 1
+                    counters.dropped_bytes += size
                     if args.verbose:
                         print(f"Dropped packet: {packet.src_addr}:{packet.src_port} -> "
-                              f"{packet.dst_addr}:{packet.dst_port} (len={len(packet.raw)})")
+                              f"{packet.dst_addr}:{packet.dst_port} (len={size})")
                 else:
                     w.send(packet)
-    except pydivert.WinDivertException as e:
+    except BackendClosed:
+        print("Packet source exhausted. Exiting...")
+    except OSError as e:
         print(f"Error: {e}")
         print("Make sure you're running this script with administrator privileges.")
         sys.exit(1)
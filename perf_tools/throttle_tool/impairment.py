@@ -0,0 +1,198 @@
+"""netem-style impairment stage for the shaping engine.
+
+One stage applies, in this order: loss (i.i.d. or Gilbert-Elliott bursty
+loss), corruption, delay with jitter, reordering and duplication. Every random
+decision comes from generators seeded from a single seed, so a run with the
+same seed and the same packet sequence makes the same decisions.
+"""
+
+import random
+
+from stages import Stage
+
+JITTER_DISTRIBUTIONS = ("uniform", "normal", "pareto")
+
+# Shape of the Pareto distribution used for heavy-tailed jitter
+PARETO_ALPHA = 3.0
+
+
+class GilbertElliott:
+    """
+    Two-state Markov loss model (as in netem's "gemodel").
+
+    Parameters
+    ----------
+    p : float
+        Probability of moving from the good to the bad state, per packet.
+    r : float
+        Probability of moving from the bad to the good state, per packet.
+    loss_bad : float
+        Loss probability while in the bad state.
+    loss_good : float
+        Loss probability while in the good state.
+    rng : random.Random
+        Random source.
+    """
+
+    def __init__(self, p, r, loss_bad=1.0, loss_good=0.0, rng=None):
+        self.p = p
+        self.r = r
+        self.loss_bad = loss_bad
+        self.loss_good = loss_good
+        self.bad = False
+        self._random = (rng or random.Random()).random
+
+    def lose(self):
+        """Advance the chain by one packet and return True if the packet is lost."""
+        if self.bad:
+            if self._random() < self.r:
+                self.bad = False
+        elif self._random() < self.p:
+            self.bad = True
+        return self._random() < (self.loss_bad if self.bad else self.loss_good)
+
+    def describe(self):
+        # Stationary loss rate of the chain
+        if self.p + self.r == 0:
+            average = self.loss_good
+        else:
+            bad_share = self.p / (self.p + self.r)
+            average = bad_share * self.loss_bad + (1 - bad_share) * self.loss_good
+        return f"GE loss p={self.p} r={self.r} (~{average * 100:.2f}%)"
+
+
+class ImpairmentStage(Stage):
+    """
+    Applies loss, corruption, jittered delay, reordering and duplication.
+
+    Percentages are 0-100, times are milliseconds.
+
+    Parameters
+    ----------
+    delay_ms : float
+        Base delay.
+    jitter_ms : float
+        Jitter: half-width for "uniform", standard deviation for "normal" and
+        "pareto" (Pareto jitter is zero-mean with a heavy right tail).
+    distribution : str
+        One of JITTER_DISTRIBUTIONS.
+    loss : float
+        Independent loss percentage. Ignored if gilbert_elliott is given.
+    gilbert_elliott : tuple, optional
+        (p, r, loss_bad, loss_good) probabilities (0-1) for bursty loss.
+    duplicate : float
+        Percentage of packets sent twice.
+    corrupt : float
+        Percentage of packets with one random bit flipped. Checksums are not
+        recomputed, so the receiving stack discards them as netem's are.
+    reorder : float
+        Percentage of packets sent without the delay, overtaking those before
+        them (netem semantics; needs a non-zero delay to have any effect).
+    seed : int, optional
+        Seed for all random decisions.
+    """
+
+    def __init__(self, delay_ms=0.0, jitter_ms=0.0, distribution="uniform", loss=0.0,
+                 gilbert_elliott=None, duplicate=0.0, corrupt=0.0, reorder=0.0, seed=None):
+        if distribution not in JITTER_DISTRIBUTIONS:
+            raise ValueError(f"Unknown jitter distribution '{distribution}'.")
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.distribution = distribution
+        self.loss = loss
+        self.duplicate = duplicate
+        self.corrupt = corrupt
+        self.reorder = reorder
+        self.seed = seed
+
+        # Independent generators so enabling one effect does not change the others
+        def rng(name):
+            return random.Random(None if seed is None else f"{seed}-{name}")
+
+        self._loss_random = rng("loss").random
+        self._jitter_rng = rng("jitter")
+        self._reorder_random = rng("reorder").random
+        self._duplicate_random = rng("duplicate").random
+        self._corrupt_rng = rng("corrupt")
+        self.gilbert_elliott = GilbertElliott(*gilbert_elliott, rng=rng("ge")) if gilbert_elliott else None
+
+        self._delay = delay_ms / 1000.0
+        self._jitter = jitter_ms / 1000.0
+        self.preserves_order = not (jitter_ms or reorder)
+        # The engine checks this to enable its slower fan-out path
+        self.may_duplicate = bool(duplicate)
+
+        self.lost = 0
+        self.corrupted = 0
+        self.reordered = 0
+        self.duplicated = 0
+
+    def set_latency(self, delay_ms):
+        self.delay_ms = delay_ms
+        self._delay = delay_ms / 1000.0
+
+    def set_loss(self, loss):
+        self.loss = loss
+
+    def _jittered_delay(self):
+        if not self._jitter:
+            return self._delay
+        rng = self._jitter_rng
+        if self.distribution == "uniform":
+            offset = rng.uniform(-self._jitter, self._jitter)
+        elif self.distribution == "normal":
+            offset = rng.gauss(0.0, self._jitter)
+        else:
+            alpha = PARETO_ALPHA
+            mean = alpha / (alpha - 1)
+            std = (alpha / ((alpha - 1) ** 2 * (alpha - 2))) ** 0.5
+            offset = (rng.paretovariate(alpha) - mean) / std * self._jitter
+        return max(0.0, self._delay + offset)
+
+    def _corrupt(self, packet):
+        raw = bytearray(packet.raw)
+        if raw:
+            bit = self._corrupt_rng.randrange(len(raw) * 8)
+            raw[bit >> 3] ^= 1 << (bit & 7)
+            packet.raw = bytes(raw)
+            self.corrupted += 1
+
+    def process(self, packet, release):
+        if self.gilbert_elliott is not None:
+            if self.gilbert_elliott.lose():
+                self.lost += 1
+                return None
+        elif self.loss and self._loss_random() < self.loss / 100.0:
+            self.lost += 1
+            return None
+
+        if self.corrupt and self._corrupt_rng.random() < self.corrupt / 100.0:
+            self._corrupt(packet)
+
+        if self.reorder and self._reorder_random() < self.reorder / 100.0:
+            self.reordered += 1
+        else:
+            release += self._jittered_delay()
+
+        if self.duplicate and self._duplicate_random() < self.duplicate / 100.0:
+            self.duplicated += 1
+            return [release, release]
+        return release
+
+    def describe(self):
+        parts = []
+        if self.delay_ms or self.jitter_ms:
+            parts.append(f"delay {self.delay_ms} ms"
+                         + (f" +/- {self.jitter_ms} ms {self.distribution}" if self.jitter_ms else ""))
+        if self.gilbert_elliott is not None:
+            parts.append(self.gilbert_elliott.describe())
+        elif self.loss:
+            parts.append(f"loss {self.loss}%")
+        for name in ("corrupt", "reorder", "duplicate"):
+            if getattr(self, name):
+                parts.append(f"{name} {getattr(self, name)}%")
+        return "impair " + ", ".join(parts or ["none"])
+
+    def stats_line(self):
+        return (f"impairment: lost {self.lost}, corrupted {self.corrupted}, "
+                f"reordered {self.reordered}, duplicated {self.duplicated}")
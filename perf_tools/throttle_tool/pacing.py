@@ -0,0 +1,185 @@
+"""Token bucket and precise wait helpers for the shaping engine.
+
+The token bucket does not sleep. It computes, for every packet, the time at
+which the packet may depart, and callers release the packet at that time.
+This spreads a rate limit evenly instead of sending a whole second's budget
+in one burst and then stalling.
+"""
+
+import math
+import os
+import sys
+import time
+
+from packet_backend import clock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from perf_common.timing import enable_high_resolution_timer  # re-exported for shaper.py
+
+MTU = 1500
+
+# Remaining wait below which we busy-wait instead of sleeping. The OS timer is
+# far too coarse for sub-millisecond release times.
+SPIN_SECONDS = 0.002 if sys.platform == "win32" else 0.0005
+
+
+def parse_rate(text):
+    """Parse a byte rate such as 5000, 50K or 2M (K = 1024) into bytes per second."""
+    multipliers = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+    text = text.strip().upper().removesuffix("B/S").removesuffix("B")
+    if text and text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(float(text))
+
+
+def wait_until(deadline):
+    """
+    Sleep until clock() reaches deadline, spinning for the last SPIN_SECONDS.
+
+    The spin yields the GIL on every iteration so the capture thread keeps running.
+    """
+    remaining = deadline - clock()
+    if remaining > SPIN_SECONDS:
+        time.sleep(remaining - SPIN_SECONDS)
+    while clock() < deadline:
+        time.sleep(0)
+
+
+class TokenBucket:
+    """
+    Token bucket that schedules departures.
+
+    Tokens (bytes) accumulate at ``rate`` bytes per second up to ``burst``.
+    A packet departs as soon as the bucket holds enough tokens for it.
+
+    Parameters
+    ----------
+    rate : float
+        Sustained rate in bytes per second.
+    burst : int, optional
+        Bucket depth in bytes, i.e. the largest back-to-back burst. Defaults to
+        10 ms worth of traffic, but never less than one MTU.
+    granularity : float
+        Refill interval in seconds. 0 refills continuously; otherwise tokens
+        are added in steps of rate * granularity and departures are aligned
+        to refill ticks.
+    """
+
+    def __init__(self, rate, burst=None, granularity=0.0):
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else max(MTU, int(self.rate * 0.01))
+        self.granularity = granularity
+        self.tokens = float(self.burst)
+        self._last = None
+        # New rate handed over by set_rate(); applied by the next reserve()
+        self._pending_rate = None
+        self._undo = None
+
+        # Statistics
+        self.packets = 0
+        self.bytes = 0
+        self.first_departure = None
+        self.last_departure = None
+        self.observed_burst = 0.0
+        self._last_bytes = 0
+        self._excess = 0.0
+
+    def _tick(self, t):
+        """Round t down to the refill grid."""
+        if self.granularity:
+            return math.floor(t / self.granularity) * self.granularity
+        return t
+
+    def set_rate(self, rate):
+        """
+        Change the rate from another thread.
+
+        The change takes effect at the next reserve(); tokens accumulated
+        until then are counted at the old rate. A rate of 0 blocks traffic.
+        """
+        self._pending_rate = float(rate)
+
+    def _apply_pending_rate(self, now):
+        rate, self._pending_rate = self._pending_rate, None
+        if self._last is not None and now > self._last:
+            capacity = max(self.burst, MTU)
+            self.tokens = min(capacity, self.tokens + (self._tick(now) - self._tick(self._last)) * self.rate)
+            self._last = now
+        self.rate = rate
+
+    def reserve(self, nbytes, now):
+        """
+        Take nbytes from the bucket and return the packet's departure time.
+
+        ``now`` is the earliest time the packet could leave. Departures are
+        never earlier than the previous one, so reservations are FIFO. While
+        the rate is 0 and the bucket is short of tokens, the departure time is
+        math.inf and the bucket is left untouched.
+        """
+        if self._pending_rate is not None:
+            self._apply_pending_rate(now)
+        if self._last is None:
+            self._last = now
+        self._undo = (self.tokens, self._last, self.packets, self.bytes, self.first_departure,
+                      self.last_departure, self._last_bytes, self._excess, self.observed_burst)
+        start = max(now, self._last)
+        capacity = max(self.burst, nbytes)
+        tokens = min(capacity, self.tokens + (self._tick(start) - self._tick(self._last)) * self.rate)
+
+        if tokens >= nbytes:
+            departure = start
+            tokens -= nbytes
+        elif self.rate <= 0:
+            return math.inf
+        else:
+            departure = self._tick(start) + (nbytes - tokens) / self.rate
+            if self.granularity:
+                departure = math.ceil(departure / self.granularity - 1e-9) * self.granularity
+            departure = max(departure, start)
+            tokens = min(capacity, tokens + (self._tick(departure) - self._tick(start)) * self.rate) - nbytes
+            tokens = max(tokens, 0.0)
+
+        self.tokens = tokens
+        self._last = departure
+        self._account(nbytes, departure)
+        return departure
+
+    def cancel(self):
+        """Undo the most recent reserve(), e.g. to re-plan a packet after a rate change."""
+        if self._undo is not None:
+            (self.tokens, self._last, self.packets, self.bytes, self.first_departure,
+             self.last_departure, self._last_bytes, self._excess, self.observed_burst) = self._undo
+            self._undo = None
+
+    def _account(self, nbytes, departure):
+        if self.first_departure is None:
+            self.first_departure = departure
+        else:
+            # Bytes sent in excess of the fluid rate line over any interval ending
+            # now; its maximum is the sigma of the observed sigma/rho curve.
+            drained = self.rate * (departure - self.last_departure)
+            self._excess = max(0.0, self._excess - drained)
+        self._excess += nbytes
+        if self._excess > self.observed_burst:
+            self.observed_burst = self._excess
+        self.packets += 1
+        self.bytes += nbytes
+        self.last_departure = departure
+        self._last_bytes = nbytes
+
+    def achieved_rate(self):
+        """Average departure rate in bytes per second, or None if too few packets."""
+        if self.first_departure is None or self.last_departure <= self.first_departure:
+            return None
+        # Count the bytes sent before the last departure over the span they took
+        return (self.bytes - self._last_bytes) / (self.last_departure - self.first_departure)
+
+    def stats(self):
+        return {
+            "target_rate": self.rate,
+            "achieved_rate": self.achieved_rate(),
+            "burst": self.burst,
+            "observed_burst": self.observed_burst,
+            "packets": self.packets,
+            "bytes": self.bytes,
+        }
@@ -0,0 +1,332 @@
+"""Packet I/O backends for the throttle tools.
+
+The shaping scripts only need three things from the network: receive the next
+diverted packet, send (re-inject) a packet, and optionally do both in batches.
+This module hides where the packets come from so the same shaping code can run
+against WinDivert on Windows or against an in-process packet generator on any
+platform (e.g. Linux build agents, where we benchmark throughput and jitter).
+
+Backends
+--------
+WinDivertBackend
+    Wraps ``pydivert.WinDivert``. Requires Windows and administrator rights.
+MemoryBackend
+    Generates synthetic IPv4 TCP/UDP packets at a configurable rate and records
+    every packet that is sent back, together with the time it left.
+"""
+
+import random
+import struct
+import threading
+import time
+from collections import deque
+
+# High resolution clock used for all packet timestamps.
+clock = time.perf_counter
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+
+class BackendClosed(Exception):
+    """Raised by recv() when the backend has no more packets to deliver."""
+
+
+class PacketBackend:
+    """
+    Base class for packet sources/sinks.
+
+    Subclasses implement open(), close(), recv() and send(). The batch
+    variants default to looping over the single-packet calls.
+    """
+
+    def open(self):
+        return self
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def recv(self):
+        """Block until a packet is available and return it."""
+        raise NotImplementedError
+
+    def send(self, packet):
+        """Re-inject a packet previously returned by recv()."""
+        raise NotImplementedError
+
+    def recv_batch(self, max_packets=64):
+        """
+        Return a list of at least one and at most max_packets packets.
+
+        The default implementation blocks for one packet only.
+        """
+        return [self.recv()]
+
+    def send_batch(self, packets):
+        """Re-inject a list of packets in order."""
+        for packet in packets:
+            self.send(packet)
+
+    def packet_route(self, packet):
+        """
+        Return (outbound, (if_idx, sub_if_idx)) for a packet from recv().
+
+        Together with the packet bytes this is all send_raw() needs, so
+        buffers can keep packets without the packet objects.
+        """
+        return packet.is_outbound, getattr(packet, "interface", (0, 0))
+
+    def send_raw(self, raw, outbound, interface):
+        """Re-inject packet bytes (any buffer) with the routing from packet_route()."""
+        raise NotImplementedError
+
+
+class WinDivertBackend(PacketBackend):
+    """
+    Packet backend backed by a pydivert.WinDivert handle.
+
+    Parameters
+    ----------
+    filter_string : str
+        WinDivert filter expression.
+    priority : int
+        WinDivert handle priority.
+    """
+
+    def __init__(self, filter_string, priority=10):
+        self.filter_string = filter_string
+        self.priority = priority
+        self._handle = None
+
+    def open(self):
+        # Imported lazily so the rest of the tool works where pydivert is missing.
+        import pydivert
+
+        self._handle = pydivert.WinDivert(self.filter_string, priority=self.priority)
+        self._handle.open()
+        return self
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def recv(self):
+        return self._handle.recv()
+
+    def send(self, packet):
+        # Packets go out as they are, like send_raw(): recomputing checksums would make corrupted ones valid
+        self._handle.send(packet, recalculate_checksum=False)
+
+    def send_raw(self, raw, outbound, interface):
+        import pydivert
+
+        direction = pydivert.Direction.OUTBOUND if outbound else pydivert.Direction.INBOUND
+        # pydivert.Packet needs its own writable buffer; this is the only copy made
+        packet = pydivert.Packet(memoryview(bytearray(raw)), interface, direction)
+        self._handle.send(packet, recalculate_checksum=False)
+
+
+class SyntheticPacket:
+    """
+    Minimal stand-in for pydivert.Packet.
+
+    Exposes the attributes the throttle tools read (raw, addresses, ports,
+    direction) plus ``created``, the clock() time at which it was generated.
+    """
+
+    __slots__ = ("raw", "src_addr", "dst_addr", "src_port", "dst_port",
+                 "protocol", "is_outbound", "created")
+
+    def __init__(self, raw, src_addr, dst_addr, src_port, dst_port, protocol,
+                 is_outbound, created):
+        self.raw = raw
+        self.src_addr = src_addr
+        self.dst_addr = dst_addr
+        self.src_port = src_port
+        self.dst_port = dst_port
+        self.protocol = protocol
+        self.is_outbound = is_outbound
+        self.created = created
+
+    @property
+    def is_inbound(self):
+        return not self.is_outbound
+
+
+def _ip_to_bytes(addr):
+    return bytes(int(part) for part in addr.split("."))
+
+
+def build_ipv4_packet(src_addr, dst_addr, src_port, dst_port, protocol, length):
+    """
+    Build a well-formed IPv4 TCP or UDP packet of the given total length.
+
+    Checksums are left at zero; the payload is zero-filled.
+    """
+    transport_len = 20 if protocol == IPPROTO_TCP else 8
+    length = max(length, 20 + transport_len)
+    ip_header = struct.pack(
+        "!BBHHHBBH4s4s",
+        0x45, 0, length, 0, 0, 64, protocol, 0,
+        _ip_to_bytes(src_addr), _ip_to_bytes(dst_addr),
+    )
+    if protocol == IPPROTO_TCP:
+        transport = struct.pack("!HHIIBBHHH", src_port, dst_port, 0, 0, 0x50, 0x18, 65535, 0, 0)
+    else:
+        transport = struct.pack("!HHHH", src_port, dst_port, length - 20, 0)
+    return ip_header + transport + bytes(length - 20 - transport_len)
+
+
+# Default synthetic traffic: one RDP session over TCP and UDP, both directions.
+DEFAULT_FLOWS = (
+    ("10.0.0.2", "10.0.0.1", 50000, 3389, IPPROTO_TCP, True),
+    ("10.0.0.1", "10.0.0.2", 3389, 50000, IPPROTO_TCP, False),
+    ("10.0.0.2", "10.0.0.1", 50001, 3389, IPPROTO_UDP, True),
+    ("10.0.0.1", "10.0.0.2", 3389, 50001, IPPROTO_UDP, False),
+)
+
+
+class MemoryBackend(PacketBackend):
+    """
+    In-process packet generator and sink.
+
+    recv() hands out synthetic packets, optionally paced to packets_per_second
+    on an absolute schedule. send() records each packet with its departure time
+    so throughput and added delay can be measured afterwards.
+
+    Parameters
+    ----------
+    packets_per_second : float, optional
+        Generation rate. If None, packets are produced as fast as recv() is called.
+    count : int, optional
+        Total number of packets to generate. recv() raises BackendClosed after that.
+    sizes : sequence of int or sequence of (int, float)
+        Packet sizes in bytes, or (size, weight) pairs for a weighted mix.
+    flows : sequence of tuple
+        (src_addr, dst_addr, src_port, dst_port, protocol, is_outbound) tuples
+        chosen round-robin for successive packets.
+    seed : int, optional
+        Seed for the size mix, so runs are reproducible.
+    record : bool
+        Keep (send_time, packet) pairs in ``sent``. Disable for long benchmarks.
+    """
+
+    def __init__(self, packets_per_second=None, count=None, sizes=(1200,),
+                 flows=DEFAULT_FLOWS, seed=None, record=True):
+        self.packets_per_second = packets_per_second
+        self.count = count
+        self.flows = flows
+        self.record = record
+        self.sent = deque()
+        self.sent_packets = 0
+        self.sent_bytes = 0
+        self.generated = 0
+        self._rng = random.Random(seed)
+        if sizes and isinstance(sizes[0], (tuple, list)):
+            self._sizes = [size for size, _ in sizes]
+            self._weights = [weight for _, weight in sizes]
+        else:
+            self._sizes = list(sizes)
+            self._weights = None
+        # Cache one template per (flow, size) so generation stays cheap.
+        self._templates = {}
+        self._start = None
+        self._closed = threading.Event()
+
+    def open(self):
+        self._start = clock()
+        self._closed.clear()
+        return self
+
+    def close(self):
+        self._closed.set()
+
+    def _next_size(self):
+        if len(self._sizes) == 1:
+            return self._sizes[0]
+        return self._rng.choices(self._sizes, self._weights)[0]
+
+    def _make_packet(self, now):
+        flow = self.flows[self.generated % len(self.flows)]
+        size = self._next_size()
+        key = (flow, size)
+        raw = self._templates.get(key)
+        if raw is None:
+            raw = build_ipv4_packet(flow[0], flow[1], flow[2], flow[3], flow[4], size)
+            self._templates[key] = raw
+        self.generated += 1
+        return SyntheticPacket(raw, flow[0], flow[1], flow[2], flow[3], flow[4], flow[5], now)
+
+    def recv(self):
+        if self._closed.is_set() or (self.count is not None and self.generated >= self.count):
+            raise BackendClosed()
+        if self._start is None:
+            self.open()
+        if self.packets_per_second:
+            due = self._start + self.generated / self.packets_per_second
+            delay = due - clock()
+            if delay > 0:
+                # Sleeping on the event lets close() interrupt a slow generator.
+                if self._closed.wait(delay):
+                    raise BackendClosed()
+        return self._make_packet(clock())
+
+    def recv_batch(self, max_packets=64):
+        if self.packets_per_second:
+            # Block for the first packet, then add those whose schedule has already passed
+            batch = [self.recv()]
+            now = batch[0].created
+            due = self._start + self.generated / self.packets_per_second
+            while (len(batch) < max_packets and due <= now
+                   and (self.count is None or self.generated < self.count)):
+                batch.append(self._make_packet(now))
+                due = self._start + self.generated / self.packets_per_second
+            return batch
+        if self._closed.is_set() or (self.count is not None and self.generated >= self.count):
+            raise BackendClosed()
+        if self._start is None:
+            self.open()
+        if self.count is not None:
+            max_packets = min(max_packets, self.count - self.generated)
+        now = clock()
+        return [self._make_packet(now) for _ in range(max_packets)]
+
+    def send(self, packet):
+        self.sent_packets += 1
+        self.sent_bytes += len(packet.raw)
+        if self.record:
+            self.sent.append((clock(), packet))
+
+    def send_batch(self, packets):
+        now = clock()
+        self.sent_packets += len(packets)
+        self.sent_bytes += sum(len(packet.raw) for packet in packets)
+        if self.record:
+            self.sent.extend((now, packet) for packet in packets)
+
+    def send_raw(self, raw, outbound, interface):
+        # Raw sends are recorded as (time, bytes): there is no packet object any more
+        self.sent_packets += 1
+        self.sent_bytes += len(raw)
+        if self.record:
+            self.sent.append((clock(), bytes(raw)))
+
+
+def open_backend(name, filter_string="true", priority=10, **kwargs):
+    """
+    Create a backend by name ("windivert" or "memory").
+
+    Extra keyword arguments are passed to MemoryBackend.
+    """
+    if name == "windivert":
+        return WinDivertBackend(filter_string, priority=priority)
+    if name == "memory":
+        return MemoryBackend(**kwargs)
+    raise ValueError(f"Unknown packet backend '{name}'.")
@@ -0,0 +1,391 @@
+"""Bounded packet queue between the capture thread and the pacer.
+
+The queue is the bottleneck buffer of the emulated link: it is limited in both
+bytes and packets, and packets arriving at a full queue are tail-dropped by
+our policy rather than silently lost in the WinDivert driver queue.
+"""
+
+import threading
+from collections import deque
+
+
+class PacketQueue:
+    """
+    Thread-safe FIFO of (arrival_time, packet, size) entries.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Byte limit of the queue. None means unlimited.
+    max_packets : int, optional
+        Packet limit of the queue. None means unlimited.
+    """
+
+    def __init__(self, max_bytes=None, max_packets=None):
+        self.max_bytes = max_bytes
+        self.max_packets = max_packets
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.bytes = 0
+        self.enqueued = 0
+        self.tail_drops = 0
+        self.tail_drop_bytes = 0
+        self.max_depth_packets = 0
+        self.max_depth_bytes = 0
+        self.delay_count = 0
+        self.delay_total = 0.0
+        self.delay_max = 0.0
+
+    def __len__(self):
+        return len(self._items)
+
+    def _put_locked(self, packet, size, arrival):
+        if ((self.max_bytes is not None and self.bytes + size > self.max_bytes)
+                or (self.max_packets is not None and len(self._items) >= self.max_packets)):
+            self.tail_drops += 1
+            self.tail_drop_bytes += size
+            return False
+        self._items.append((arrival, packet, size))
+        self.bytes += size
+        self.enqueued += 1
+        if self.bytes > self.max_depth_bytes:
+            self.max_depth_bytes = self.bytes
+        if len(self._items) > self.max_depth_packets:
+            self.max_depth_packets = len(self._items)
+        return True
+
+    def _pop_locked(self):
+        entry = self._items.popleft()
+        self.bytes -= entry[2]
+        return entry
+
+    def put(self, packet, size, arrival):
+        """Append a packet. Returns False if it was tail-dropped."""
+        with self._cond:
+            if not self._put_locked(packet, size, arrival):
+                return False
+            if len(self) == 1:
+                self._cond.notify()
+            return True
+
+    def put_batch(self, entries):
+        """
+        Append (arrival, packet, size) entries under one lock acquisition.
+
+        Returns the number of packets accepted; the rest were tail-dropped.
+        """
+        with self._cond:
+            was_empty = not len(self)
+            put = self._put_locked
+            accepted = 0
+            for arrival, packet, size in entries:
+                if put(packet, size, arrival):
+                    accepted += 1
+            if was_empty and accepted:
+                self._cond.notify()
+            return accepted
+
+    def get(self):
+        """Block for the next entry. Returns None once closed and empty."""
+        with self._cond:
+            while not len(self):
+                if self._closed:
+                    return None
+                self._cond.wait()
+            return self._pop_locked()
+
+    def get_batch(self, max_packets=64, max_bytes=None):
+        """
+        Block for the next entry and return it with up to max_packets - 1 more.
+
+        max_bytes caps the batch size in bytes (the first entry is always
+        returned) so a rate-limited consumer does not pull more out of the
+        queue than it can send soon. Returns None once closed and empty.
+        """
+        with self._cond:
+            while not len(self):
+                if self._closed:
+                    return None
+                self._cond.wait()
+            pop = self._pop_locked
+            entry = pop()
+            batch = [entry]
+            budget = (max_bytes if max_bytes is not None else float("inf")) - entry[2]
+            while len(batch) < max_packets and len(self):
+                size = self._peek_size()
+                if size > budget:
+                    break
+                budget -= size
+                batch.append(pop())
+            return batch
+
+    def _peek_size(self):
+        return self._items[0][2]
+
+    def record_delay(self, delay):
+        """Record the time a packet spent queued, up to the moment it left the bottleneck."""
+        self.delay_count += 1
+        self.delay_total += delay
+        if delay > self.delay_max:
+            self.delay_max = delay
+
+    def record_delays(self, delays):
+        """record_delay() for a whole batch of queueing delays."""
+        if delays:
+            self.delay_count += len(delays)
+            self.delay_total += sum(delays)
+            longest = max(delays)
+            if longest > self.delay_max:
+                self.delay_max = longest
+
+    def close(self, drain=True):
+        """Wake the consumer; get() returns None once empty. drain=False discards queued packets."""
+        with self._cond:
+            self._closed = True
+            if not drain:
+                self._items.clear()
+                self.bytes = 0
+            self._cond.notify_all()
+
+    def stats(self):
+        return {
+            "depth_packets": len(self._items),
+            "depth_bytes": self.bytes,
+            "max_depth_packets": self.max_depth_packets,
+            "max_depth_bytes": self.max_depth_bytes,
+            "enqueued": self.enqueued,
+            "tail_drops": self.tail_drops,
+            "tail_drop_bytes": self.tail_drop_bytes,
+            "avg_delay": self.delay_total / self.delay_count if self.delay_count else 0.0,
+            "max_delay": self.delay_max,
+        }
+
+
+# Bytes a weight-1 flow may send per deficit round robin round
+DRR_QUANTUM = 1514
+
+# Idle flows are forgotten (their counters folded into FairQueue.other) once
+# this many new flows were added since the last time
+MAX_IDLE_FLOWS = 4096
+
+
+def flow_key(packet):
+    """5-tuple identifying the packet's flow."""
+    return (packet.protocol, packet.src_addr, packet.src_port, packet.dst_addr, packet.dst_port)
+
+
+class Flow:
+    """Per-flow queue and counters of a FairQueue."""
+
+    __slots__ = ("key", "weight", "quantum", "items", "bytes", "deficit", "active",
+                 "packets_in", "bytes_in", "packets_out", "bytes_out", "drops", "drop_bytes")
+
+    def __init__(self, key, weight):
+        self.key = key
+        self.weight = weight
+        self.quantum = DRR_QUANTUM * weight
+        self.items = deque()
+        self.bytes = 0
+        self.deficit = 0
+        self.active = False
+        self.packets_in = 0
+        self.bytes_in = 0
+        self.packets_out = 0
+        self.bytes_out = 0
+        self.drops = 0
+        self.drop_bytes = 0
+
+    def absorb(self, flow):
+        """Add the counters of another flow to this one."""
+        self.packets_in += flow.packets_in
+        self.bytes_in += flow.bytes_in
+        self.packets_out += flow.packets_out
+        self.bytes_out += flow.bytes_out
+        self.drops += flow.drops
+        self.drop_bytes += flow.drop_bytes
+
+    def describe(self):
+        protocol, src_addr, src_port, dst_addr, dst_port = self.key
+        if isinstance(protocol, tuple):  # pydivert reports (ipproto, offset)
+            protocol = protocol[0]
+        name = {6: "tcp", 17: "udp"}.get(protocol, str(protocol))
+        return f"{name} {src_addr}:{src_port} -> {dst_addr}:{dst_port}"
+
+
+class FairQueue(PacketQueue):
+    """
+    Per-flow queues served by deficit round robin.
+
+    Drop-in replacement for PacketQueue. Each 5-tuple gets its own FIFO; the
+    pacer takes packets from the active flows in turn, each flow sending up to
+    DRR_QUANTUM * weight bytes per round. When the shared limit is reached, the
+    flow holding the most bytes loses a packet, so a bulk transfer cannot push
+    an interactive flow out of the buffer.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Byte limit shared by all flows.
+    max_packets : int, optional
+        Packet limit shared by all flows.
+    weights : dict, optional
+        Port number -> weight (at least 1). A flow whose source or destination
+        port is listed gets that weight; other flows get weight 1.
+
+    Idle flows are forgotten after MAX_IDLE_FLOWS new ones; their counters
+    are added to ``other`` and counted in ``other_flows``.
+    """
+
+    def __init__(self, max_bytes=None, max_packets=None, weights=None):
+        super().__init__(max_bytes, max_packets)
+        self.weights = dict(weights or {})
+        for port, weight in self.weights.items():
+            if weight < 1:
+                raise ValueError(f"Weight of port {port} must be at least 1, got {weight}.")
+        self.flows = {}
+        self.other = Flow(None, 1)
+        self.other_flows = 0
+        self._prune_at = MAX_IDLE_FLOWS
+        self._active = deque()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _weight(self, packet):
+        weights = self.weights
+        if not weights:
+            return 1
+        weight = weights.get(packet.src_port)
+        if weight is None:
+            weight = weights.get(packet.dst_port)
+        return weight if weight is not None else 1
+
+    def _prune(self):
+        """Forget idle flows, keeping their counters in ``other``."""
+        active = {}
+        for key, flow in self.flows.items():
+            if flow.active:
+                active[key] = flow
+            else:
+                self.other.absorb(flow)
+                self.other_flows += 1
+        self.flows = active
+        # Scan again only after as many new flows, so many active flows do not make every insert O(n)
+        self._prune_at = len(active) + MAX_IDLE_FLOWS
+
+    def _flow(self, packet):
+        key = flow_key(packet)
+        flow = self.flows.get(key)
+        if flow is None:
+            if len(self.flows) >= self._prune_at:
+                self._prune()
+            flow = self.flows[key] = Flow(key, self._weight(packet))
+        return flow
+
+    def _drop_from_fattest(self, flow, size):
+        """Make room for a packet of flow; returns False if the arriving packet is dropped instead."""
+        fattest = max((f for f in self.flows.values() if f.active), key=lambda f: f.bytes, default=None)
+        if fattest is None or fattest is flow or fattest.bytes <= flow.bytes + size:
+            return False
+        _, _, dropped_size = fattest.items.pop()
+        fattest.bytes -= dropped_size
+        fattest.drops += 1
+        fattest.drop_bytes += dropped_size
+        self.bytes -= dropped_size
+        self._count -= 1
+        self.tail_drops += 1
+        self.tail_drop_bytes += dropped_size
+        if not fattest.items:
+            fattest.active = False
+            fattest.deficit = 0
+            self._active.remove(fattest)
+        return True
+
+    def _full(self, size):
+        return ((self.max_bytes is not None and self.bytes + size > self.max_bytes)
+                or (self.max_packets is not None and self._count >= self.max_packets))
+
+    def _put_locked(self, packet, size, arrival):
+        flow = self._flow(packet)
+        flow.packets_in += 1
+        flow.bytes_in += size
+        while self._full(size):
+            if not self._drop_from_fattest(flow, size):
+                flow.drops += 1
+                flow.drop_bytes += size
+                self.tail_drops += 1
+                self.tail_drop_bytes += size
+                return False
+
+        flow.items.append((arrival, packet, size))
+        flow.bytes += size
+        self.bytes += size
+        self._count += 1
+        self.enqueued += 1
+        if self.bytes > self.max_depth_bytes:
+            self.max_depth_bytes = self.bytes
+        if self._count > self.max_depth_packets:
+            self.max_depth_packets = self._count
+        if not flow.active:
+            flow.active = True
+            flow.deficit = flow.quantum
+            self._active.append(flow)
+        return True
+
+    def _next_flow(self):
+        """The active flow whose head packet is served next under DRR."""
+        active = self._active
+        while True:
+            flow = active[0]
+            if flow.items[0][2] <= flow.deficit:
+                return flow
+            # Out of credit for this round: top up and go to the back
+            flow.deficit += flow.quantum
+            active.rotate(-1)
+
+    def _peek_size(self):
+        return self._next_flow().items[0][2]
+
+    def _pop_locked(self):
+        flow = self._next_flow()
+        entry = flow.items.popleft()
+        size = entry[2]
+        flow.deficit -= size
+        flow.bytes -= size
+        flow.packets_out += 1
+        flow.bytes_out += size
+        self.bytes -= size
+        self._count -= 1
+        if not flow.items:
+            flow.active = False
+            flow.deficit = 0
+            self._active.popleft()
+        return entry
+
+    def close(self, drain=True):
+        with self._cond:
+            self._closed = True
+            if not drain:
+                for flow in self._active:
+                    flow.items.clear()
+                    flow.bytes = 0
+                    flow.active = False
+                self._active.clear()
+                self._count = 0
+                self.bytes = 0
+            self._cond.notify_all()
+
+    def stats(self):
+        stats = super().stats()
+        stats["flows"] = len(self.flows)
+        stats["active_flows"] = len(self._active)
+        stats["other_flows"] = self.other_flows
+        return stats
+
+    def top_flows(self, count=10):
+        """The flows with the most bytes sent, as (description, Flow) pairs."""
+        flows = sorted(self.flows.values(), key=lambda f: f.bytes_out, reverse=True)
+        return [(flow.describe(), flow) for flow in flows[:count]]
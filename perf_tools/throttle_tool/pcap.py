@@ -0,0 +1,182 @@
+"""pcap recording and reading for the shaping tools.
+
+PcapWriter records packets from the packet threads without slowing them
+down: write() only appends a copy of the bytes and a timestamp to a queue,
+and a background thread encodes and writes them in large buffered chunks.
+Files use the nanosecond pcap format with LINKTYPE_RAW (packets start at the
+IP header, as WinDivert delivers them) and open in Wireshark/tcpdump.
+
+read_pcap() reads such files back, as well as ordinary Ethernet or Linux
+"cooked" captures, for offline replay (see replay.py).
+"""
+
+import struct
+import threading
+import time
+from collections import deque
+
+from packet_backend import clock
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+MAGIC_MICROSECONDS = 0xA1B2C3D4
+MAGIC_NANOSECONDS = 0xA1B23C4D
+
+# Link-layer header bytes to skip before the IP header
+_LINK_HEADER = {LINKTYPE_RAW: 0, LINKTYPE_IPV4: 0, LINKTYPE_IPV6: 0,
+                LINKTYPE_ETHERNET: 14, LINKTYPE_LINUX_SLL: 16}
+_IP_ETHERTYPES = (0x0800, 0x86DD)
+
+_GLOBAL_HEADER = struct.Struct("<IHHiIII")
+_RECORD_HEADER = struct.Struct("<IIII")
+
+DEFAULT_SNAPLEN = 65535
+
+# Packets waiting for the writer thread before new ones are dropped
+MAX_PENDING = 200000
+
+
+def _global_header(snaplen):
+    return _GLOBAL_HEADER.pack(MAGIC_NANOSECONDS, 2, 4, 0, 0, snaplen, LINKTYPE_RAW)
+
+
+def _encode(items, offset, snaplen):
+    """pcap records for (timestamp, raw) pairs, as one bytes object."""
+    pack = _RECORD_HEADER.pack
+    chunks = []
+    for timestamp, raw in items:
+        nanoseconds = int((timestamp + offset) * 1e9)
+        seconds, fraction = divmod(nanoseconds, 1000000000)
+        chunks.append(pack(seconds, fraction, min(len(raw), snaplen), len(raw)))
+        chunks.append(raw[:snaplen])
+    return b"".join(chunks)
+
+
+def write_pcap(path, packets, snaplen=DEFAULT_SNAPLEN):
+    """Write (unix_timestamp, raw) pairs to a pcap file directly, without a writer thread."""
+    with open(path, "wb", buffering=1024 * 1024) as file:
+        file.write(_global_header(snaplen))
+        for start in range(0, len(packets), 4096):
+            file.write(_encode(packets[start:start + 4096], 0.0, snaplen))
+
+
+class PcapWriter:
+    """
+    Buffered background pcap writer.
+
+    Parameters
+    ----------
+    path : str
+        Output file (overwritten).
+    clock_offset : float, optional
+        Added to timestamps to get Unix time. By default timestamps are
+        clock() values and the offset is taken when the writer is created;
+        pass 0 for timestamps that already are Unix time.
+    snaplen : int
+        Packets are truncated to this many bytes.
+    flush_interval : float
+        Seconds between writes to disk.
+    """
+
+    def __init__(self, path, clock_offset=None, snaplen=DEFAULT_SNAPLEN, flush_interval=0.5):
+        self.path = path
+        self.clock_offset = time.time() - clock() if clock_offset is None else clock_offset
+        self.snaplen = snaplen
+        self.flush_interval = flush_interval
+        self.packets = 0
+        self.dropped = 0
+        self._pending = deque()
+        self._stop = threading.Event()
+        self._file = open(path, "wb", buffering=1024 * 1024)
+        self._file.write(_global_header(snaplen))
+        self._thread = threading.Thread(target=self._run, name="pcap-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, timestamp, raw):
+        """Queue one packet (bytes are copied)."""
+        if len(self._pending) >= MAX_PENDING:
+            self.dropped += 1
+            return
+        self._pending.append((timestamp, bytes(raw)))
+
+    def write_batch(self, timestamp, raws):
+        """Queue packets sharing one timestamp."""
+        if len(self._pending) >= MAX_PENDING:
+            self.dropped += len(raws)
+            return
+        self._pending.extend([(timestamp, bytes(raw)) for raw in raws])
+
+    def _drain(self):
+        pending = self._pending
+        # deque.popleft is atomic, so the packet threads can keep appending
+        items = [pending.popleft() for _ in range(len(pending))]
+        if items:
+            self._file.write(_encode(items, self.clock_offset, self.snaplen))
+            self.packets += len(items)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._drain()
+            self._file.flush()
+
+    def close(self):
+        """Write everything still queued and close the file."""
+        if self._file is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._drain()
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_pcap(path):
+    """
+    Yield (timestamp, raw) for every IP packet in a pcap file.
+
+    timestamp is Unix time in seconds; raw starts at the IP header. Packets
+    that are not IPv4/IPv6 are skipped.
+    """
+    with open(path, "rb") as file:
+        header = file.read(_GLOBAL_HEADER.size)
+        if len(header) < _GLOBAL_HEADER.size:
+            raise ValueError(f"'{path}' is not a pcap file.")
+        for order in "<>":
+            magic = struct.unpack(order + "I", header[:4])[0]
+            if magic in (MAGIC_MICROSECONDS, MAGIC_NANOSECONDS):
+                break
+        else:
+            raise ValueError(f"'{path}' is not a pcap file (pcapng is not supported).")
+        linktype = struct.unpack(order + "I", header[20:24])[0] & 0x0FFFFFFF
+        if linktype not in _LINK_HEADER:
+            raise ValueError(f"Unsupported link type {linktype} in '{path}'.")
+        skip = _LINK_HEADER[linktype]
+        scale = 1e-9 if magic == MAGIC_NANOSECONDS else 1e-6
+        record = struct.Struct(order + "IIII")
+
+        while True:
+            data = file.read(record.size)
+            if len(data) < record.size:
+                return
+            seconds, fraction, included, _ = record.unpack(data)
+            raw = file.read(included)
+            if len(raw) < included:
+                return  # truncated last record
+            if skip:
+                ethertype = struct.unpack_from("!H", raw, skip - 2)[0] if len(raw) >= skip else 0
+                if ethertype not in _IP_ETHERTYPES:
+                    continue
+                raw = raw[skip:]
+            elif not raw or raw[0] >> 4 not in (4, 6):
+                continue
+            yield seconds + fraction * scale, raw
@@ -0,0 +1,195 @@
+"""Time-varying shaping profiles for the shaping engine.
+
+A profile is a list of steps, each changing the rate, latency and/or loss at
+an offset from the start of the run. Steps are applied live by a background
+thread, so conditions change without restarting the shaper (and without
+dropping the RDP session).
+
+Two input formats are supported:
+
+Schedule CSV
+    Header ``time_ms,rate,latency_ms,loss``; empty cells leave a value
+    unchanged. Rates accept suffixes (50K, 2M). The last row marks the end of
+    the cycle when the profile is looped. Example, a 3 s bandwidth collapse::
+
+        time_ms,rate,latency_ms,loss
+        0,2M,30,
+        10000,16K,120,
+        13000,2M,30,
+        20000,,,
+
+Bandwidth trace
+    The speed-test CSVs written by the bandwidth tools: rows of
+    ``timestamp,upload,download`` with no header, e.g.
+    perf_tools/speed-test-05-02-25.csv. One column is replayed as the rate.
+    Values are read as KB/s, as written by bandwidth_tool.py and the tk GUI;
+    logs of the PyQt5 GUI are in MB/s and need unit="MB".
+"""
+
+import csv
+import threading
+from datetime import datetime
+
+from packet_backend import clock
+from pacing import parse_rate, wait_until
+
+TRACE_UNITS = {"KB": 1024, "MB": 1024 * 1024}
+
+# Assumed length of the last trace sample, which has no successor
+TRACE_SAMPLE_SECONDS = 1.0
+
+
+class ProfileStep:
+    """One change of conditions; None fields are left unchanged."""
+
+    __slots__ = ("offset", "rate", "latency_ms", "loss")
+
+    def __init__(self, offset, rate=None, latency_ms=None, loss=None):
+        self.offset = offset
+        self.rate = rate
+        self.latency_ms = latency_ms
+        self.loss = loss
+
+
+class Profile:
+    """
+    Ordered profile steps.
+
+    Parameters
+    ----------
+    steps : list of ProfileStep
+        Steps sorted by offset (seconds).
+    duration : float
+        Length of one cycle in seconds, used when looping.
+    """
+
+    def __init__(self, steps, duration):
+        self.steps = sorted(steps, key=lambda step: step.offset)
+        self.duration = duration
+
+    def first(self, field):
+        """The first value of field set by any step, or None."""
+        return next((getattr(step, field) for step in self.steps
+                     if getattr(step, field) is not None), None)
+
+
+def _cell(row, name, convert):
+    value = (row.get(name) or "").strip()
+    return convert(value) if value else None
+
+
+def load_schedule(path):
+    """Read a schedule CSV (time_ms,rate,latency_ms,loss) into a Profile."""
+    steps = []
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            steps.append(ProfileStep(
+                offset=float(row["time_ms"]) / 1000.0,
+                rate=_cell(row, "rate", parse_rate),
+                latency_ms=_cell(row, "latency_ms", float),
+                loss=_cell(row, "loss", float),
+            ))
+    if not steps:
+        raise ValueError(f"Schedule '{path}' has no rows.")
+    return Profile(steps, steps[-1].offset)
+
+
+def load_trace(path, column="download", unit="KB", floor=0):
+    """
+    Read a bandwidth trace CSV (timestamp,upload,download) into a Profile.
+
+    Parameters
+    ----------
+    path : str
+        CSV file as written by the bandwidth tools.
+    column : str
+        "upload" or "download".
+    unit : str
+        Unit of the trace values per second, "KB" (bandwidth_tool.py, tk GUI)
+        or "MB" (PyQt5 GUI).
+    floor : int
+        Minimum rate in bytes per second. Idle samples (0.0) otherwise become
+        a complete blackout.
+    """
+    index = {"upload": 1, "download": 2}[column]
+    scale = TRACE_UNITS[unit]
+    steps = []
+    start = None
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.reader(file):
+            if len(row) <= index:
+                continue
+            try:
+                stamp = datetime.strptime(row[0].strip(), "%Y-%m-%d %H:%M:%S").timestamp()
+                value = float(row[index])
+            except ValueError:
+                continue  # header or malformed line
+            if start is None:
+                start = stamp
+            steps.append(ProfileStep(offset=stamp - start, rate=max(floor, int(value * scale))))
+    if not steps:
+        raise ValueError(f"Trace '{path}' has no usable rows.")
+    return Profile(steps, steps[-1].offset + TRACE_SAMPLE_SECONDS)
+
+
+class ProfilePlayer:
+    """
+    Applies a Profile to running stages from a background thread.
+
+    Parameters
+    ----------
+    profile : Profile
+        Steps to apply.
+    stages : list of Stage
+        The engine's stages. Rates go to stages with set_rate(), latency to
+        set_latency() and loss to set_loss().
+    loop : bool
+        Start over after profile.duration.
+    verbose : bool
+        Print each applied step.
+    """
+
+    def __init__(self, profile, stages, loop=False, verbose=False):
+        self.profile = profile
+        self.stages = list(stages)
+        self.loop = loop
+        self.verbose = verbose
+        self._stop = threading.Event()
+        self._thread = None
+
+    def apply(self, step):
+        for stage in self.stages:
+            if step.rate is not None and hasattr(stage, "set_rate"):
+                stage.set_rate(step.rate)
+            if step.latency_ms is not None and hasattr(stage, "set_latency"):
+                stage.set_latency(step.latency_ms)
+            if step.loss is not None and hasattr(stage, "set_loss"):
+                stage.set_loss(step.loss)
+        changes = [f"{name}={getattr(step, name)}" for name in ("rate", "latency_ms", "loss")
+                   if getattr(step, name) is not None]
+        if self.verbose and changes:
+            print(f"[profile] t={step.offset:.3f}s {' '.join(changes)}")
+
+    def _run(self):
+        start = clock()
+        while True:
+            for step in self.profile.steps:
+                due = start + step.offset
+                # Coarse wait on the event (so stop() is prompt), then spin to the millisecond
+                if self._stop.wait(max(0.0, due - clock() - 0.002)):
+                    return
+                wait_until(due)
+                self.apply(step)
+            if not self.loop or self.profile.duration <= 0:
+                return
+            start += self.profile.duration
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,835 @@
+"""Packet shaping engine for the throttle tools.
+
+All shaping runs behind a single capture handle, so stacking effects no longer
+means diverting and re-injecting every packet once per script:
+
+    recv -> stages -> bounded queue -> rate limit -> stages -> delay line -> send
+
+Each stage looks at a packet and the earliest time it may leave, and returns
+a (possibly later) release time, or None to drop the packet. Packets whose
+release time lies in the future wait in the delay line until an injector
+thread sends them.
+
+Example
+-------
+    python shaper.py --rate 50K --latency 50 --drop 2
+"""
+
+import argparse
+import heapq
+import sys
+import threading
+from collections import deque
+
+from buffer_pool import RingDelayLine
+from classifier import ClassifierStage, parse_class
+from impairment import JITTER_DISTRIBUTIONS, ImpairmentStage
+from pacing import SPIN_SECONDS, enable_high_resolution_timer, parse_rate, wait_until
+from packet_backend import BackendClosed, clock, open_backend
+from packet_queue import FairQueue, PacketQueue
+from pcap import PcapWriter
+from profiles import TRACE_UNITS, ProfilePlayer, load_schedule, load_trace
+from replay import replay_file
+from stages import LatencyStage, LossStage, RateLimitStage
+from telemetry import Histogram, LiveStats
+
+DEFAULT_PORT = 3389
+DEFAULT_PRIORITY = 10
+
+# Capture filter used when traffic classes choose the policy
+CLASSIFIED_FILTER = "ip and (tcp or udp)"
+
+# Packets moved per recv/queue/send call
+DEFAULT_BATCH = 64
+
+
+def rdp_filter(port=DEFAULT_PORT):
+    """WinDivert filter for TCP and UDP traffic on the given port, both directions."""
+    return (
+        f"ip and (tcp or udp) and ("
+        f"  (tcp.SrcPort == {port} or tcp.DstPort == {port}) or "
+        f"  (udp.SrcPort == {port} or udp.DstPort == {port})"
+        f")"
+    )
+
+
+class DelayLine:
+    """
+    Thread-safe holding area for packets that are not due yet.
+
+    put() may be called from the pacer thread while get() blocks in the
+    injector thread. The injector sleeps on a condition variable until the head
+    packet is due, and is woken early only when a new packet becomes the head.
+    How late each packet is released relative to its schedule is kept in
+    ``lateness``.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = 0  # tie-breaker so equal release times keep arrival order
+        self._cond = threading.Condition()
+        self._closed = False
+        self.lateness = Histogram()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def put(self, release, packet):
+        self.put_batch([(release, packet)])
+
+    def put_batch(self, items):
+        """Add (release, packet) pairs with a single lock acquisition. Returns how many were added."""
+        with self._cond:
+            heap = self._heap
+            head = heap[0][0] if heap else None
+            for release, packet in items:
+                heapq.heappush(heap, (release, self._seq, packet))
+                self._seq += 1
+            # Only wake the injector when the head moved forward
+            if head is None or heap[0][0] < head:
+                self._cond.notify()
+        return len(items)
+
+    def get(self):
+        """Block until the head packet is due and return it; None once closed and empty."""
+        packets = self.get_batch(1)
+        return packets[0] if packets else None
+
+    def get_batch(self, max_packets=64):
+        """
+        Block until the head packet is due; return it together with any other
+        packets already due (at most max_packets). None once closed and empty.
+        """
+        heap = self._heap
+        with self._cond:
+            while True:
+                if not heap:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                delay = heap[0][0] - clock()
+                if delay <= SPIN_SECONDS:
+                    release, _, packet = heapq.heappop(heap)
+                    break
+                self._cond.wait(delay - SPIN_SECONDS)
+        # Spin for the last fraction of a millisecond outside the lock
+        wait_until(release)
+        now = clock()
+        releases = [release]
+        packets = [packet]
+        if max_packets > 1 and heap:
+            with self._cond:
+                while heap and len(packets) < max_packets and heap[0][0] <= now:
+                    release, _, packet = heapq.heappop(heap)
+                    releases.append(release)
+                    packets.append(packet)
+        self.lateness.add_many([now - release for release in releases])
+        return packets
+
+    def close(self, drain=True):
+        """Let get() return None once empty. drain=False discards held packets."""
+        with self._cond:
+            self._closed = True
+            if not drain:
+                self._heap.clear()
+            self._cond.notify_all()
+
+
+class FifoDelayLine:
+    """
+    Delay line for pipelines whose release times never go backwards.
+
+    With a constant delay, packets leave in arrival order, so a deque gives
+    O(1) put/get without heap sifting or sequence numbers. Same interface as
+    DelayLine.
+    """
+
+    def __init__(self):
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.lateness = Histogram()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, release, packet):
+        self.put_batch([(release, packet)])
+
+    def put_batch(self, items):
+        """Append (release, packet) pairs with a single lock acquisition. Returns how many were added."""
+        with self._cond:
+            was_empty = not self._items
+            self._items.extend(items)
+            if was_empty:
+                self._cond.notify()
+        return len(items)
+
+    def get(self):
+        """Block until the head packet is due and return it; None once closed and empty."""
+        packets = self.get_batch(1)
+        return packets[0] if packets else None
+
+    def get_batch(self, max_packets=64):
+        """Like DelayLine.get_batch(): the head packet plus others already due."""
+        items = self._items
+        with self._cond:
+            while True:
+                if not items:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                delay = items[0][0] - clock()
+                if delay <= SPIN_SECONDS:
+                    release, packet = items.popleft()
+                    break
+                self._cond.wait(delay - SPIN_SECONDS)
+        wait_until(release)
+        now = clock()
+        releases = [release]
+        packets = [packet]
+        if max_packets > 1 and items:
+            with self._cond:
+                while items and len(packets) < max_packets and items[0][0] <= now:
+                    release, packet = items.popleft()
+                    releases.append(release)
+                    packets.append(packet)
+        self.lateness.add_many([now - release for release in releases])
+        return packets
+
+    def close(self, drain=True):
+        """Let get() return None once empty. drain=False discards held packets."""
+        with self._cond:
+            self._closed = True
+            if not drain:
+                self._items.clear()
+            self._cond.notify_all()
+
+
+class ShapingEngine:
+    """
+    Runs a stage pipeline against a packet backend.
+
+    Three threads keep capture independent of re-injection:
+
+    capture
+        recv_batch() from the backend, timestamp, run the stages placed before
+        the rate limit and append to the bounded PacketQueue (tail drop when
+        full).
+    pacer
+        Take a batch from the queue, wait for each packet's token-bucket
+        departure time, run the remaining stages and send the due packets with
+        one send_batch() or hand them to the delay line.
+    injector
+        Send delay-line packets when they become due, all due packets at once.
+
+    Each thread takes one clock reading and one lock per batch rather than per
+    packet; under light load batches are simply one packet long.
+
+    Parameters
+    ----------
+    backend : packet_backend.PacketBackend
+        Opened packet backend.
+    stages : list of Stage
+        Pipeline stages applied in order. At most one RateLimitStage; it
+        defines the bottleneck the queue sits in front of.
+    max_queue_bytes : int, optional
+        Queue limit in bytes. Defaults to 100 ms of traffic at the configured
+        rate (at least 64 KB), or 4 MB without a rate limit.
+    max_queue_packets : int, optional
+        Queue limit in packets.
+    fair : bool
+        Queue per 5-tuple flow with deficit round robin instead of one FIFO.
+    weights : dict, optional
+        Port -> weight for fair queueing.
+    batch_size : int
+        Most packets handled per backend call or queue operation.
+    pool_bytes : int, optional
+        Hold delayed packets as bytes in a preallocated ring of this size
+        (buffer_pool.RingDelayLine) instead of as packet objects. Only used
+        when the pipeline keeps packets in order.
+    record_before, record_after : pcap.PcapWriter, optional
+        Record packets as captured / as re-injected.
+    """
+
+    def __init__(self, backend, stages, max_queue_bytes=None, max_queue_packets=None,
+                 fair=False, weights=None, batch_size=DEFAULT_BATCH, pool_bytes=None,
+                 record_before=None, record_after=None):
+        self.backend = backend
+        self.record_before = record_before
+        self.record_after = record_after
+        self.batch_size = max(1, batch_size)
+        self.stages = list(stages)
+
+        rate_index = next((i for i, stage in enumerate(self.stages)
+                           if isinstance(stage, RateLimitStage)), None)
+        if rate_index is None:
+            self.ingress, self.rate_stage, self.egress = [], None, self.stages
+        else:
+            self.ingress = self.stages[:rate_index]
+            self.rate_stage = self.stages[rate_index]
+            self.egress = self.stages[rate_index + 1:]
+
+        if any(stage.may_duplicate for stage in self.ingress):
+            raise ValueError("Duplicating stages must come after the rate limit.")
+        self._fanout = any(stage.may_duplicate for stage in self.egress)
+
+        if max_queue_bytes is None:
+            if self.rate_stage is not None:
+                max_queue_bytes = max(64 * 1024, int(self.rate_stage.bytes_per_second * 0.1))
+            else:
+                max_queue_bytes = 4 * 1024 * 1024
+        if fair:
+            self.queue = FairQueue(max_queue_bytes, max_queue_packets, weights)
+        else:
+            self.queue = PacketQueue(max_queue_bytes, max_queue_packets)
+        # The heap is only needed when some stage can reorder release times
+        if not all(stage.preserves_order for stage in self.egress):
+            self.delay_line = DelayLine()
+        elif pool_bytes:
+            self.delay_line = RingDelayLine(pool_bytes, route=backend.packet_route)
+        else:
+            self.delay_line = FifoDelayLine()
+
+        # Each counter is written by one thread only (see telemetry.py)
+        self.received = 0
+        self.received_bytes = 0
+        self.dropped = 0
+        self.sent_direct = 0
+        self.sent_direct_bytes = 0
+        self.sent_delayed = 0
+        self.sent_delayed_bytes = 0
+        self.queue_delay = Histogram()
+        self._threads = []
+        self._stopping = False
+
+    @property
+    def sent(self):
+        return self.sent_direct + self.sent_delayed
+
+    @property
+    def sent_bytes(self):
+        return self.sent_direct_bytes + self.sent_delayed_bytes
+
+    def _capture_loop(self):
+        ingress = self.ingress
+        queue = self.queue
+        recv_batch = self.backend.recv_batch
+        batch_size = self.batch_size
+        try:
+            while True:
+                packets = recv_batch(batch_size)
+                # One timestamp per batch: the packets were all waiting by now
+                now = clock()
+                if self.record_before is not None:
+                    self.record_before.write_batch(now, [packet.raw for packet in packets])
+                entries = [(now, packet, len(packet.raw)) for packet in packets]
+                self.received += len(entries)
+                self.received_bytes += sum([entry[2] for entry in entries])
+
+                if ingress:
+                    kept = []
+                    for entry in entries:
+                        release = now
+                        for stage in ingress:
+                            release = stage.process(entry[1], release)
+                            if release is None:
+                                break
+                        if release is None:
+                            self.dropped += 1
+                        else:
+                            kept.append(entry)
+                    entries = kept
+                if entries:
+                    queue.put_batch(entries)
+        except BackendClosed:
+            pass
+        except OSError as e:
+            if not self._stopping:
+                print(f"[!] Capture thread error: {e}")
+        finally:
+            queue.close(drain=not self._stopping)
+
+    def _flush(self, out, delayed):
+        """Send the packets that are due and hand the rest to the injector."""
+        if out:
+            if self.record_after is not None:
+                self.record_after.write_batch(clock(), [packet.raw for packet in out])
+            try:
+                self.backend.send_batch(out)
+                self.sent_direct += len(out)
+                self.sent_direct_bytes += sum([len(packet.raw) for packet in out])
+            except OSError as e:
+                print(f"[!] Pacer thread error: {e}")
+            out.clear()
+        if delayed:
+            self.dropped += len(delayed) - self.delay_line.put_batch(delayed)
+            delayed.clear()
+
+    def _pacer_loop(self):
+        queue = self.queue
+        rate_stage = self.rate_stage
+        egress = self.egress
+        delay_line = self.delay_line
+        batch_size = self.batch_size
+        # Do not pull more than one burst out of the queue ahead of the bucket
+        max_bytes = rate_stage.bucket.burst if rate_stage is not None else None
+        out = []
+        delayed = []
+        try:
+            while True:
+                batch = queue.get_batch(batch_size, max_bytes)
+                if batch is None:
+                    return
+                now = clock()
+                delays = []
+                for arrival, packet, size in batch:
+                    # Leave the bottleneck at the token-bucket departure time
+                    if rate_stage is not None:
+                        departure = rate_stage.process(packet, now)
+                        if departure > now:
+                            # Send what is already due before waiting for tokens
+                            self._flush(out, delayed)
+                            now = rate_stage.hold(packet, departure)
+                    delays.append(now - arrival)
+
+                    # Without a bottleneck, delays count from the capture timestamp
+                    release = now if rate_stage is not None else arrival
+                    if self._fanout:
+                        self._egress_fanout(packet, release, 0, now, out, delayed)
+                        continue
+                    for stage in egress:
+                        release = stage.process(packet, release)
+                        if release is None:
+                            break
+                    if release is None:
+                        self.dropped += 1
+                    elif release <= now and not delayed and not delay_line:
+                        out.append(packet)
+                    else:
+                        delayed.append((release, packet))
+                queue.record_delays(delays)
+                self.queue_delay.add_many(delays)
+                self._flush(out, delayed)
+        finally:
+            delay_line.close(drain=not self._stopping)
+
+    def _egress_fanout(self, packet, release, start, now, out, delayed):
+        """Slow path for pipelines with a duplicating stage: follow each copy separately."""
+        egress = self.egress
+        for index in range(start, len(egress)):
+            release = egress[index].process(packet, release)
+            if release is None:
+                self.dropped += 1
+                return
+            if release.__class__ is list:
+                for copy_release in release:
+                    self._egress_fanout(packet, copy_release, index + 1, now, out, delayed)
+                return
+        if release <= now and not delayed and not self.delay_line:
+            out.append(packet)
+        else:
+            delayed.append((release, packet))
+
+    def _inject_raw_loop(self):
+        """Injector for a RingDelayLine: packets leave as slab memoryviews."""
+        delay_line = self.delay_line
+        backend = self.backend
+        batch_size = self.batch_size
+        while True:
+            slots = delay_line.get_batch(batch_size)
+            if slots is None:
+                return
+            if self.record_after is not None:
+                ring = delay_line.ring
+                self.record_after.write_batch(clock(), [ring.packet(slot) for slot in slots])
+            try:
+                self.sent_delayed_bytes += delay_line.send(backend, slots)
+                self.sent_delayed += len(slots)
+            except OSError as e:
+                print(f"[!] Injector thread error: {e}")
+
+    def _inject_loop(self):
+        get_batch = self.delay_line.get_batch
+        send_batch = self.backend.send_batch
+        batch_size = self.batch_size
+        while True:
+            packets = get_batch(batch_size)
+            if packets is None:
+                return
+            if self.record_after is not None:
+                self.record_after.write_batch(clock(), [packet.raw for packet in packets])
+            try:
+                send_batch(packets)
+                self.sent_delayed += len(packets)
+                self.sent_delayed_bytes += sum([len(packet.raw) for packet in packets])
+            except OSError as e:
+                print(f"[!] Injector thread error: {e}")
+
+    def start(self):
+        """Start the capture, pacer and injector threads."""
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._pacer_loop, name="pacer", daemon=True),
+            threading.Thread(target=self._inject_raw_loop if isinstance(self.delay_line, RingDelayLine)
+                             else self._inject_loop, name="injector", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def run(self, status_interval=None):
+        """
+        Shape packets until the backend is exhausted.
+
+        Queued packets are drained before returning. With status_interval (in
+        seconds) a one-line status is printed periodically.
+        """
+        self.start()
+        injector = self._threads[-1]
+        next_status = clock() + status_interval if status_interval else None
+        # Join with a timeout so Ctrl+C reaches the main thread
+        while injector.is_alive():
+            injector.join(0.1)
+            if next_status is not None and clock() >= next_status:
+                print(self.status_line())
+                next_status += status_interval
+
+    def stop(self, drain=False):
+        """Stop all threads. With drain=False, queued and delayed packets are discarded."""
+        self._stopping = not drain
+        self.queue.close(drain=drain)
+        if not drain and self.rate_stage is not None:
+            self.rate_stage.interrupt()
+        if not drain:
+            self.delay_line.close(drain=False)
+        for thread in self._threads:
+            # The capture thread may be blocked in recv() until the backend closes
+            if thread.name != "capture":
+                thread.join()
+
+    def status_line(self):
+        q = self.queue.stats()
+        return (f"in {self.received} out {self.sent} dropped {self.dropped} | "
+                f"queue {q['depth_packets']} pkts / {q['depth_bytes']} B, "
+                f"tail drops {q['tail_drops']}, delay avg {q['avg_delay'] * 1000:.1f} ms "
+                f"max {q['max_delay'] * 1000:.1f} ms | delay line {len(self.delay_line)}, "
+                f"release error {self.delay_line.lateness.summary_ms()}")
+
+    def snapshot(self):
+        """Counters, gauges and histograms for telemetry.StatsSampler."""
+        q = self.queue.stats()
+        counters = {
+            "packets_received": self.received,
+            "bytes_received": self.received_bytes,
+            "packets_sent": self.sent,
+            "bytes_sent": self.sent_bytes,
+            "packets_dropped": self.dropped,
+            "packets_tail_dropped": q["tail_drops"],
+            "bytes_tail_dropped": q["tail_drop_bytes"],
+        }
+        gauges = {
+            "queue_packets": q["depth_packets"],
+            "queue_bytes": q["depth_bytes"],
+            "delay_line_packets": len(self.delay_line),
+        }
+        if isinstance(self.queue, FairQueue):
+            gauges["active_flows"] = q["active_flows"]
+        if self.rate_stage is not None:
+            bucket = self.rate_stage.bucket
+            gauges["target_rate_bytes"] = bucket.rate
+            gauges["achieved_rate_bytes"] = bucket.achieved_rate()
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": {"queue_delay": self.queue_delay, "release_error": self.delay_line.lateness},
+        }
+
+    def summary(self):
+        q = self.queue.stats()
+        lines = [
+            f"received {self.received}, sent {self.sent}, dropped {self.dropped}, "
+            f"tail-dropped {q['tail_drops']} ({q['tail_drop_bytes']} B)",
+            f"queue: limit {self.queue.max_bytes} B, max depth {q['max_depth_packets']} pkts / "
+            f"{q['max_depth_bytes']} B, queueing delay avg {q['avg_delay'] * 1000:.2f} ms, "
+            f"max {q['max_delay'] * 1000:.2f} ms",
+        ]
+        if isinstance(self.queue, FairQueue):
+            lines.append(f"flows: {len(self.queue.flows)} tracked, top by bytes sent:")
+            for name, flow in self.queue.top_flows(5):
+                lines.append(f"  {name} (weight {flow.weight}): in {flow.packets_in} pkts, "
+                             f"out {flow.packets_out} pkts / {flow.bytes_out} B, dropped {flow.drops}")
+            if self.queue.other_flows:
+                other = self.queue.other
+                lines.append(f"  {self.queue.other_flows} other flows (idle, no longer tracked): "
+                             f"in {other.packets_in} pkts, out {other.packets_out} pkts / "
+                             f"{other.bytes_out} B, dropped {other.drops}")
+        if isinstance(self.delay_line, RingDelayLine):
+            lines.append(f"buffer pool: {self.delay_line.ring.capacity_bytes} B, "
+                         f"rejected {self.delay_line.rejected} packets")
+        if self.delay_line.lateness.count:
+            lines.append(f"delay line release error: {self.delay_line.lateness.summary_ms()}")
+        for stage in self.stages:
+            if hasattr(stage, "stats_line"):
+                lines.append(stage.stats_line())
+        return "\n".join(lines)
+
+
+def run_shaper(filter_string, stages, priority=DEFAULT_PRIORITY, backend="windivert",
+               max_queue_bytes=None, max_queue_packets=None, status_interval=None,
+               fair=False, weights=None, profile=None, loop=False, batch_size=DEFAULT_BATCH,
+               pool_bytes=None, stats_port=None, stats_csv=None, stats_sample=1.0,
+               record_before=None, record_after=None, **backend_args):
+    """
+    Open a backend, run the pipeline until Ctrl+C and print a summary.
+
+    This is the entry point used by the individual throttle scripts. An
+    optional profiles.Profile is applied live to the stages while running.
+    With stats_port and/or stats_csv, live statistics are sampled every
+    stats_sample seconds and served on localhost / appended to the CSV file.
+    record_before / record_after are pcap paths for the packets as captured
+    and as re-injected.
+    """
+    enable_high_resolution_timer()
+    before = PcapWriter(record_before) if record_before else None
+    after = PcapWriter(record_after) if record_after else None
+    with open_backend(backend, filter_string, priority=priority, **backend_args) as w:
+        engine = ShapingEngine(w, stages, max_queue_bytes, max_queue_packets, fair, weights, batch_size,
+                               pool_bytes, before, after)
+        player = ProfilePlayer(profile, stages, loop=loop, verbose=True) if profile else None
+        live = LiveStats(engine.snapshot, stats_sample, stats_port, stats_csv)
+        try:
+            live.start()
+            if player:
+                player.start()
+            engine.run(status_interval)
+        except KeyboardInterrupt:
+            engine.stop(drain=False)
+        finally:
+            if player:
+                player.stop()
+            live.stop()
+            for writer in (before, after):
+                if writer is not None:
+                    writer.close()
+        print(f"\nStopped. {engine.summary()}")
+        for writer in (before, after):
+            if writer is not None:
+                print(f"pcap: {writer.packets} packets written to {writer.path}"
+                      + (f", {writer.dropped} not recorded (writer behind)" if writer.dropped else ""))
+    return engine
+
+
+def load_profile(args):
+    """Load the --profile schedule or --trace file, if any."""
+    if args.profile:
+        return load_schedule(args.profile)
+    if args.trace:
+        return load_trace(args.trace, column=args.trace_column, unit=args.trace_unit,
+                          floor=args.trace_floor)
+    return None
+
+
+def build_stages(args, profile=None):
+    """
+    Build the stage list from parsed command-line arguments.
+
+    Stages a profile needs (rate, latency, loss) are created from the profile's
+    first values when they were not given on the command line.
+    """
+    def from_profile(field):
+        return profile.first(field) if profile else None
+
+    # "or" maps the 0 defaults to None, so unused stages are left out
+    rate = args.rate or from_profile("rate")
+    latency = args.latency or from_profile("latency_ms")
+    drop = args.drop or from_profile("loss")
+    impaired = (args.jitter or args.ge or args.duplicate or args.corrupt or args.reorder)
+    stages = []
+    if drop is not None and not impaired:
+        stages.append(LossStage(drop, seed=args.seed))
+    if rate is not None:
+        stages.append(RateLimitStage(rate, burst=args.burst, granularity=args.granularity / 1000.0))
+    if impaired:
+        stages.append(ImpairmentStage(
+            delay_ms=latency or 0, jitter_ms=args.jitter, distribution=args.jitter_dist,
+            loss=drop or 0, gilbert_elliott=args.ge, duplicate=args.duplicate,
+            corrupt=args.corrupt, reorder=args.reorder, seed=args.seed,
+        ))
+    elif latency is not None:
+        stages.append(LatencyStage(latency))
+    if args.traffic_class:
+        stages.append(ClassifierStage(args.traffic_class, seed=args.seed))
+    return stages
+
+
+def parse_weight(text):
+    """Parse "PORT=WEIGHT" into a (port, weight) pair; the weight must be at least 1."""
+    try:
+        port, weight = text.split("=")
+        port, weight = int(port), int(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected PORT=WEIGHT, e.g. 3389=8")
+    if weight < 1:
+        raise argparse.ArgumentTypeError(f"weight must be at least 1, got {weight}")
+    return port, weight
+
+
+def parse_class_argument(text):
+    """argparse wrapper around classifier.parse_class()."""
+    try:
+        return parse_class(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_gilbert_elliott(text):
+    """Parse "p,r[,loss_bad[,loss_good]]" percentages into probabilities."""
+    values = [float(value) / 100.0 for value in text.split(",")]
+    if not 2 <= len(values) <= 4:
+        raise argparse.ArgumentTypeError("expected p,r[,loss_bad[,loss_good]]")
+    return tuple(values)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Shape traffic (rate limit, latency, jitter, loss, duplication, corruption, "
+                    "reordering) behind a single WinDivert handle."
+    )
+    parser.add_argument("-f", "--filter", type=str, default=None,
+                        help="WinDivert filter (default: TCP/UDP on --port, or all TCP/UDP with --class)")
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT,
+                        help=f"Port used to build the default filter (default: {DEFAULT_PORT})")
+    parser.add_argument("-r", "--rate", type=parse_rate, default=None,
+                        help="Rate limit in bytes per second, e.g. 50K or 2M")
+    parser.add_argument("--burst", type=parse_rate, default=None,
+                        help="Token bucket depth in bytes (default: 10 ms of traffic, at least one MTU)")
+    parser.add_argument("--granularity", type=float, default=0.0,
+                        help="Token refill interval in milliseconds (default: 0, continuous)")
+    parser.add_argument("--queue-bytes", type=parse_rate, default=None,
+                        help="Bottleneck queue limit in bytes (default: 100 ms of traffic, at least 64K)")
+    parser.add_argument("--queue-packets", type=int, default=None,
+                        help="Bottleneck queue limit in packets (default: unlimited)")
+    parser.add_argument("--fair", action="store_true",
+                        help="Fair-queue flows (per 5-tuple, deficit round robin) at the rate limit")
+    parser.add_argument("--weight", type=parse_weight, action="append", default=[], metavar="PORT=WEIGHT",
+                        help="Fair-queueing weight for flows using PORT (repeatable, default weight 1)")
+    parser.add_argument("--class", dest="traffic_class", type=parse_class_argument, action="append",
+                        default=[], metavar="NAME:MATCHES:POLICY",
+                        help="Traffic class with its own policy, e.g. rdp:tcp/3389,udp/3389:rate=2M,latency=30 "
+                             "or default::rate=100K (repeatable; see classifier.py)")
+    parser.add_argument("-l", "--latency", type=float, default=0,
+                        help="Added latency in milliseconds")
+    parser.add_argument("-d", "--drop", type=float, default=0,
+                        help="Drop percentage (0-100)")
+    parser.add_argument("-j", "--jitter", type=float, default=0,
+                        help="Delay jitter in milliseconds")
+    parser.add_argument("--jitter-dist", choices=JITTER_DISTRIBUTIONS, default="uniform",
+                        help="Jitter distribution (default: uniform)")
+    parser.add_argument("--ge", type=parse_gilbert_elliott, default=None, metavar="P,R[,LB[,LG]]",
+                        help="Gilbert-Elliott bursty loss in percent: good->bad P, bad->good R, "
+                             "loss in bad state LB (default 100), loss in good state LG (default 0). "
+                             "Replaces --drop")
+    parser.add_argument("--duplicate", type=float, default=0,
+                        help="Duplicate percentage (0-100)")
+    parser.add_argument("--corrupt", type=float, default=0,
+                        help="Percentage of packets with a flipped bit (0-100)")
+    parser.add_argument("--reorder", type=float, default=0,
+                        help="Percentage of packets sent without delay, overtaking earlier ones (0-100)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Random seed for reproducible impairments")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="Schedule CSV (time_ms,rate,latency_ms,loss) applied live while shaping")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="Bandwidth trace CSV (timestamp,upload,download) replayed as the rate")
+    parser.add_argument("--trace-column", choices=("upload", "download"), default="download",
+                        help="Trace column to replay (default: download)")
+    parser.add_argument("--trace-unit", choices=tuple(TRACE_UNITS), default="KB",
+                        help="Unit per second of the trace values; MB for logs of the PyQt5 GUI (default: KB)")
+    parser.add_argument("--trace-floor", type=parse_rate, default=0,
+                        help="Minimum replayed rate in bytes per second (default: 0, idle samples block)")
+    parser.add_argument("--loop", action="store_true",
+                        help="Repeat the profile or trace")
+    parser.add_argument("--stats-interval", type=float, default=None,
+                        help="Print a status line every N seconds")
+    parser.add_argument("--stats-port", type=int, default=None,
+                        help="Serve live statistics on http://127.0.0.1:PORT/stats (JSON) and /metrics "
+                             "(Prometheus)")
+    parser.add_argument("--stats-csv", type=str, default=None,
+                        help="Append live statistics to this CSV file (rolled over at 10 MB)")
+    parser.add_argument("--stats-sample", type=float, default=1.0,
+                        help="Seconds between statistics samples (default: 1)")
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH,
+                        help=f"Packets per recv/send batch, 1 disables batching (default: {DEFAULT_BATCH})")
+    parser.add_argument("--pool", type=parse_rate, default=None, metavar="BYTES",
+                        help="Hold delayed packets in a preallocated buffer of this size, e.g. 16M "
+                             "(order-preserving pipelines only; packets that do not fit are dropped)")
+    parser.add_argument("--record-before", type=str, default=None, metavar="PCAP",
+                        help="Record packets as captured, before shaping, to a pcap file")
+    parser.add_argument("--record-after", type=str, default=None, metavar="PCAP",
+                        help="Record packets as re-injected, after shaping, to a pcap file")
+    parser.add_argument("--replay", type=str, default=None, metavar="PCAP",
+                        help="Instead of shaping live traffic, push a recorded pcap through the stages "
+                             "offline and print the result")
+    parser.add_argument("--replay-output", type=str, default=None, metavar="PCAP",
+                        help="With --replay, write the shaped packets to this pcap file")
+    parser.add_argument("--priority", type=int, default=DEFAULT_PRIORITY,
+                        help=f"WinDivert priority (default: {DEFAULT_PRIORITY})")
+    parser.add_argument("-b", "--backend", choices=("windivert", "memory"), default="windivert",
+                        help="Packet backend (default: windivert)")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_arguments()
+    if args.filter:
+        filter_string = args.filter
+    elif args.traffic_class:
+        # The classifier picks the policy, so capture all TCP/UDP traffic
+        filter_string = CLASSIFIED_FILTER
+    else:
+        filter_string = rdp_filter(args.port)
+    try:
+        profile = load_profile(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    stages = build_stages(args, profile)
+
+    if args.replay:
+        print(f"Replaying {args.replay}")
+        print(f"Pipeline: {' -> '.join(stage.describe() for stage in stages) or 'pass-through'}\n")
+        try:
+            result = replay_file(args.replay, stages, args.replay_output, max_queue_bytes=args.queue_bytes)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(result.summary())
+        for stage in stages:
+            if hasattr(stage, "stats_line"):
+                print(stage.stats_line())
+        if args.replay_output:
+            print(f"Shaped packets written to {args.replay_output}")
+        return
+
+    print(f"Starting WinDivert with filter={filter_string}")
+    print(f"Pipeline: {' -> '.join(stage.describe() for stage in stages) or 'pass-through'}")
+    print("Press Ctrl+C to stop.\n")
+
+    try:
+        run_shaper(filter_string, stages, priority=args.priority, backend=args.backend,
+                   max_queue_bytes=args.queue_bytes, max_queue_packets=args.queue_packets,
+                   status_interval=args.stats_interval, fair=args.fair, weights=dict(args.weight),
+                   profile=profile, loop=args.loop, batch_size=args.batch, pool_bytes=args.pool,
+                   stats_port=args.stats_port, stats_csv=args.stats_csv, stats_sample=args.stats_sample,
+                   record_before=args.record_before, record_after=args.record_after)
+    except OSError as e:
+        print(f"Error: {e}")
+        print("Make sure you're running this script with administrator privileges.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
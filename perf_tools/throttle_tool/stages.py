@@ -0,0 +1,139 @@
+"""Pipeline stages for the shaping engine.
+
+A stage sees each packet together with the earliest time it may be released
+and returns a (possibly later) release time, or None to drop the packet.
+"""
+
+import math
+import random
+import threading
+
+from packet_backend import clock
+from pacing import SPIN_SECONDS, TokenBucket, wait_until
+
+
+class Stage:
+    """
+    Base class for pipeline stages.
+
+    ``preserves_order`` tells the engine whether release times leave the stage
+    in the order packets entered it, so a FIFO delay line can be used.
+    Stages with ``may_duplicate`` set may return a list of release times, one
+    per copy of the packet; they must be placed after the rate limit.
+    """
+
+    preserves_order = True
+    may_duplicate = False
+
+    def process(self, packet, release):
+        """
+        Return the time at which the packet may be released, or None to drop it.
+
+        Parameters
+        ----------
+        packet : object
+            Packet as returned by the backend.
+        release : float
+            Earliest release time decided by the previous stages (clock() seconds).
+        """
+        raise NotImplementedError
+
+    def describe(self):
+        return self.__class__.__name__
+
+
+class LossStage(Stage):
+    """Drops packets independently with the given probability (in percent)."""
+
+    def __init__(self, drop_percentage, seed=None):
+        self.drop_percentage = drop_percentage
+        self._probability = drop_percentage / 100.0
+        self._random = random.Random(seed).random
+
+    def process(self, packet, release):
+        if self._random() < self._probability:
+            return None
+        return release
+
+    def set_loss(self, drop_percentage):
+        self.drop_percentage = drop_percentage
+        self._probability = drop_percentage / 100.0
+
+    def describe(self):
+        return f"drop ~{self.drop_percentage}%"
+
+
+class RateLimitStage(Stage):
+    """
+    Caps throughput at bytes_per_second with a token bucket.
+
+    Each packet is released at the departure time computed by the bucket, so
+    traffic leaves evenly paced with bursts of at most ``burst`` bytes.
+    """
+
+    def __init__(self, bytes_per_second, burst=None, granularity=0.0):
+        self.bytes_per_second = bytes_per_second
+        self.bucket = TokenBucket(bytes_per_second, burst=burst, granularity=granularity)
+        self._changed = threading.Event()
+        self._interrupted = False
+
+    def process(self, packet, release):
+        return self.bucket.reserve(len(packet.raw), release)
+
+    def set_rate(self, bytes_per_second):
+        """Change the rate while packets are flowing (called from another thread)."""
+        self.bytes_per_second = bytes_per_second
+        self.bucket.set_rate(bytes_per_second)
+        self._changed.set()
+
+    def hold(self, packet, departure):
+        """
+        Block until the packet's departure time and return the time it left.
+
+        If the rate changes meanwhile, the packet's reservation is re-planned
+        at the new rate, so a blackout (rate 0) ends as soon as the rate rises.
+        """
+        changed = self._changed
+        while not self._interrupted:
+            remaining = departure - clock()
+            if remaining <= SPIN_SECONDS:
+                wait_until(departure)
+                break
+            if changed.wait(None if math.isinf(remaining) else remaining - SPIN_SECONDS):
+                changed.clear()
+                self.bucket.cancel()
+                departure = self.bucket.reserve(len(packet.raw), clock())
+        return clock()
+
+    def interrupt(self):
+        """Release a packet blocked in hold(), e.g. when the engine stops."""
+        self._interrupted = True
+        self._changed.set()
+
+    def describe(self):
+        return f"rate {self.bytes_per_second} B/s (burst {self.bucket.burst} B)"
+
+    def stats_line(self):
+        stats = self.bucket.stats()
+        achieved = stats["achieved_rate"]
+        achieved = f"{achieved:.0f} B/s" if achieved is not None else "n/a"
+        return (f"rate: target {stats['target_rate']:.0f} B/s, achieved {achieved}, "
+                f"burst {stats['burst']} B (observed {stats['observed_burst']:.0f} B)")
+
+
+class LatencyStage(Stage):
+    """Adds a constant delay (in milliseconds) to every packet."""
+
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+        self._delay = latency_ms / 1000.0
+
+    def process(self, packet, release):
+        return release + self._delay
+
+    def set_latency(self, latency_ms):
+        self.latency_ms = latency_ms
+        self._delay = latency_ms / 1000.0
+
+    def describe(self):
+        return f"latency {self.latency_ms} ms"
@@ -0,0 +1,379 @@
+"""Live statistics for the shaping tools.
+
+The packet threads only bump plain integer counters and record into
+fixed-size histograms; everything else happens on a sampler thread:
+
+- ``Histogram``: HDR-style log-linear latency histogram, O(1) record, fixed
+  memory, percentiles within 1/16 (6.25 %) of the true value.
+- ``StatsSampler``: calls a snapshot function every interval, derives
+  per-second rates and keeps the latest sample; optionally appends it to a
+  rolling CSV file.
+- ``StatsServer``: serves the latest sample on localhost as JSON (``/stats``)
+  and Prometheus text (``/metrics``).
+- ``LiveStats``: starts and stops both from a tool's command-line options.
+
+Each counter has a single writer thread, so the GIL makes the increments
+atomic without locks; the sampler only reads.
+
+Example
+-------
+    python shaper.py --rate 2M --stats-port 9100 --stats-csv shaper_stats.csv
+    curl http://127.0.0.1:9100/metrics
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from packet_backend import clock
+
+# Linear sub-buckets per power of two; sets the relative precision (1/16)
+SUB_BUCKETS = 16
+
+# Enough buckets for values up to 2**31 microseconds (about 36 minutes)
+HISTOGRAM_BUCKETS = SUB_BUCKETS * 28
+
+# Percentiles reported for every histogram
+REPORTED_PERCENTILES = (50, 90, 99, 99.9)
+
+METRIC_PREFIX = "shaper_"
+
+
+class Histogram:
+    """
+    Latency histogram in microsecond resolution (values are given in seconds).
+
+    Values below 16 us get exact buckets; above that every power of two is
+    split into SUB_BUCKETS linear buckets, so memory is fixed and the
+    relative error of a percentile is at most 1/SUB_BUCKETS. Larger values
+    than the top bucket are clamped into it.
+    """
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _index(value):
+        micros = int(value * 1e6)
+        if micros < SUB_BUCKETS:
+            return micros if micros > 0 else 0
+        shift = micros.bit_length() - 5  # keep the top 5 bits (16..31)
+        return min(HISTOGRAM_BUCKETS - 1, SUB_BUCKETS * (shift + 1) + (micros >> shift) - SUB_BUCKETS)
+
+    @staticmethod
+    def _upper(index):
+        """Upper edge of a bucket in seconds."""
+        if index < SUB_BUCKETS:
+            return (index + 1) / 1e6
+        shift = index // SUB_BUCKETS - 1
+        return ((SUB_BUCKETS + index % SUB_BUCKETS + 1) << shift) / 1e6
+
+    def add(self, value):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def add_many(self, values):
+        """add() for a batch of values."""
+        counts = self.counts
+        top = HISTOGRAM_BUCKETS - 1
+        # _index() inlined: this runs once per packet on the packet threads
+        for micros in [int(value * 1e6) for value in values]:
+            if micros < SUB_BUCKETS:
+                counts[micros if micros > 0 else 0] += 1
+            else:
+                shift = micros.bit_length() - 5
+                counts[min(top, SUB_BUCKETS * shift + (micros >> shift))] += 1
+        if values:
+            self.count += len(values)
+            self.total += sum(values)
+            longest = max(values)
+            if longest > self.max:
+                self.max = longest
+
+    def percentiles(self, *points):
+        """Return the requested percentiles (0-100) in seconds, or None if empty."""
+        counts = list(self.counts)  # the writer may keep recording meanwhile
+        total = sum(counts)
+        if not total:
+            return None
+        results = []
+        for point in points:
+            target = max(1, point / 100.0 * total)
+            seen = 0
+            for index, count in enumerate(counts):
+                seen += count
+                if seen >= target:
+                    break
+            results.append(min(self._upper(index), self.max))
+        return results
+
+    def summary_ms(self):
+        """One-line p50/p99/max summary in milliseconds."""
+        values = self.percentiles(50, 99)
+        if values is None:
+            return "no samples"
+        p50, p99 = (value * 1000 for value in values)
+        return f"p50 {p50:.3f} ms, p99 {p99:.3f} ms, max {self.max * 1000:.3f} ms ({self.count} packets)"
+
+    def snapshot(self):
+        """Percentiles, mean, max and count as a JSON-friendly dict (seconds)."""
+        values = self.percentiles(*REPORTED_PERCENTILES) or [None] * len(REPORTED_PERCENTILES)
+        summary = {f"p{point:g}": value for point, value in zip(REPORTED_PERCENTILES, values)}
+        summary["mean"] = self.total / self.count if self.count else None
+        summary["max"] = self.max
+        summary["count"] = self.count
+        summary["sum"] = self.total
+        return summary
+
+
+class StatsSampler:
+    """
+    Samples a statistics source from a background thread.
+
+    Parameters
+    ----------
+    source : callable
+        Returns a dict with "counters" (monotonic totals), "gauges" (current
+        values) and "histograms" (name -> Histogram) sections.
+    interval : float
+        Seconds between samples.
+    csv_path : str, optional
+        Append every sample to this CSV file.
+    csv_max_bytes : int
+        Roll the CSV file over to ``<path>.1`` once it grows past this size.
+    csv_backups : int
+        Number of rolled-over files kept (``<path>.1`` .. ``<path>.N``).
+    """
+
+    def __init__(self, source, interval=1.0, csv_path=None, csv_max_bytes=10 * 1024 * 1024,
+                 csv_backups=3):
+        self.source = source
+        self.interval = interval
+        self.csv_path = csv_path
+        self.csv_max_bytes = csv_max_bytes
+        self.csv_backups = csv_backups
+        self.latest = None
+        self._previous = None
+        self._file = None
+        self._writer = None
+        self._columns = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        """Take one sample now, store it as ``latest`` and return it."""
+        now = clock()
+        data = self.source()
+        counters = dict(data.get("counters", {}))
+        # The first sample has no rates yet, but keeps the same columns
+        rates = dict.fromkeys((f"{name}_per_second" for name in counters), None)
+        if self._previous is not None:
+            then, before = self._previous
+            elapsed = now - then
+            if elapsed > 0:
+                rates = {f"{name}_per_second": (value - before.get(name, 0)) / elapsed
+                         for name, value in counters.items()}
+        self._previous = (now, counters)
+        self.latest = {
+            "timestamp": time.time(),
+            "counters": counters,
+            "rates": rates,
+            "gauges": dict(data.get("gauges", {})),
+            "histograms": {name: histogram.snapshot()
+                           for name, histogram in data.get("histograms", {}).items()},
+        }
+        if self.csv_path:
+            self._write_csv(self.latest)
+        return self.latest
+
+    def _flatten(self, sample):
+        row = {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sample["timestamp"]))}
+        for section in ("counters", "rates", "gauges"):
+            row.update(sample[section])
+        for name, summary in sample["histograms"].items():
+            for key in ("p50", "p99", "max"):
+                row[f"{name}_{key}"] = summary[key]
+        return row
+
+    def _open_csv(self, columns):
+        new_file = not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0
+        self._file = open(self.csv_path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction="ignore")
+        if new_file:
+            self._writer.writeheader()
+        self._columns = columns
+
+    def _roll_csv(self):
+        self._file.close()
+        self._file = None
+        for index in range(self.csv_backups - 1, 0, -1):
+            older = f"{self.csv_path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.csv_path}.{index + 1}")
+        if self.csv_backups > 0:
+            os.replace(self.csv_path, f"{self.csv_path}.1")
+        else:
+            os.remove(self.csv_path)
+
+    def _write_csv(self, sample):
+        row = self._flatten(sample)
+        columns = list(row)
+        if self._file is not None and (columns != self._columns
+                                       or self._file.tell() >= self.csv_max_bytes):
+            self._roll_csv()
+        if self._file is None:
+            self._open_csv(columns)
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def _run(self):
+        next_sample = clock()
+        while True:
+            try:
+                self.sample()
+            except OSError as e:
+                print(f"[!] Statistics sampler error: {e}")
+            next_sample += self.interval
+            if self._stop.wait(max(0.0, next_sample - clock())):
+                return
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stats", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling after one final sample, and close the CSV file."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self.sample()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def prometheus_text(sample, prefix=METRIC_PREFIX):
+    """Render a StatsSampler sample in the Prometheus text exposition format."""
+    lines = []
+    for name, value in sample["counters"].items():
+        lines += [f"# TYPE {prefix}{name}_total counter", f"{prefix}{name}_total {value}"]
+    for name, value in sample["gauges"].items():
+        if value is not None:
+            lines += [f"# TYPE {prefix}{name} gauge", f"{prefix}{name} {value}"]
+    for name, summary in sample["histograms"].items():
+        metric = f"{prefix}{name}_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for point in REPORTED_PERCENTILES:
+            value = summary[f"p{point:g}"]
+            if value is not None:
+                lines.append(f'{metric}{{quantile="{point / 100:g}"}} {value}')
+        lines += [f"{metric}_sum {summary['sum']}", f"{metric}_count {summary['count']}"]
+    return "\n".join(lines) + "\n"
+
+
+class _StatsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        sample = self.server.sampler.latest
+        if sample is None:
+            self.send_error(503, "No sample yet")
+            return
+        path = self.path.split("?", 1)[0]
+        if path in ("/", "/stats", "/stats.json"):
+            body = json.dumps(sample, indent=2).encode("utf-8")
+            content_type = "application/json"
+        elif path == "/metrics":
+            body = prometheus_text(sample).encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep the console for the shaper's own output
+
+
+class StatsServer:
+    """
+    Serves a sampler's latest sample over HTTP.
+
+    Parameters
+    ----------
+    sampler : StatsSampler
+        Sampler whose ``latest`` sample is served.
+    port : int
+        TCP port; 0 picks a free one (see ``port`` after start()).
+    host : str
+        Bind address. Keep the default unless the stats must be reachable
+        from other machines.
+    """
+
+    def __init__(self, sampler, port, host="127.0.0.1"):
+        self.sampler = sampler
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _StatsHandler)
+        self._server.daemon_threads = True
+        self._server.sampler = self.sampler
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stats-http", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class LiveStats:
+    """
+    Sampler plus optional HTTP endpoint, as configured by a tool's options.
+
+    Does nothing unless a port or CSV path is given. Usable as a context
+    manager.
+    """
+
+    def __init__(self, source, interval=1.0, port=None, csv_path=None):
+        self.enabled = port is not None or bool(csv_path)
+        self.sampler = StatsSampler(source, interval, csv_path) if self.enabled else None
+        self.server = StatsServer(self.sampler, port) if port is not None else None
+
+    def start(self):
+        if self.sampler is not None:
+            self.sampler.start()
+        if self.server is not None:
+            self.server.start()
+            print(f"Statistics on http://{self.server.host}:{self.server.port}/stats and /metrics")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.stop()
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
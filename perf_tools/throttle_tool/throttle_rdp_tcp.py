@@ -1,5 +1,4 @@
-import time
-import pydivert
+from shaper import RateLimitStage, run_shaper
 
 #---------------------------------------
 # Configure the throttling parameters
@@ -18,35 +17,7 @@ def main():
     print(f"Throttling RDP to {MAX_BYTES_PER_SECOND} bytes per second.")
     print("Press Ctrl+C to stop.\n")
 
-    # Open the WinDivert handle with our filter
-    with pydivert.WinDivert(FILTER, priority=PRIORITY) as w:
-        bytes_this_second = 0
-        second_start = time.time()
-
-        while True:
-            packet = w.recv()
-            packet_len = len(packet.raw)
-
-            now = time.time()
-            elapsed = now - second_start
-
-            # If a second has passed, reset the counter
-            if elapsed >= 1.0:
-                bytes_this_second = 0
-                second_start = now
-
-            # If adding this packet would exceed our limit, wait
-            if bytes_this_second + packet_len > MAX_BYTES_PER_SECOND:
-                sleep_time = 1.0 - elapsed
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
-                # Start a new second after sleeping
-                second_start = time.time()
-                bytes_this_second = 0
-
-            # Re-inject (send) the packet after the delay
-            w.send(packet)
-            bytes_this_second += packet_len
+    run_shaper(FILTER, [RateLimitStage(MAX_BYTES_PER_SECOND)], priority=PRIORITY)
 
 if __name__ == "__main__":
     main()